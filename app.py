@@ -3,17 +3,39 @@
 @app.route('/')
 def index(): returns main homepage with data queried from database
 
+@app.route('/search')
+def search(): returns ranked news matching a full-text query
+
 @app.route('/about')
 def about(): returns about homepage with static information
+
+@app.route('/api/news')
+def api_news(): returns news rows as JSON, newest first
+
+@app.route('/api/news/<date>/<news_id>/wiki')
+def api_wiki(): returns the wiki matches of one news article as JSON
 """
 
+from datetime import datetime
+import gzip
+import re
 import traceback
 import logging.config
 
 from flask import Flask
-from flask import render_template
+from flask import render_template, make_response, request, jsonify
+
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-from src.db import Wiki, News, WikiNewsManager
+from src.cache import ResponseCache
+from src.db import create_pooled_engine, latest_news, current_version, news_rows, wiki_rows, \
+    NEWS_FIELDS, WIKI_FIELDS
+from src.search import get_index
 from config.db_config import ENGINE_STRING
 
 # Initialize the Flask application
@@ -23,11 +45,54 @@ app = Flask(__name__,
 
 # Configure flask app from flask_config.py
 app.config.from_pyfile('config/flask_config.py')
-logging.config.fileConfig(app.config["LOGGING_CONFIG"])
+logging.config.fileConfig(app.config["LOGGING_CONFIG"], disable_existing_loggers=False)
 logger = logging.getLogger(app.config["APP_NAME"])
 
-manager = WikiNewsManager(engine_string=ENGINE_STRING)
-wn_session = manager.session
+# one pool per worker process; each request thread gets its own session
+engine = create_pooled_engine(ENGINE_STRING,
+                              pool_size=app.config["DB_POOL_SIZE"],
+                              max_overflow=app.config["DB_MAX_OVERFLOW"],
+                              pool_pre_ping=app.config["DB_POOL_PRE_PING"],
+                              pool_recycle=app.config["DB_POOL_RECYCLE"])
+wn_session = scoped_session(sessionmaker(bind=engine))
+search_index = get_index(engine)
+
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    """Return the request's connection to the pool"""
+    wn_session.remove()
+
+# rendered pages are reused until the next ingest changes the version stamp;
+# the optional sqlite file lets several gunicorn workers share them
+page_cache = {}
+if app.config["PAGE_CACHE_PATH"]:
+    shared_page_cache = ResponseCache(app.config["PAGE_CACHE_PATH"],
+                                      max_entries=app.config["PAGE_CACHE_SIZE"])
+else:
+    shared_page_cache = None
+
+
+def cached_page(name, version):
+    """Rendered page for an ingest version, or None if not cached"""
+
+    if page_cache.get(name, (None, None))[0] == version:
+        return page_cache[name][1]
+
+    if shared_page_cache is not None:
+        html = shared_page_cache.get(name, {'version': version})
+        if html is not None:
+            page_cache[name] = (version, html)
+            return html
+    return None
+
+
+def cache_page(name, version, html):
+    """Keep a rendered page for an ingest version"""
+
+    page_cache[name] = (version, html)
+    if shared_page_cache is not None:
+        shared_page_cache.set(name, {'version': version}, html)
 
 
 @app.route('/')
@@ -36,7 +101,8 @@ def index():
     and associated wikipedia articles.
 
     Create view into index page that uses data queried from entries database
-    inserts it into the ./templates/index.html template.
+    inserts it into the ./templates/index.html template. The rendered page
+    is cached per ingest version and sent with ETag/Last-Modified headers.
 
     Returns: rendered html template
     """
@@ -46,17 +112,28 @@ def index():
         logger.debug("connecting to non-AWS engine string")
 
     try:
-        date = wn_session.query(News.date).distinct().first()[0]
-        date = date.strftime('%b-%d-%Y')
+        stamp = current_version(wn_session)
+        html = None
+        if stamp is not None:
+            html = cached_page('index', stamp.version)
 
-        wiki_entities = wn_session.query(Wiki).all()
-        news_entities = wn_session.query(News).all()
+        if html is None:
+            date, news_entities = latest_news(wn_session,
+                                              app.config["MAX_NEWS_SHOW"])
+            date = date.strftime('%b-%d-%Y')
+            html = render_template('index.html',
+                                   date=date,
+                                   news_entities=news_entities)
+            if stamp is not None:
+                cache_page('index', stamp.version, html)
 
         logger.debug("Index page accessed")
-        return render_template('index.html',
-                               date=date,
-                               wiki_entities=wiki_entities,
-                               news_entities=news_entities)
+        response = make_response(html)
+        if stamp is not None:
+            response.set_etag(stamp.version)
+            response.last_modified = stamp.updated
+            response.make_conditional(request)
+        return response
 
     # should handle *any* exceptions to avoid front-end errors in deployed app
     except:
@@ -68,12 +145,184 @@ def index():
         return render_template('error.html')
 
 
+@app.route('/search')
+def search():
+    """Full-text search over past headlines and their wiki matches
+
+    Query string arguments are `q`, the words to search for, and `page`.
+
+    Returns: rendered html template
+    """
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    try:
+        results, has_next = [], False
+        if query and search_index is not None:
+            results, has_next = search_index.search(engine, query, page,
+                                                    app.config["SEARCH_PAGE_SIZE"])
+        logger.debug("Search page accessed")
+        return render_template('search.html',
+                               query=query,
+                               results=results,
+                               page=page,
+                               has_next=has_next)
+
+    except:
+        traceback.print_exc()
+        logger.warning("Not able to search wikinews, error page returned")
+        return render_template('error.html')
+
+
 @app.route('/about')
 def about():
     """render about.html"""
     return render_template('about.html')
 
 
+def api_error(message, status=400):
+    """JSON error body"""
+    return jsonify({'error': message}), status
+
+
+def api_fields(allowed):
+    """Columns requested with `fields=a,b`; all allowed columns by default"""
+
+    if not request.args.get('fields'):
+        return allowed
+    fields = request.args['fields'].split(',')
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError("unknown fields: %s" % ', '.join(unknown))
+    return fields
+
+
+# `next` cursors: '%Y-%m-%d.<news_id>' for news, '<id>' for wiki
+NEWS_CURSOR = re.compile(r'^(\d{4}-\d{2}-\d{2})\.(\d+)$')
+WIKI_CURSOR = re.compile(r'^\d+$')
+
+
+def api_cursor(pattern, example):
+    """Match of `after=` against the cursor pattern; None if absent"""
+
+    after = request.args.get('after')
+    if after is None:
+        return None
+    match = pattern.match(after)
+    if match is None:
+        raise ValueError("after must be the 'next' value of a previous page, "
+                         "e.g. %s" % example)
+    return match
+
+
+def api_limit():
+    """Rows per page from `limit=`, capped at API_MAX_LIMIT"""
+
+    limit = request.args.get('limit', app.config["API_PAGE_SIZE"], type=int)
+    return min(max(limit, 1), app.config["API_MAX_LIMIT"])
+
+
+def serialize(rows, fields):
+    """Query rows as JSON-ready dicts; dates as '%b-%d-%Y'"""
+
+    records = []
+    for row in rows:
+        record = {}
+        for field in fields:
+            value = getattr(row, field)
+            record[field] = value.strftime('%b-%d-%Y') if field == 'date' else value
+        records.append(record)
+    return records
+
+
+@app.route('/api/news')
+def api_news():
+    """News articles, newest date first and by news_id within a date
+
+    Query string arguments:
+        fields: comma separated columns of NEWS_FIELDS (default all)
+        limit: rows per page, up to API_MAX_LIMIT
+        date: only news from this date, '%b-%d-%Y'
+        after: `next` from the previous page
+
+    Returns: JSON with `news` rows and the `next` cursor (null on the last page)
+    """
+    try:
+        fields = api_fields(NEWS_FIELDS)
+        date = request.args.get('date')
+        if date is not None:
+            date = datetime.strptime(date, '%b-%d-%Y')
+        after = api_cursor(NEWS_CURSOR, '2021-06-08.3')
+        if after is not None:
+            after = (datetime.strptime(after.group(1), '%Y-%m-%d'), int(after.group(2)))
+    except ValueError as e:
+        return api_error(str(e))
+
+    try:
+        rows, next_key = news_rows(wn_session, fields, after, api_limit(), date)
+    except:
+        wn_session.rollback()
+        traceback.print_exc()
+        return api_error("could not read news", 500)
+
+    if next_key is not None:
+        next_key = '%s.%i' % (next_key[0].strftime('%Y-%m-%d'), next_key[1])
+    return jsonify({'news': serialize(rows, fields), 'next': next_key})
+
+
+@app.route('/api/news/<date>/<int:news_id>/wiki')
+def api_wiki(date, news_id):
+    """Wiki matches of the news article news_id on date ('%b-%d-%Y')
+
+    Query string arguments:
+        fields: comma separated columns of WIKI_FIELDS (default all)
+        limit: rows per page, up to API_MAX_LIMIT
+        after: `next` from the previous page
+
+    Returns: JSON with `wiki` rows and the `next` cursor (null on the last page)
+    """
+    try:
+        fields = api_fields(WIKI_FIELDS)
+        date = datetime.strptime(date, '%b-%d-%Y')
+        after = api_cursor(WIKI_CURSOR, '42')
+        if after is not None:
+            after = int(after.group(0))
+    except ValueError as e:
+        return api_error(str(e))
+
+    try:
+        rows, next_key = wiki_rows(wn_session, date, news_id, fields, after, api_limit())
+    except:
+        wn_session.rollback()
+        traceback.print_exc()
+        return api_error("could not read wiki matches", 500)
+
+    return jsonify({'wiki': serialize(rows, fields), 'next': next_key})
+
+
+@app.after_request
+def compress(response):
+    """Brotli- or gzip-encode API responses for clients that accept it"""
+
+    if not request.path.startswith('/api/') or response.direct_passthrough \
+            or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < app.config["API_COMPRESS_MIN_SIZE"]:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality('br') > 0:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted.quality('gzip') > 0:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
 if __name__ == '__main__':
     app.run(debug=app.config["DEBUG"],
             port=app.config["PORT"],
@@ -1,2 +1,2 @@
 #!/usr/bin/env bash
-python3 app.py
\ No newline at end of file
+exec gunicorn --config config/gunicorn_config.py app:app
@@ -0,0 +1,96 @@
+"""Benchmarks for the scoring steps in src/algorithm.py
+
+Run from the root of the repository:
+    python benchmarks/bench_algorithm.py [n_rows]
+
+The sample data in data/sample is resampled up to n_rows joined rows
+(default 100000) so timings reflect a multi-day backfill.
+"""
+
+import os
+import sys
+import time
+import logging
+import logging.config
+
+import numpy as np
+import pandas as pd
+from nltk.corpus import stopwords
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+from src.algorithm import (join_data, remove_stopwords, get_cosine, get_cosine_sparse,
+                           english_stopwords, strip_stopwords)
+
+logging.config.fileConfig("config/logging/local.conf",
+                          disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+logging.getLogger("algorithm").setLevel(logging.WARNING)
+
+SAMPLE_NEWS = 'data/sample/06-08-21-news-entries.csv'
+SAMPLE_WIKI = 'data/sample/06-08-21-wiki-entries.csv'
+CONF = {'raw_features': ['wiki', 'news'],
+        'processed_features': ['wiki_process', 'news_process']}
+
+
+def sample_joined(n_rows, seed=423):
+    """joined sample data resampled (with replacement) to n_rows
+
+    join_data() keeps text as categories, on which .map() and .apply()
+    only visit each category once; text is cast to object so the per-row
+    baselines do run once per row.
+    """
+
+    news_df = pd.read_csv(SAMPLE_NEWS)
+    wiki_df = pd.read_csv(SAMPLE_WIKI)
+    joined = join_data(news_df, wiki_df)
+    joined = joined.astype({column: object for column
+                            in joined.select_dtypes('category').columns})
+    return joined.sample(n_rows, replace=True, random_state=seed). \
+        reset_index(drop=True)
+
+
+def timed(func, *args):
+    """returns (seconds elapsed, output) of func(*args)"""
+
+    start = time.perf_counter()
+    output = func(*args)
+    return time.perf_counter() - start, output
+
+
+def bench_stopwords(data):
+    """per-row list scan, as remove_stopwords() used to run, against strip_stopwords()"""
+
+    def per_row(texts):
+        stop_words = stopwords.words('english')
+        return texts.map(lambda text: ' '.join([item for item in text.lower().split()
+                                                if item not in stop_words]))
+
+    for column in CONF['raw_features']:
+        row_time, row_out = timed(per_row, data[column])
+        batch_time, batch_out = timed(strip_stopwords, data[column], english_stopwords())
+        logger.info("stopwords '%s': per-row %.2fs, batched %.2fs (%.1fx) on %i rows",
+                    column, row_time, batch_time, row_time / batch_time, len(data))
+        pd.testing.assert_series_equal(row_out, batch_out)
+
+
+def bench_cosine(data):
+    """row-wise get_cosine() against batched get_cosine_sparse()"""
+
+    data = remove_stopwords(data, CONF)
+    left, right = CONF['processed_features']
+
+    row_time, row_sim = timed(
+        lambda: data[[left, right]].apply(get_cosine, axis=1).values)
+    batch_time, batch_sim = timed(get_cosine_sparse, data[left], data[right])
+
+    logger.info("cosine: row-wise %.2fs, batched %.2fs (%.1fx) on %i rows",
+                row_time, batch_time, row_time / batch_time, len(data))
+    logger.info("cosine: max abs difference %.2e",
+                np.abs(row_sim - batch_sim).max())
+
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    data = sample_joined(n_rows)
+    bench_stopwords(data)
+    bench_cosine(data)
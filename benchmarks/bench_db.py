@@ -0,0 +1,112 @@
+"""Benchmarks for ingesting data in src/db.py
+
+Run from the root of the repository:
+    python benchmarks/bench_db.py [n_rows]
+
+Synthetic wiki and news rows (default 5000 of each) are ingested into a
+temporary SQLite database, once row by row and once in bulk. Then a year
+of daily history is loaded to time one more day's ingest and the app's
+index query against it.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import logging
+import logging.config
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+from src.db import (create_db, ingest_wiki, ingest_news, delete_dates, apply_retention,
+                    latest_news, WikiNewsManager)
+
+logging.config.fileConfig("config/logging/local.conf",
+                          disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+logging.getLogger("db").setLevel(logging.WARNING)
+
+
+def synthetic_tables(n_rows, date='Jun-08-2021'):
+    """wiki and news dataframes in the column order ingest() passes them"""
+
+    news_ids = range(n_rows)
+    wiki_df = pd.DataFrame({'date': date,
+                            'news_id': news_ids,
+                            'title': ['Title %i' % i for i in news_ids],
+                            'wiki': 'Wikipedia extract. ' * 50,
+                            'wiki_url': 'https://en.wikipedia.org/wiki/Title',
+                            'wiki_image': ''})
+    news_df = pd.DataFrame({'date': date,
+                            'news_id': news_ids,
+                            'headline': ['Headline %i' % i for i in news_ids],
+                            'news': 'News description. ' * 20,
+                            'news_image': 'https://example.com/image.png',
+                            'news_url': 'https://example.com/news',
+                            'news_dis': 'News description. ' * 20})
+    return wiki_df, news_df
+
+
+def bench_ingest(n_rows):
+    """rows/sec of per-row ingestion against bulk ingestion"""
+
+    wiki_df, news_df = synthetic_tables(n_rows)
+
+    for bulk in [False, True]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine_string = 'sqlite:///' + os.path.join(tmp_dir, 'entries.db')
+            create_db(engine_string)
+
+            start = time.perf_counter()
+            ingest_wiki(wiki_df, engine_string, bulk=bulk)
+            ingest_news(news_df, engine_string, bulk=bulk)
+            elapsed = time.perf_counter() - start
+
+        logger.info("ingest (%s): %i rows in %.2fs, %.0f rows/sec",
+                    'bulk' if bulk else 'per-row', 2 * n_rows, elapsed,
+                    2 * n_rows / elapsed)
+
+
+def bench_history(n_days=365, n_news=40):
+    """one day's ingest and the index query with n_days of history stored"""
+
+    start_date = datetime(2021, 6, 8)
+    dates = [(start_date + timedelta(days=day)).strftime('%b-%d-%Y')
+             for day in range(n_days + 1)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine_string = 'sqlite:///' + os.path.join(tmp_dir, 'entries.db')
+        create_db(engine_string)
+        for date in dates[:-1]:
+            wiki_df, news_df = synthetic_tables(n_news, date)
+            ingest_wiki(wiki_df, engine_string, bulk=True)
+            ingest_news(news_df, engine_string, bulk=True)
+
+        wiki_df, news_df = synthetic_tables(n_news, dates[-1])
+        start = time.perf_counter()
+        delete_dates(engine_string, news_df['date'])
+        ingest_wiki(wiki_df, engine_string, bulk=True)
+        ingest_news(news_df, engine_string, bulk=True)
+        apply_retention(engine_string, keep_days=n_days, compact_days=30)
+        ingest_elapsed = time.perf_counter() - start
+
+        manager = WikiNewsManager(engine_string=engine_string)
+        start = time.perf_counter()
+        for _ in range(100):
+            latest_news(manager.session, n_news=20)
+            manager.session.expire_all()
+        query_elapsed = (time.perf_counter() - start) / 100
+        manager.close()
+
+    logger.info("history (%i days x %i news): day ingest + retention %.3fs, "
+                "index query %.2fms", n_days, n_news, ingest_elapsed,
+                1000 * query_elapsed)
+
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    bench_ingest(n_rows)
+    bench_history()
@@ -0,0 +1,97 @@
+"""Benchmark for the memory used by join_data() in src/algorithm.py
+
+Run from the root of the repository:
+    python benchmarks/bench_join.py [n_rows]
+
+A synthetic day of n_rows wiki matches (default 1000000) over n_rows / 20
+news articles is joined twice: by the previous join_data(), which merged
+every column as python objects and stamped a string date per row, and by
+the current one. Each join is reported with its peak traced allocation and
+the size of its output, not counting the strings both share with the inputs.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import logging
+import logging.config
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+from src.algorithm import join_data
+
+logging.config.fileConfig("config/logging/local.conf",
+                          disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+def synthetic_inputs(n_rows, seed=423):
+    """news and wiki tables shaped like load_news() and load_wiki() output"""
+
+    rng = np.random.default_rng(seed)
+    n_news = max(n_rows // 20, 1)
+    n_titles = max(n_rows // 10, 1)
+
+    news_df = pd.DataFrame({'news_id': np.arange(n_news),
+                            'headline': ['headline %i' % i for i in range(n_news)],
+                            'news': ['news text %i ' % i + 'word ' * 60 for i in range(n_news)],
+                            'news_image': ['https://img.example/%i.jpg' % i for i in range(n_news)],
+                            'news_url': ['https://news.example/%i' % i for i in range(n_news)]})
+
+    titles = np.array(['Title %i' % i for i in range(n_titles)], dtype=object)
+    extracts = np.array(['extract %i ' % i + 'word ' * 300 for i in range(n_titles)], dtype=object)
+    picks = rng.integers(0, n_titles, n_rows)
+    wiki_df = pd.DataFrame({'entity': titles[picks],
+                            'title': titles[picks],
+                            'wiki': extracts[picks],
+                            'wiki_url': titles[picks],
+                            'wiki_image': None,
+                            'news_id': np.sort(rng.integers(0, n_news, n_rows))})
+    return news_df, wiki_df
+
+
+def join_data_objects(news_df, wiki_df):
+    """join_data() before categorical columns and projection"""
+
+    wiki_df = wiki_df.drop_duplicates(['title', 'news_id'])
+    wiki_df = wiki_df.reset_index()
+    wiki_df = wiki_df.rename(columns={'index': 'wiki_id'})
+
+    joined = wiki_df.merge(news_df, on=['news_id'])
+    joined['date'] = date.today().strftime("%b-%d-%Y")
+    return joined
+
+
+def traced(func, *args):
+    """returns (seconds elapsed, peak MB allocated, output) of func(*args)"""
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+    return elapsed, peak, output
+
+
+def bench_join(n_rows):
+    """peak memory and output size of both joins"""
+
+    news_df, wiki_df = synthetic_inputs(n_rows)
+
+    for name, func in [('objects', join_data_objects), ('categorical', join_data)]:
+        elapsed, peak, joined = traced(func, news_df, wiki_df)
+        # shallow: the strings themselves are shared with the inputs
+        size = joined.memory_usage(deep=False).sum() / 1024 ** 2
+        logger.info("join %-11s: %.2fs, peak %.0f MB allocated, output %.0f MB "
+                    "for %i rows", name, elapsed, peak, size, len(joined))
+        del joined
+
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    bench_join(n_rows)
@@ -0,0 +1,85 @@
+"""Benchmarks for entity recognition in src/load_wiki.py
+
+Run from the root of the repository:
+    python benchmarks/bench_load_wiki.py [n_rows] [spacy_model]
+
+The sample news in data/sample is resampled up to n_rows headlines
+(default 5000) and run through news2entities_batch() with 1, 2, 4, ...
+worker processes, up to the number of cores. If spacy_model (default
+en_core_web_sm) is not installed, a blank pipeline with an entity ruler
+built from the sample wiki titles is used instead.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import logging
+import logging.config
+
+import pandas as pd
+import spacy
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+from src.load_wiki import news2entities_batch
+
+logging.config.fileConfig("config/logging/local.conf",
+                          disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+logging.getLogger("load_wiki").setLevel(logging.WARNING)
+
+SAMPLE_NEWS = 'data/sample/06-08-21-news-entries.csv'
+SAMPLE_WIKI = 'data/sample/06-08-21-wiki-entries.csv'
+STOP_SPACY = ['PERSON', 'FAC', 'ORG', 'GPE', 'LOC', 'PRODUCT', 'EVENT', 'WORK_OF_ART']
+SPACY_DISABLE = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer']
+
+
+def ruler_model(path):
+    """blank English pipeline tagging the sample wiki titles; saved to path"""
+
+    nlp = spacy.blank('en')
+    ruler = nlp.add_pipe('entity_ruler')
+    titles = pd.read_csv(SAMPLE_WIKI)['title'].dropna().unique()
+    ruler.add_patterns([{'label': 'ORG', 'pattern': title} for title in titles])
+    nlp.to_disk(path)
+    return path
+
+
+def bench_ner(n_rows, spacy_model, seed=423):
+    """texts/sec of news2entities_batch() for increasing worker counts"""
+
+    news = pd.read_csv(SAMPLE_NEWS)['news']. \
+        sample(n_rows, replace=True, random_state=seed).tolist()
+
+    workers = [1]
+    while workers[-1] * 2 <= os.cpu_count():
+        workers.append(workers[-1] * 2)
+    if workers[-1] != os.cpu_count():
+        workers.append(os.cpu_count())
+
+    serial = None
+    for n_process in workers:
+        start = time.perf_counter()
+        entities = news2entities_batch(news, STOP_SPACY, spacy_model, SPACY_DISABLE,
+                                       n_process=n_process)
+        elapsed = time.perf_counter() - start
+
+        if serial is None:
+            serial = (elapsed, entities)
+        assert entities == serial[1]
+        logger.info("ner with %i process(es): %.0f texts/sec, %.2fx serial",
+                    n_process, n_rows / elapsed, serial[0] / elapsed)
+
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    spacy_model = sys.argv[2] if len(sys.argv) > 2 else 'en_core_web_sm'
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            spacy.load(spacy_model)
+        except OSError:
+            logger.warning("%s is not installed; using an entity ruler instead", spacy_model)
+            spacy_model = ruler_model(tmp_dir)
+        logger.info("%i cores available", os.cpu_count())
+        bench_ner(n_rows, spacy_model)
@@ -0,0 +1,97 @@
+"""Benchmarks for full-text search in src/search.py
+
+Run from the root of the repository:
+    python benchmarks/bench_search.py [n_days]
+
+The sample news and wiki matches in data/sample are ingested once per day
+for n_days (default 365) into a temporary SQLite database, then random
+one- and two-word queries drawn from the headlines are timed. The target
+is a p95 under 50 ms.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import logging
+import logging.config
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
+from src.db import create_db, ingest_news, ingest_wiki, update_search_index
+from src.search import FTS5Index, match_terms
+
+logging.config.fileConfig("config/logging/local.conf",
+                          disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+logging.getLogger("db").setLevel(logging.WARNING)
+logging.getLogger("src.db").setLevel(logging.WARNING)
+logging.getLogger("src.search").setLevel(logging.WARNING)
+
+SAMPLE_NEWS = 'data/sample/06-08-21-news-entries.csv'
+SAMPLE_WIKI = 'data/sample/06-08-21-wiki-entries.csv'
+
+
+def sample_day(date):
+    """sample news and wiki rows stamped with date, in ingest column order"""
+
+    news_df = pd.read_csv(SAMPLE_NEWS).fillna('')
+    news_df.insert(0, 'date', date)
+    news_df['news_dis'] = news_df['news']
+    wiki_df = pd.read_csv(SAMPLE_WIKI).fillna('')
+    wiki_df.insert(0, 'date', date)
+    return (wiki_df[['date', 'news_id', 'title', 'wiki', 'wiki_url', 'wiki_image']],
+            news_df[['date', 'news_id', 'headline', 'news',
+                     'news_image', 'news_url', 'news_dis']])
+
+
+def bench_search(n_days, n_queries=500, seed=423):
+    """latency percentiles of FTS5Index.search() over n_days of news"""
+
+    start_date = datetime(2021, 6, 8)
+    dates = [(start_date + timedelta(days=day)).strftime('%b-%d-%Y')
+             for day in range(n_days)]
+
+    rng = np.random.default_rng(seed)
+    words = sorted({word for headline in pd.read_csv(SAMPLE_NEWS)['headline']
+                    for word in match_terms(headline) if len(word) > 3})
+    queries = [' '.join(rng.choice(words, size=rng.integers(1, 3)))
+               for _ in range(n_queries)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine_string = 'sqlite:///' + os.path.join(tmp_dir, 'entries.db')
+        create_db(engine_string)
+        for date in dates:
+            wiki_df, news_df = sample_day(date)
+            ingest_wiki(wiki_df, engine_string, bulk=True)
+            ingest_news(news_df, engine_string, bulk=True)
+
+        start = time.perf_counter()
+        update_search_index(engine_string, dates[:-1])
+        logger.info("indexed %i days in %.2fs", n_days - 1, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        update_search_index(engine_string, dates[-1:])
+        logger.info("incremental update for one day: %.3fs", time.perf_counter() - start)
+
+        engine = sqlalchemy.create_engine(engine_string)
+        index = FTS5Index()
+        latencies = []
+        for query in queries:
+            for page in [1, 2]:
+                start = time.perf_counter()
+                index.search(engine, query, page=page)
+                latencies.append(time.perf_counter() - start)
+
+    p50, p95, p99 = 1000 * np.percentile(latencies, [50, 95, 99])
+    logger.info("search over %i days: p50 %.2fms, p95 %.2fms, p99 %.2fms (target p95 < 50ms: %s)",
+                n_days, p50, p95, p99, 'met' if p95 < 50 else 'MISSED')
+
+
+if __name__ == '__main__':
+    n_days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    bench_search(n_days)
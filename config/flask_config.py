@@ -11,3 +11,17 @@ SQLALCHEMY_TRACK_MODIFICATIONS = True
 HOST = "0.0.0.0"
 SQLALCHEMY_ECHO = False  # If true, SQL for queries made will be printed
 MAX_ROWS_SHOW = 100
+# a gthread worker serves at most WEB_THREADS requests at once, so one
+# connection per thread is enough; in total the database sees at most
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+DB_POOL_SIZE = int(os.environ.get("WEB_THREADS", 4))  # connections per worker process
+DB_MAX_OVERFLOW = 0
+DB_POOL_PRE_PING = True
+DB_POOL_RECYCLE = 3600  # seconds; below MySQL's wait_timeout
+MAX_NEWS_SHOW = 20
+PAGE_CACHE_PATH = None  # sqlite file to share rendered pages across workers
+PAGE_CACHE_SIZE = 10
+SEARCH_PAGE_SIZE = 10
+API_PAGE_SIZE = 20
+API_MAX_LIMIT = 100
+API_COMPRESS_MIN_SIZE = 500  # bytes; smaller JSON responses are sent uncompressed
@@ -0,0 +1,17 @@
+"""Settings for serving app.py with gunicorn; used by app/boot.sh"""
+
+import multiprocessing
+import os
+
+bind = "0.0.0.0:%s" % os.environ.get("PORT", 5000)
+
+# worker processes scale with cores; each keeps its own database pool of
+# one connection per thread (DB_POOL_SIZE in flask_config.py), so the
+# database needs max_connections of at least workers * threads: 36 on
+# 4 cores. Set WEB_CONCURRENCY lower for small database instances
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 4))
+
+timeout = 30
+accesslog = "-"
@@ -8,6 +8,7 @@ filter: remove irrelevant matches
 create_db: prep database for new data
 ingest: ingest database with new data
 s3: load any input into s3
+pipeline: run load_news through ingest in one process
 
 this script is designed to work with ./Makefile
 """
@@ -21,10 +22,13 @@ import yaml
 import pandas as pd
 
 from src.db import create_db, ingest
-from src.load_news import load_news
-from src.load_wiki import load_wiki
 from src.algorithm import filter_data, join_data, predict_data
 from src.s3 import upload
+from src.cache import ResponseCache
+from src.client import HttpClient
+from src.pipeline import (run_pipeline, stage_load_news, stage_load_wiki,
+                          stage_predict_stream)
+from src.tables import read_table, write_table
 
 logging.config.fileConfig("config/logging/local.conf",
                           disable_existing_loggers=False)
@@ -32,8 +36,12 @@ logger = logging.getLogger(__name__)
 logging.getLogger("s3fs").setLevel(logging.WARNING)
 
 
-def handle_input_path(input_path, s3_path=None):
-    """handle inputs for various steps in the arg parser"""
+def handle_input_path(input_path, s3_path=None, columns=None):
+    """handle inputs for various steps in the arg parser
+
+    csv, parquet and feather files are read based on the file extension;
+    only `columns` are read if given
+    """
 
     if s3_path is not None:
         logger.info('Adding s3 path to input path')
@@ -41,7 +49,7 @@ def handle_input_path(input_path, s3_path=None):
 
     if input_path is not None:
         try:
-            input_data = pd.read_csv(input_path)
+            input_data = read_table(input_path, columns)
             logger.debug('read %i lines of data', len(input_data))
             return input_data
         except FileNotFoundError:
@@ -53,6 +61,17 @@ def handle_input_path(input_path, s3_path=None):
     return None
 
 
+def handle_cache(wiki_conf, cache_dir, no_cache):
+    """handle the Wikipedia response cache for steps that call load_wiki"""
+
+    if no_cache:
+        logger.info('not using a response cache')
+        return None
+    return ResponseCache(os.path.join(cache_dir, 'wiki.db'),
+                         ttl=wiki_conf['cache']['ttl'],
+                         max_entries=wiki_conf['cache']['max_entries'])
+
+
 def handle_engine_string(in_engine_string):
     """handle engine strings for various steps in the arg parser"""
 
@@ -75,7 +94,8 @@ if __name__ == '__main__':
     parser.add_argument('step',
                         help='Which step to run',
                         choices=['load_news', 'load_wiki', 'filter',
-                                 'create_db', 'join', 'predict', 'ingest', 's3'])
+                                 'create_db', 'join', 'predict', 'ingest', 's3',
+                                 'pipeline'])
 
     parser.add_argument('--input', '-i', default=None,
                         help='Path to input data')
@@ -86,15 +106,39 @@ if __name__ == '__main__':
 
     parser.add_argument('--config', help='Path to configuration file')
     parser.add_argument('--output', '-o', default=None,
-                        help='Path to save output CSV (default = None)')
+                        help='Path to save output; .csv, .parquet or .feather (default = None)')
 
     parser.add_argument("--engine_string",
                         help="connection URI for database")
     parser.add_argument("--s3_path",
                         help="s3 path")
+    parser.add_argument("--cache-dir", default='data/cache',
+                        help="directory for the API response cache (default = data/cache)")
+    parser.add_argument("--no-cache", action='store_true',
+                        help="always query APIs instead of reading cached responses")
+    parser.add_argument("--checkpoint_dir", default=None,
+                        help="pipeline: directory to save intermediate data (default = None)")
+    parser.add_argument("--checkpoint_format", default='csv',
+                        choices=['csv', 'parquet', 'feather'],
+                        help="pipeline: file format for intermediate data (default = csv)")
+    parser.add_argument("--trace_memory", action='store_true',
+                        help="pipeline: report each stage's peak Python heap")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="predict, filter: stream the input in chunks of this many "
+                             "rows, appending each to --output (default = None, in memory)")
+    parser.add_argument("--filter", action='store_true',
+                        help="predict: also filter each chunk, as the filter step would")
+    parser.add_argument("--incremental", action='store_true',
+                        help="pipeline: skip articles processed by an earlier run "
+                             "and upsert instead of replacing the tables")
 
     args = parser.parse_args()
 
+    streamed = args.chunksize is not None and args.step in ['predict', 'filter']
+    if streamed and args.output is None:
+        parser.error("--chunksize requires --output")
+
+    conf = None
     if args.config is not None:
         with open(args.config, 'r') as conf_file:
             conf = yaml.load(conf_file, Loader=yaml.FullLoader)
@@ -103,8 +147,7 @@ if __name__ == '__main__':
         if conf is None:
             logger.error("yaml configuration file required for load_news()")
         else:
-            output = load_news(conf,
-                               source_words=conf['source_words'])
+            output = stage_load_news(conf)
 
         if args.output is not None and args.s3_path is not None:
             upload(args.output, args.s3_path)
@@ -114,15 +157,11 @@ if __name__ == '__main__':
         if conf is None:
             logger.error("yaml configuration file required for load_wiki()")
         else:
-            data = handle_input_path(args.input)
-            output = load_wiki(data,
-                               query_conf=conf['wiki_query'],
-                               content_conf=conf['wiki_content'],
-                               stop_spacy=conf['stop_spacy'],
-                               spacy_model=conf['spacy_model'],
-                               stop_categories=conf['stop_categories'],
-                               stop_phrases=conf['stop_phrases'],
-                               n_results=conf['n_results'])
+            data = handle_input_path(args.input, columns=['news_id', 'news'])
+            cache = handle_cache(conf, args.cache_dir, args.no_cache)
+            output = stage_load_wiki(data, conf, cache)
+            if cache is not None:
+                cache.close()
 
         if args.output is not None and args.s3_path is not None:
             upload(args.output, args.s3_path)
@@ -136,24 +175,70 @@ if __name__ == '__main__':
     elif args.step == 'predict':
         if conf is None:
             logger.error("yaml configuration file required for predict()")
-        data = handle_input_path(args.input)
-        output = predict_data(data, conf)
+        if streamed:
+            stage_predict_stream(args.input, args.output, conf, args.chunksize,
+                                 filter=args.filter)
+        else:
+            data = handle_input_path(args.input)
+            output = predict_data(data, conf)
+            if args.filter:
+                output = filter_data(output)
 
     elif args.step == 'filter':
-        data = handle_input_path(args.input)
-        output = filter_data(data)
+        if streamed:
+            stage_predict_stream(args.input, args.output, conf, args.chunksize,
+                                 predict=False)
+        else:
+            data = handle_input_path(args.input)
+            output = filter_data(data)
 
     elif args.step == 'create_db':
         engine_string = handle_engine_string(args.engine_string)
-        create_db(engine_string)
+        # with history kept, earlier days stay; ingest replaces the day it loads
+        truncate = conf is None or not conf['history']['append']
+        create_db(engine_string, truncate=truncate)
 
     elif args.step == 'ingest':
         if conf is None:
             logger.error("yaml configuration file required for ingest()")
-        data = handle_input_path(args.input)
+        columns = list(dict.fromkeys(conf['wiki']['raw_columns'] +
+                                     conf['news']['raw_columns'] +
+                                     [conf['render']['entity_column']]))
+        data = handle_input_path(args.input, columns=columns)
         engine_string = handle_engine_string(args.engine_string)
         ingest(data, conf, engine_string)
 
+    elif args.step == 'pipeline':
+        if conf is None:
+            logger.error("yaml configuration file required for pipeline")
+        confs = {}
+        for step, step_config in conf['configs'].items():
+            with open(step_config, 'r') as conf_file:
+                confs[step] = yaml.load(conf_file, Loader=yaml.FullLoader)
+
+        news_df = handle_input_path(args.input1, args.s3_path)
+        wiki_df = handle_input_path(args.input2, args.s3_path)
+        engine_string = handle_engine_string(args.engine_string)
+        cache = None
+        if wiki_df is None:
+            cache = handle_cache(confs['load_wiki'], args.cache_dir, args.no_cache)
+        client = HttpClient(**conf['http'])
+        try:
+            output = run_pipeline(confs, engine_string,
+                                  news_df=news_df,
+                                  wiki_df=wiki_df,
+                                  checkpoint_dir=args.checkpoint_dir,
+                                  checkpoint_format=args.checkpoint_format,
+                                  cache=cache,
+                                  trace_memory=args.trace_memory,
+                                  incremental=args.incremental,
+                                  client=client)
+        finally:
+            client.log_metrics()
+            client.close()
+        if cache is not None:
+            cache.close()
+
     elif args.step == 's3':
         if args.input is not None:
             upload(args.input, args.s3_path)
@@ -162,6 +247,7 @@ if __name__ == '__main__':
         if args.input2 is not None:
             upload(args.input2, args.s3_path)
 
-    if args.output is not None:
-        output.to_csv(args.output, index=False)
+    # streamed steps have already written their output
+    if args.output is not None and not streamed:
+        write_table(output, args.output)
         logger.info("Output saved locally to %s", args.output)
@@ -1,13 +1,18 @@
 """ Module containing functions to format the data for the algorithm and run it
 
-join_data(news_path, wiki_path)
+join_data(news_df, wiki_df)
 predict_data(data, conf)
-filter_data(data)
+filter_data(data, seen)
+predict_chunks(chunks, conf, predict, filter)
 
 helper functions:
     text_to_vector(text)
     get_cosine(x)
+    texts_to_matrix(texts, vocab)
+    get_cosine_sparse(left, right)
     remove_stopwords(data, args)
+    strip_stopwords(texts, stop_words)
+    english_stopwords()
 """
 
 from datetime import date
@@ -15,32 +20,68 @@ import logging
 import math
 import re
 from collections import Counter
+from functools import lru_cache
+import os
+import zipfile
 
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from nltk.corpus import stopwords
 
 logger = logging.getLogger(__name__)
 logging.getLogger("utils").setLevel(logging.ERROR)
 
+# the nltk stopwords corpus shipped with the repo, for machines without nltk_data
+STOPWORDS_ZIP = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'config', 'stopwords.zip')
+
+# columns join_data() keeps from each input, in output order
+WIKI_COLUMNS = ['entity', 'title', 'wiki', 'wiki_url', 'wiki_image', 'news_id']
+NEWS_COLUMNS = ['news_id', 'headline', 'news', 'news_image', 'news_url']
+JOIN_COLUMNS = ['wiki_id'] + WIKI_COLUMNS + NEWS_COLUMNS[1:] + ['date']
+TEXT_COLUMNS = [column for column in JOIN_COLUMNS if column not in ['wiki_id', 'news_id']]
+
+# tokens are whitespace-separated, exactly as str.split() makes them
+TOKEN = re.compile(r'\S+')
+
 
 def join_data(news_df, wiki_df):
     """Join news file with wiki file
 
+    Only the columns used by predict_data() and ingest() are kept. News
+    columns are categorical, so each joined row holds a small code into
+    one copy of its article's text; the date is a one-category column and
+    the ids are int32.
+
     Args:
-        news_path (str): file path
-        wiki_path (str): file path
+        news_df (obj `pandas.DataFrame`): output from load_news()
+        wiki_df (obj `pandas.DataFrame`): output from load_wiki()
 
     Returns:
-        (obj `pandas.DataFrame`): joined dataframe
+        (obj `pandas.DataFrame`): joined dataframe with JOIN_COLUMNS
     """
 
-    wiki_df = wiki_df.drop_duplicates(['title', 'news_id'])
-    wiki_df = wiki_df.reset_index()
-    wiki_df = wiki_df.rename(columns={'index': 'wiki_id'})
+    news_ids = pd.Index(news_df['news_id'])
+    if not news_ids.is_unique:
+        raise ValueError("news_df has duplicate news_id values")
 
-    joined = wiki_df.merge(news_df, on=['news_id'])
-    joined['date'] = date.today().strftime("%b-%d-%Y")
-    return joined
+    # rows of wiki_df to keep, and the news row each one joins to
+    keep = ~wiki_df.duplicated(['title', 'news_id']).to_numpy()
+    news_rows = news_ids.get_indexer(wiki_df['news_id'])
+    rows = np.flatnonzero(keep & (news_rows >= 0))
+    news_rows = news_rows[rows]
+
+    joined = {'wiki_id': wiki_df.index.to_numpy()[rows].astype(np.int32)}
+    for column in WIKI_COLUMNS[:-1]:
+        joined[column] = wiki_df[column].to_numpy()[rows]
+    joined['news_id'] = news_ids.to_numpy()[news_rows].astype(np.int32)
+    for column in NEWS_COLUMNS[1:]:
+        text = pd.Categorical(news_df[column])
+        joined[column] = pd.Categorical.from_codes(text.codes[news_rows], text.categories)
+    joined['date'] = pd.Categorical.from_codes(np.zeros(len(rows), dtype=np.int8),
+                                               [date.today().strftime("%b-%d-%Y")])
+    return pd.DataFrame(joined)
 
 
 def predict_data(data, conf):
@@ -57,7 +98,8 @@ def predict_data(data, conf):
     """
 
     data = remove_stopwords(data, conf)
-    data['sim'] = data[conf['processed_features']].apply(get_cosine, axis=1)
+    left, right = conf['processed_features']
+    data['sim'] = get_cosine_sparse(data[left], data[right])
     logger.info("mean similarity score: %f", data['sim'].mean())
 
     data['predict'] = data['sim'] > conf['threshhold']
@@ -67,18 +109,57 @@ def predict_data(data, conf):
     return data
 
 
-def filter_data(data):
+def filter_data(data, seen=None):
     """Clean and filter based on similarity score
 
     Args:
         data (obj `pandas.DataFrame`): output from predict_data()
+        seen (set, optional): for data read in chunks; hashes of the
+            ('news_id', 'title') pairs in earlier chunks, so duplicates
+            are dropped across chunks too. Updated in place, so it holds
+            one integer per unique pair seen. Defaults to None
 
     Returns:
         (obj `pandas.DataFrame`): data with irrelevant entities removed
     """
 
-    data = data.drop_duplicates(['news_id', 'title']).loc[data['predict']]
-    return data
+    if seen is None:
+        data = data.drop_duplicates(['news_id', 'title']).loc[data['predict']]
+        return data
+
+    keys = pd.util.hash_pandas_object(data[['news_id', 'title']], index=False)
+    first = ~keys.duplicated() & np.fromiter((key not in seen for key in keys),
+                                             dtype=bool, count=len(keys))
+    seen.update(keys[first])
+    return data.loc[first & data['predict']]
+
+
+def predict_chunks(chunks, conf, predict=True, filter=True):
+    """Score and/or filter data one chunk at a time
+
+    Rows are scored independently, so the output matches running
+    predict_data() and filter_data() on all chunks at once. Nothing is
+    kept between chunks except the dedup set of filter_data(), which is
+    O(unique ('news_id', 'title') pairs).
+
+    Args:
+        chunks (iterable of obj `pandas.DataFrame`): output from join_data(),
+            or from predict_data() if predict is False
+        conf (dict): yaml-style config for predict_data()
+        predict (bool, optional): run predict_data(). Defaults to True
+        filter (bool, optional): run filter_data(). Defaults to True
+
+    Yields:
+        (obj `pandas.DataFrame`): each processed chunk
+    """
+
+    seen = set()
+    for chunk in chunks:
+        if predict:
+            chunk = predict_data(chunk, conf)
+        if filter:
+            chunk = filter_data(chunk, seen)
+        yield chunk
 
 
 def text_to_vector(text):
@@ -107,6 +188,79 @@ def get_cosine(x):
     return float(numerator) / denominator
 
 
+def texts_to_matrix(texts, vocab):
+    """embed texts as rows of a sparse count matrix
+
+    Args:
+        texts (array-like): str to embed; each becomes one row
+        vocab (dict): maps word to column; new words are added in place
+            so several matrices can share one vocabulary
+
+    Returns:
+        (obj `scipy.sparse.csr_matrix`): counts with len(vocab) columns
+    """
+
+    indptr = [0]
+    indices = []
+    counts = []
+    for text in texts:
+        vector = text_to_vector(text)
+        for word, count in vector.items():
+            indices.append(vocab.setdefault(word, len(vocab)))
+            counts.append(count)
+        indptr.append(len(indices))
+
+    return sparse.csr_matrix((np.array(counts, dtype=np.int64),
+                              np.array(indices, dtype=np.int64),
+                              np.array(indptr, dtype=np.int64)),
+                             shape=(len(texts), len(vocab)))
+
+
+def get_cosine_sparse(left, right):
+    """calculate row-wise cosine of two text columns in one vectorized pass
+
+    Each unique text is tokenized once; rows are then scored against a
+    shared-vocabulary sparse count matrix. Matches get_cosine() row by row.
+
+    Args:
+        left (obj `pandas.Series`): str column
+        right (obj `pandas.Series`): str column of the same length
+
+    Returns:
+        (obj `numpy.ndarray`): cosine similarity for each row; raises
+            ValueError if either column has a missing text
+    """
+
+    left_codes, left_uniques = pd.factorize(left)
+    right_codes, right_uniques = pd.factorize(right)
+    # a -1 code would silently index the last unique text
+    for texts, codes in [(left, left_codes), (right, right_codes)]:
+        if (codes == -1).any():
+            raise ValueError("column '%s' has missing texts" % texts.name)
+
+    vocab = {}
+    left_mat = texts_to_matrix(left_uniques, vocab)
+    right_mat = texts_to_matrix(right_uniques, vocab)
+    left_mat.resize(left_mat.shape[0], len(vocab))
+    right_mat.resize(right_mat.shape[0], len(vocab))
+
+    left_rows = left_mat[left_codes]
+    right_rows = right_mat[right_codes]
+
+    numerator = np.asarray(left_rows.multiply(right_rows).sum(axis=1)).ravel()
+    left_norm = np.sqrt(np.asarray(left_mat.multiply(left_mat).sum(axis=1)).ravel())
+    right_norm = np.sqrt(np.asarray(right_mat.multiply(right_mat).sum(axis=1)).ravel())
+    denominator = left_norm[left_codes] * right_norm[right_codes]
+
+    sim = np.zeros(len(numerator))
+    nonzero = denominator != 0
+    sim[nonzero] = numerator[nonzero] / denominator[nonzero]
+    logger.info("scored %i rows from %i unique texts (%.1f rows per text)",
+                len(sim), len(left_uniques) + len(right_uniques),
+                2 * len(sim) / max(len(left_uniques) + len(right_uniques), 1))
+    return sim
+
+
 def remove_stopwords(data, args):
     """remove stopwords from specified dataframe columns
 
@@ -119,12 +273,50 @@ def remove_stopwords(data, args):
         (obj `pandas.DataFrame`): dataframe, but with a processed str
                                   column with stopwords removed
     """
-    stop_words = stopwords.words('english')
+    stop_words = english_stopwords()
 
     for raw, proc in zip(args['raw_features'], args['processed_features']):
-        data[proc] = data[raw].str.lower().str.split(). \
-            apply(lambda x: ' '.join([item for item in x
-                                      if item not in stop_words]))
+        data[proc] = strip_stopwords(data[raw], stop_words)
 
     logger.debug("removed stopwords, returning processed data")
     return data
+
+
+def strip_stopwords(texts, stop_words):
+    """lower-case a text column and drop its stopword tokens
+
+    Each unique text is processed once: the uniques are lower-cased and
+    tokenized as one batch, then mapped back onto the rows.
+
+    Args:
+        texts (obj `pandas.Series`): str column
+        stop_words (set): lower-case words to drop
+
+    Returns:
+        (obj `pandas.Series`): space-joined remaining tokens, same index as texts
+    """
+
+    codes, uniques = pd.factorize(texts)
+    if (codes == -1).any():
+        raise ValueError("column '%s' has missing texts" % texts.name)
+    tokens = pd.Series(uniques, dtype=object).str.lower().str.findall(TOKEN)
+    stripped = np.array([' '.join([token for token in row if token not in stop_words])
+                         for row in tokens], dtype=object)
+    logger.debug("stripped stopwords from %i unique texts in %i rows",
+                 len(uniques), len(texts))
+    return pd.Series(stripped[codes], index=texts.index, name=texts.name, dtype=object)
+
+
+@lru_cache(maxsize=None)
+def english_stopwords():
+    """nltk's English stopwords as a frozenset, loaded once per process
+
+    Read from nltk_data if installed, otherwise from config/stopwords.zip.
+    """
+
+    try:
+        return frozenset(stopwords.words('english'))
+    except LookupError:
+        logger.debug("nltk stopwords not installed; reading %s", STOPWORDS_ZIP)
+        with zipfile.ZipFile(STOPWORDS_ZIP) as corpus:
+            return frozenset(corpus.read('stopwords/english').decode('utf-8').split())
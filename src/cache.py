@@ -0,0 +1,116 @@
+"""Module containing a persistent, SQLite-backed cache for API responses
+
+Class:
+ResponseCache()
+
+The same popular entities come up day after day, so Wikipedia search and
+page content responses are kept on disk between runs, each endpoint with
+its own time-to-live. Callers only store successful answers; an error
+would otherwise be replayed until it expires.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Read-through/write-through cache of JSON responses keyed by endpoint and params"""
+
+    def __init__(self, path, ttl={}, max_entries=100000):
+        """
+        Args:
+            path (str): sqlite file; parent directories are created
+            ttl (dict): seconds each endpoint's responses stay fresh;
+                endpoints not listed never expire
+            max_entries (int): most responses to keep; least recently
+                used responses are evicted first
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                  key TEXT PRIMARY KEY,
+                                  endpoint TEXT NOT NULL,
+                                  created REAL NOT NULL,
+                                  accessed REAL NOT NULL,
+                                  value TEXT NOT NULL)""")
+        self._conn.execute("""CREATE INDEX IF NOT EXISTS ix_responses_accessed
+                              ON responses (accessed)""")
+        self._conn.commit()
+        logger.debug("using response cache at %s", path)
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """hash of endpoint and params, independent of param order"""
+
+        normalized = json.dumps({str(k): str(v) for k, v in params.items()},
+                                sort_keys=True)
+        return hashlib.sha1((endpoint + normalized).encode('utf-8')).hexdigest()
+
+    def get(self, endpoint, params):
+        """Return the cached response, or None if missing or expired"""
+
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created, value FROM responses WHERE key = ?",
+                (key,)).fetchone()
+
+            ttl = self.ttl.get(endpoint)
+            if row is None or (ttl is not None and now - row[0] > ttl):
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?",
+                               (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[1])
+
+    def set(self, endpoint, params, value):
+        """Store a response, evicting the least recently used past max_entries"""
+
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, endpoint, now, now, json.dumps(value)))
+
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    """DELETE FROM responses WHERE key IN (
+                           SELECT key FROM responses
+                           ORDER BY accessed LIMIT ?)""",
+                    (count - self.max_entries,))
+            self._conn.commit()
+
+    def stats(self):
+        """hit/miss counters and the share of lookups served from cache"""
+
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0}
+
+    def close(self):
+        """Closes the sqlite connection"""
+        self._conn.close()
@@ -0,0 +1,364 @@
+"""Module containing the HTTP client shared by load_news and load_wiki
+
+Classes:
+HttpClient()
+ClientMetrics()
+RateLimiter(rate)
+
+Helper function:
+retry_after(response)
+
+One client is made per run and passed to both loaders, so all requests
+reuse one pool of keep-alive connections. Every request gets a connect and
+a read timeout. Connection errors, timeouts, 429 and 5xx responses are
+retried with jittered exponential backoff, honouring Retry-After. Callers
+pass their RateLimiter to get(), so retries wait their turn like first
+attempts. A per-run deadline bounds the time spent on all requests together; once it runs out,
+requests fail fast. Callers get None for a failed request and treat it as
+"no match".
+
+Responses are requested compressed (gzip, deflate, and br when the brotli
+package is installed). With http2=True and httpx[http2] installed, requests
+are multiplexed over HTTP/2 instead.
+"""
+
+from bisect import bisect_left
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import brotli  # noqa: F401; lets urllib3 decode br responses
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf')]
+
+
+def retry_after(response):
+    """Seconds asked for by a Retry-After header, or None if absent or unparseable"""
+
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class ClientMetrics:
+    """Request counts, bytes and latency histograms per endpoint; thread-safe"""
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status, wire_bytes, body_bytes):
+        """Count one attempt
+
+        Args:
+            endpoint (str): name the attempt is counted under
+            seconds (float): time until the response body was read
+            status (int): HTTP status; None for a failed connection or timeout
+            wire_bytes (int): bytes received, before decompression
+            body_bytes (int): bytes of the decoded body
+        """
+
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'requests': 0, 'errors': 0, 'wire_bytes': 0, 'body_bytes': 0,
+                'seconds': 0.0, 'histogram': [0] * len(LATENCY_BUCKETS)})
+            stats['requests'] += 1
+            stats['errors'] += status is None or status >= 400
+            stats['wire_bytes'] += wire_bytes
+            stats['body_bytes'] += body_bytes
+            stats['seconds'] += seconds
+            stats['histogram'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def summary(self):
+        """Copy of the stats, keyed by endpoint"""
+
+        with self._lock:
+            return {endpoint: dict(stats, histogram=list(stats['histogram']))
+                    for endpoint, stats in self.endpoints.items()}
+
+
+class HttpClient:
+    """Pooled HTTP client with timeouts, retries, a deadline and metrics"""
+
+    def __init__(self, connect_timeout=5, read_timeout=30, retries=3,
+                 backoff=0.5, max_backoff=30, deadline=None,
+                 pool_size=10, http2=False):
+        """
+        Args:
+            connect_timeout (float): seconds to wait for a connection
+            read_timeout (float): seconds to wait between bytes of a response
+            retries (int): retries after the first attempt of a request
+            backoff (float): base of the exponential backoff, in seconds;
+                retry n waits a random time up to backoff * 2 ** n
+            max_backoff (float): longest wait before a retry, in seconds;
+                a longer Retry-After gives up on the request
+            deadline (float, optional): seconds all requests of this client
+                may take together, counted from its first request; None
+                for no limit
+            pool_size (int): keep-alive connections kept per host; should be
+                at least the number of threads sending requests
+            http2 (bool): use HTTP/2 when httpx and h2 are installed,
+                otherwise warn and use HTTP/1.1
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.metrics = ClientMetrics()
+        self._started = None
+
+        self.session = None
+        self.httpx_client = self._http2_client(pool_size) if http2 else None
+        if self.httpx_client is None:
+            self.session = requests.Session()
+            self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+
+    def _http2_client(self, pool_size):
+        """httpx client speaking HTTP/2, or None if httpx or h2 is missing"""
+
+        if httpx is None:
+            logger.warning("http2 needs the httpx package; using HTTP/1.1")
+            return None
+        try:
+            return httpx.Client(http2=True,
+                                headers={'Accept-Encoding': ACCEPT_ENCODING},
+                                limits=httpx.Limits(max_connections=pool_size,
+                                                    max_keepalive_connections=pool_size))
+        except ImportError:
+            logger.warning("http2 needs the h2 package; using HTTP/1.1")
+            return None
+
+    def remaining(self):
+        """Seconds left before the deadline; None without a deadline"""
+
+        if not self.deadline:
+            return None
+        if self._started is None:
+            return float(self.deadline)
+        return max(self.deadline - (time.monotonic() - self._started), 0.0)
+
+    def _send(self, url, params, endpoint, read_timeout):
+        """One attempt at a request, recorded in metrics
+
+        httpx errors are raised as their requests equivalents.
+        """
+
+        start = time.perf_counter()
+        status = None
+        wire_bytes = body_bytes = 0
+        try:
+            if self.httpx_client is not None:
+                try:
+                    response = self.httpx_client.get(
+                        url, params=params,
+                        timeout=httpx.Timeout(read_timeout, connect=self.connect_timeout))
+                except httpx.TimeoutException as exc:
+                    raise requests.Timeout(str(exc))
+                except httpx.TransportError as exc:
+                    raise requests.ConnectionError(str(exc))
+                wire_bytes = response.num_bytes_downloaded
+            else:
+                response = self.session.get(url, params=params,
+                                            timeout=(self.connect_timeout, read_timeout))
+                # bytes read off the socket, before decompression
+                wire_bytes = response.raw.tell()
+            status = response.status_code
+            body_bytes = len(response.content)
+            return response
+        finally:
+            self.metrics.record(endpoint, time.perf_counter() - start,
+                                status, wire_bytes, body_bytes)
+
+    def get(self, url, params=None, endpoint=None, limiter=None):
+        """GET url, retrying transient failures
+
+        Args:
+            url (str)
+            params (dict, optional): query string parameters
+            endpoint (str, optional): name for the metrics; defaults to the
+                url's host and path
+            limiter (obj `RateLimiter`, optional): waited on before every
+                attempt, retries included. Defaults to None
+
+        Returns:
+            response with `status_code`, `headers`, `content` and `json()`,
+            or None if every attempt failed or the deadline ran out.
+            Responses with other error statuses are returned.
+        """
+
+        if endpoint is None:
+            parsed = urlparse(url)
+            endpoint = parsed.netloc + parsed.path
+        if self._started is None:
+            self._started = time.monotonic()
+
+        for attempt in range(self.retries + 1):
+            remaining = self.remaining()
+            if remaining is not None and remaining <= 0:
+                logger.warning("HTTP deadline exhausted; skipping %s", url)
+                return None
+
+            if limiter is not None:
+                limiter.wait(url)
+                remaining = self.remaining()
+
+            read_timeout = self.read_timeout
+            if remaining is not None:
+                read_timeout = min(read_timeout, remaining)
+
+            wait = None
+            try:
+                response = self._send(url, params, endpoint, read_timeout)
+                if response.status_code not in RETRY_STATUS:
+                    return response
+                reason = 'status %i' % response.status_code
+                wait = retry_after(response)
+
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                reason = type(exc).__name__
+            except requests.RequestException as exc:
+                logger.error("General Error: %s", exc)
+                return None
+
+            if attempt == self.retries:
+                logger.warning("giving up on %s after %i attempts (%s)",
+                               url, attempt + 1, reason)
+                return None
+
+            if wait is None:
+                wait = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            remaining = self.remaining()
+            if wait > self.max_backoff or (remaining is not None and wait >= remaining):
+                logger.warning("giving up on %s: retry in %.1fs is too late (%s)",
+                               url, wait, reason)
+                return None
+
+            logger.debug("retrying %s in %.2fs (%s)", url, wait, reason)
+            time.sleep(wait)
+
+    def get_json(self, url, params=None, endpoint=None, limiter=None, ok_only=False):
+        """GET url and parse the JSON body; None if the request or parsing failed
+
+        With ok_only, a response with a 4xx or 5xx status also gives None
+        instead of its body, e.g. so it is not cached as an answer.
+        """
+
+        response = self.get(url, params, endpoint, limiter)
+        if response is None:
+            return None
+        if ok_only and response.status_code >= 400:
+            logger.warning("status %i from %s", response.status_code, url)
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            logger.error("response from %s is not JSON (status %i)",
+                         url, response.status_code)
+            return None
+
+    def connections(self):
+        """Requests sent and connections opened by the HTTP/1.1 pools
+
+        Returns:
+            dict with keys 'requests', 'connections' and 'reused', or None
+            over HTTP/2
+        """
+
+        if self.session is None:
+            return None
+        sent = opened = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                sent += pools[key].num_requests
+                opened += pools[key].num_connections
+        return {'requests': sent, 'connections': opened, 'reused': sent - opened}
+
+    def log_metrics(self):
+        """Log connection reuse, and bytes and latencies per endpoint"""
+
+        connections = self.connections()
+        if connections and connections['requests']:
+            logger.info("http: %(requests)i requests over %(connections)i "
+                        "connections (%(reused)i reused)", connections)
+
+        for endpoint, stats in sorted(self.metrics.summary().items()):
+            histogram = ', '.join('%s: %i' % ('<=%gs' % bound if bound != float('inf')
+                                              else '>%gs' % LATENCY_BUCKETS[-2], count)
+                                  for bound, count in zip(LATENCY_BUCKETS, stats['histogram'])
+                                  if count)
+            logger.info("http %s: %i requests, %i errors, %.1f KB received "
+                        "(%.1f KB decoded), mean %.0f ms [%s]",
+                        endpoint, stats['requests'], stats['errors'],
+                        stats['wire_bytes'] / 1024, stats['body_bytes'] / 1024,
+                        1000 * stats['seconds'] / stats['requests'], histogram)
+
+    def close(self):
+        """Closes pooled connections"""
+
+        if self.session is not None:
+            self.session.close()
+        if self.httpx_client is not None:
+            self.httpx_client.close()
+
+
+class RateLimiter:
+    """Thread-safe limit on how often requests are sent to each host"""
+
+    def __init__(self, rate=None):
+        """
+        Args:
+            rate (float): most requests per second to any one host;
+                None or 0 for no limit
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_time = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Block until the next request to url's host is allowed"""
+
+        if not self.interval:
+            return
+
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time.get(host, now))
+            self._next_time[host] = start + self.interval
+
+        if start > now:
+            time.sleep(start - now)
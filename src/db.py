@@ -3,40 +3,95 @@
 Classes which set up database:
 Wiki()
 News()
+IngestVersion()
+ProcessedNews()
 WikiNewsManager()
 
 Orchestration function to set up database:
 create_db()
 
-Helper function for create_db():
+Function to connect a multi-threaded reader such as the app:
+create_pooled_engine()
+
+Helper functions for create_db():
 delete_if_exists()
+create_missing_indexes()
+
+Functions to keep history between runs:
+delete_dates()
+apply_retention()
+
+Helper functions for delete_dates() and apply_retention(), run within
+a caller's transaction:
+delete_days()
+prune_history()
+
+Function to keep the full-text search index in sync:
+update_search_index()
 
 Functions to ingest each table:
 ingest_wiki()
 ingest_news()
 
-Orchestration function to ingest all updates():
+Helper functions for bulk ingestion:
+to_mappings()
+stage_rows()
+
+Orchestration functions to ingest all updates():
 ingest()
+ingest_incremental()
+
+Helper functions for ingest() and ingest_incremental():
+prepare_tables()
+split_processed()
+reuse_matches()
+upsert_date()
+mark_processed()
+content_hash()
+
+Helper functions for upsert_date() and mark_processed(), run within
+a caller's transaction:
+upsert_rows()
+record_processed()
+
+Functions to mark and read when data was last ingested:
+stamp_version()
+new_version()
+current_version()
+
+Functions to read the news for the app:
+latest_date()
+latest_news()
+
+Functions to read rows for the JSON API, without building ORM objects:
+news_rows()
+wiki_rows()
 
 Helper functions to render text for eventual html display:
 render_text()
 render_text_news_col()
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
 import logging
 import logging.config
+import re
+import time
 import traceback
+import uuid
 
 import yaml
 import pandas as pd
 from unidecode import unidecode
 import sqlalchemy
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, DateTime, MetaData, Text, Table
+from sqlalchemy import Column, Integer, String, DateTime, MetaData, Text, Table, Index, func, and_, or_
 from sqlalchemy.orm import sessionmaker
 from flask_sqlalchemy import SQLAlchemy
 
+from src.search import get_index
+
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
@@ -46,6 +101,7 @@ class Wiki(Base):
     """Create schema for wiki data"""
 
     __tablename__ = 'wiki'
+    __table_args__ = (Index('ix_wiki_date_news_id', 'date', 'news_id'),)
 
     id = Column(Integer, primary_key=True)
     date = Column(DateTime)
@@ -64,6 +120,7 @@ class News(Base):
     """Create schema for news data"""
 
     __tablename__ = 'news'
+    __table_args__ = (Index('ix_news_date', 'date'),)
 
     date = Column(DateTime, primary_key=True)
     news_id = Column(Integer, primary_key=True)
@@ -77,6 +134,32 @@ class News(Base):
         return '<News id %r>' % self.news_id
 
 
+class IngestVersion(Base):
+    """Create schema for the stamp updated each time data is ingested"""
+
+    __tablename__ = 'ingest_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(String(100), nullable=False)
+    updated = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<IngestVersion %r>' % self.version
+
+
+class ProcessedNews(Base):
+    """Create schema for news articles already run through the pipeline"""
+
+    __tablename__ = 'processed_news'
+
+    url_hash = Column(String(40), primary_key=True)
+    news_hash = Column(String(40), nullable=False)
+    date = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<ProcessedNews %r>' % self.url_hash
+
+
 class WikiNewsManager:
     """Configuration for ingesting data into database"""
 
@@ -140,6 +223,25 @@ class WikiNewsManager:
                      title,
                      news_id)
 
+    def add_bulk(self, model, mappings: list, chunk_size: int = 1000) -> None:
+        """Seeds an existing database with many rows in one transaction
+
+        Args:
+            model (obj): mapped class, `Wiki` or `News`
+            mappings (list): dicts of column name to value, one per row
+            chunk_size (int): rows sent to the database per executemany
+        """
+
+        session = self.session
+        try:
+            stage_rows(session, model, mappings, bulk=True, chunk_size=chunk_size)
+            session.commit()
+        except:
+            session.rollback()
+            raise
+        logger.debug("%i rows added to db table %s",
+                     len(mappings), model.__tablename__)
+
 
 def delete_if_exists(engine_string, table_name) -> None:
     """Deletes rows in table to make way for new daily data
@@ -170,9 +272,42 @@ def delete_if_exists(engine_string, table_name) -> None:
             session.rollback()
 
 
-def create_db(engine_string: str) -> None:
+def create_pooled_engine(engine_string, pool_size=4, max_overflow=0,
+                         pool_pre_ping=True, pool_recycle=3600):
+    """Engine whose connection pool is shared by the threads of one process
+
+    Args:
+        engine_string (str): engine string referring to database
+        pool_size (int): connections kept open; one per thread. Defaults to 4
+        max_overflow (int): extra connections opened under load. Defaults to 0
+        pool_pre_ping (bool): test connections before use, so ones dropped
+            by the server are replaced. Defaults to True
+        pool_recycle (int): seconds before a connection is replaced; keep
+            below the server's idle timeout. Defaults to 3600
+
+    Returns:
+        obj `sqlalchemy.engine.Engine`
+    """
+
+    options = {'pool_pre_ping': pool_pre_ping,
+               'pool_recycle': pool_recycle}
+    if engine_string.startswith('sqlite'):
+        # file databases get a new connection per checkout in SQLAlchemy 1.3
+        options['connect_args'] = {'check_same_thread': False}
+    else:
+        options['pool_size'] = pool_size
+        options['max_overflow'] = max_overflow
+
+    return sqlalchemy.create_engine(engine_string, **options)
+
+
+def create_db(engine_string: str, truncate: bool = True) -> None:
     """Create database from provided engine string
     sqlite or rds instance engine
+
+    Args:
+        engine_string (str): engine string referring to database
+        truncate (bool): delete existing wiki and news rows. Defaults to True
     """
     if 'aws.com' in engine_string:
         logger.debug("connecting to AWS engine string")
@@ -181,43 +316,374 @@ def create_db(engine_string: str) -> None:
 
     engine = sqlalchemy.create_engine(engine_string)
 
-    delete_if_exists(engine_string, 'wiki')
-    delete_if_exists(engine_string, 'news')
+    if truncate:
+        delete_if_exists(engine_string, 'wiki')
+        delete_if_exists(engine_string, 'news')
 
     Base.metadata.create_all(engine)
+    create_missing_indexes(engine)
+
+    search_index = get_index(engine)
+    if search_index is not None:
+        search_index.create(engine)
     logger.info("Database created.")
 
 
-def ingest_wiki(wiki_df, engine_string) -> None:
+def update_search_index(engine_string, dates) -> None:
+    """Re-index the news of the given dates for search; drops deleted days
+
+    Args:
+        engine_string (str): engine string referring to database
+        dates (list): '%b-%d-%Y' dates that were ingested or compacted
+    """
+
+    engine = sqlalchemy.create_engine(engine_string)
+    search_index = get_index(engine)
+    if search_index is None:
+        return
+
+    start = time.perf_counter()
+    search_index.create(engine)
+    search_index.update(engine, [datetime.strptime(date, '%b-%d-%Y')
+                                 for date in set(dates)])
+    logger.info("search index updated in %.2fs", time.perf_counter() - start)
+
+
+def delete_dates(engine_string, dates) -> None:
+    """Deletes wiki and news rows for the given dates, so a day can be re-ingested
+
+    Args:
+        engine_string (str): engine string referring to database
+        dates (list): '%b-%d-%Y' dates
+    """
+
+    if not len(dates):
+        return
+
+    db_manager = WikiNewsManager(app=None, engine_string=engine_string)
+    session = db_manager.session
+    try:
+        delete_days(session, dates)
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        db_manager.close()
+
+
+def delete_days(session, dates) -> None:
+    """Deletes wiki and news rows for the given dates without committing
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+        dates (list): '%b-%d-%Y' dates
+    """
+
+    days = [datetime.strptime(date, '%b-%d-%Y') for date in set(dates)]
+    if not days:
+        return
+
+    wiki = session.query(Wiki).filter(Wiki.date.in_(days)). \
+        delete(synchronize_session=False)
+    news = session.query(News).filter(News.date.in_(days)). \
+        delete(synchronize_session=False)
+    logger.debug('deleted %i wiki and %i news rows for %s',
+                 wiki, news, ', '.join(sorted(set(dates))))
+
+
+def apply_retention(engine_string, keep_days=None, compact_days=None) -> None:
+    """Drops old days and compacts recent-but-not-latest ones
+
+    Ages are counted back from the latest date in the database, not from
+    today, so a database that stops being updated keeps its history.
+
+    Args:
+        engine_string (str): engine string referring to database
+        keep_days (int, optional): days of history to keep; older wiki,
+            news and processed_news rows are deleted. None keeps every
+            day. Defaults to None
+        compact_days (int, optional): days kept in full; older wiki rows
+            keep their title and url but drop the extract and image, and
+            their articles are no longer reused as processed. None
+            compacts nothing. Defaults to None
+    """
+
+    db_manager = WikiNewsManager(app=None, engine_string=engine_string)
+    session = db_manager.session
+    try:
+        compacted = prune_history(session, keep_days, compact_days)
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        db_manager.close()
+
+    update_search_index(engine_string, compacted)
+
+
+def prune_history(session, keep_days=None, compact_days=None) -> list:
+    """apply_retention() within an open transaction, without committing
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+        keep_days (int, optional): see apply_retention()
+        compact_days (int, optional): see apply_retention()
+
+    Returns:
+        list: '%b-%d-%Y' dates whose wiki rows were compacted, to be
+            re-indexed for search
+    """
+
+    latest = latest_date(session)
+    if latest is None:
+        return []
+
+    if keep_days is not None:
+        cutoff = latest - timedelta(days=keep_days - 1)
+        wiki = session.query(Wiki).filter(Wiki.date < cutoff). \
+            delete(synchronize_session=False)
+        news = session.query(News).filter(News.date < cutoff). \
+            delete(synchronize_session=False)
+        # articles whose rows are gone cannot be reused by reuse_matches()
+        processed = session.query(ProcessedNews). \
+            filter(ProcessedNews.date < cutoff). \
+            delete(synchronize_session=False)
+        logger.info('retention: deleted %i wiki, %i news and %i processed_news '
+                    'rows before %s', wiki, news, processed,
+                    cutoff.strftime('%b-%d-%Y'))
+
+    compacted = []
+    if compact_days is not None:
+        cutoff = latest - timedelta(days=compact_days - 1)
+        compacted = [day.strftime('%b-%d-%Y') for day, in
+                     session.query(Wiki.date).distinct().
+                     filter(Wiki.date < cutoff, Wiki.wiki != '')]
+        wiki = session.query(Wiki). \
+            filter(Wiki.date < cutoff, Wiki.wiki != ''). \
+            update({Wiki.wiki: '', Wiki.wiki_image: None},
+                   synchronize_session=False)
+        # reuse_matches() would copy the blanked extracts into new rows
+        processed = session.query(ProcessedNews). \
+            filter(ProcessedNews.date < cutoff). \
+            delete(synchronize_session=False)
+        logger.info('retention: compacted %i wiki rows and dropped %i '
+                    'processed_news rows before %s', wiki, processed,
+                    cutoff.strftime('%b-%d-%Y'))
+    return compacted
+
+
+def create_missing_indexes(engine) -> None:
+    """Adds indexes to tables created before the index was in the schema
+
+    Args:
+        engine (obj `sqlalchemy.engine.Engine`): engine for database
+    """
+    inspector = sqlalchemy.inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.debug('creating index %s', index.name)
+                index.create(engine)
+
+
+def latest_news(session, n_news=20, date=None):
+    """Top news for the most recent date, each with its wiki matches
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+        n_news (int): most news articles to return. Defaults to 20
+        date (obj `datetime.datetime`, optional): date to read instead
+            of the most recent one. Defaults to None
+
+    Returns:
+        tuple: date (None if the tables are empty) and a list of
+            (`News`, list of `Wiki`) pairs ordered by news_id
+    """
+
+    if date is None:
+        date = latest_date(session)
+    if date is None:
+        return None, []
+
+    news = session.query(News). \
+        filter(News.date == date). \
+        order_by(News.news_id). \
+        limit(n_news).all()
+
+    wiki = session.query(Wiki). \
+        filter(Wiki.date == date,
+               Wiki.news_id.in_([n.news_id for n in news])). \
+        order_by(Wiki.id).all()
+
+    grouped = {}
+    for w in wiki:
+        grouped.setdefault(w.news_id, []).append(w)
+
+    return date, [(n, grouped.get(n.news_id, [])) for n in news]
+
+
+def latest_date(session):
+    """Most recent date with news, or None if the table is empty
+
+    A max() over the indexed date column; reads one index entry
+    however many days of history are kept.
+    """
+
+    return session.query(func.max(News.date)).scalar()
+
+
+NEWS_FIELDS = ['date', 'news_id', 'headline', 'news', 'news_dis', 'news_image', 'news_url']
+WIKI_FIELDS = ['id', 'date', 'news_id', 'entity', 'title', 'wiki', 'wiki_url', 'wiki_image']
+
+
+def news_rows(session, fields, after=None, limit=20, date=None):
+    """News rows with only the given columns, newest date first; keyset paginated
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+        fields (list): columns from NEWS_FIELDS to return
+        after (tuple, optional): (date, news_id) of the last row of the
+            previous page. Defaults to None
+        limit (int): most rows to return. Defaults to 20
+        date (obj `datetime.datetime`, optional): only return this date
+
+    Returns:
+        tuple: list of row tuples with attributes named after fields, and
+            the (date, news_id) to pass as after for the next page, or None
+    """
+
+    keys = ['date', 'news_id']
+    query = session.query(*[getattr(News, field)
+                            for field in dict.fromkeys(keys + fields)])
+    if date is not None:
+        query = query.filter(News.date == date)
+    if after is not None:
+        after_date, after_id = after
+        query = query.filter(or_(News.date < after_date,
+                                 and_(News.date == after_date, News.news_id > after_id)))
+
+    rows = query.order_by(News.date.desc(), News.news_id).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], (rows[limit - 1].date, rows[limit - 1].news_id)
+    return rows, None
+
+
+def wiki_rows(session, date, news_id, fields, after=None, limit=20):
+    """Wiki matches of one news article with only the given columns; keyset paginated
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+        date (obj `datetime.datetime`): date of the news article
+        news_id (int): news_id of the news article
+        fields (list): columns from WIKI_FIELDS to return
+        after (int, optional): id of the last row of the previous page
+        limit (int): most rows to return. Defaults to 20
+
+    Returns:
+        tuple: list of row tuples with attributes named after fields, and
+            the id to pass as after for the next page, or None
+    """
+
+    query = session.query(*[getattr(Wiki, field)
+                            for field in dict.fromkeys(['id'] + fields)]). \
+        filter(Wiki.date == date, Wiki.news_id == news_id)
+    if after is not None:
+        query = query.filter(Wiki.id > after)
+
+    rows = query.order_by(Wiki.id).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+def to_mappings(data, columns) -> list:
+    """Rows of data as dicts for `bulk_insert_mappings`
+
+    Args:
+        data (obj `pandas.DataFrame`): first column is a '%b-%d-%Y' date
+        columns (list): column names in the database, in the order of data
+
+    Returns:
+        list: one dict per row
+    """
+
+    mappings = []
+    for row in data.itertuples(index=False, name=None):
+        mapping = dict(zip(columns, row))
+        mapping[columns[0]] = datetime.strptime(row[0], '%b-%d-%Y')
+        mappings.append(mapping)
+    return mappings
+
+
+def stage_rows(session, model, mappings, bulk=False, chunk_size=1000) -> None:
+    """Adds rows to the session's transaction without committing
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+        model (obj): mapped class, `Wiki` or `News`
+        mappings (list): dicts of column name to value, one per row
+        bulk (bool): insert with executemany instead of ORM objects.
+            Defaults to False
+        chunk_size (int): rows sent to the database per executemany when
+            bulk. Defaults to 1000
+    """
+
+    if bulk:
+        for start in range(0, len(mappings), chunk_size):
+            session.bulk_insert_mappings(model, mappings[start:start + chunk_size])
+    else:
+        session.add_all(model(**mapping) for mapping in mappings)
+
+
+def ingest_wiki(wiki_df, engine_string, bulk=False, chunk_size=1000) -> None:
     """Ingest wiki dataframe to database
 
     Args:
         wiki_df (obj `pandas.DataFrame`): with the following columns
             date, news_id, title, wiki, url, image
         engine_string (str): engine string for database
+        bulk (bool): insert all rows in one transaction instead of one
+            transaction per row. Defaults to False
+        chunk_size (int): rows per executemany when bulk. Defaults to 1000
     """
 
     db_manager = WikiNewsManager(app=None, engine_string=engine_string)
-    for _, row in wiki_df.iterrows():
-        date, news_id, title, wiki, url, image = row
-        db_manager.add_wiki(date, news_id, title, wiki, url, image)
+    if bulk:
+        mappings = to_mappings(wiki_df, ['date', 'news_id', 'title',
+                                         'wiki', 'wiki_url', 'wiki_image'])
+        db_manager.add_bulk(Wiki, mappings, chunk_size)
+    else:
+        for _, row in wiki_df.iterrows():
+            date, news_id, title, wiki, url, image = row
+            db_manager.add_wiki(date, news_id, title, wiki, url, image)
     logger.info("%i rows added to 'wiki' table", len(wiki_df))
     db_manager.close()
 
 
-def ingest_news(news_df, engine_string) -> None:
+def ingest_news(news_df, engine_string, bulk=False, chunk_size=1000) -> None:
     """Ingest news dataframe to database
 
     Args:
         news_df (obj `pandas.DataFrame`): with the following columns
             date, news_id, headline, news, image, url, news_dis
         engine_string (str): engine string for database
+        bulk (bool): insert all rows in one transaction instead of one
+            transaction per row. Defaults to False
+        chunk_size (int): rows per executemany when bulk. Defaults to 1000
     """
 
     db_manager = WikiNewsManager(app=None, engine_string=engine_string)
-    for _, row in news_df.iterrows():
-        date, news_id, headline, news, image, url, news_dis = row
-        db_manager.add_news(date, news_id, headline, news, news_dis, image, url)
+    if bulk:
+        mappings = to_mappings(news_df, ['date', 'news_id', 'headline', 'news',
+                                         'news_image', 'news_url', 'news_dis'])
+        db_manager.add_bulk(News, mappings, chunk_size)
+    else:
+        for _, row in news_df.iterrows():
+            date, news_id, headline, news, image, url, news_dis = row
+            db_manager.add_news(date, news_id, headline, news, news_dis, image, url)
     logger.info("%i rows  added to 'news' table", len(news_df))
     db_manager.close()
 
@@ -234,24 +700,406 @@ def ingest(joined_df, conf, engine_string) -> None:
             args['news']['raw_columns']
             args['wiki']['raw_columns']
             args['render']
+            args['ingest']['bulk']
+            args['ingest']['chunk_size']
+            args['history']['append']
+            args['history']['keep_days']
+            args['history']['compact_days']
+
+    The delete of re-run days, the inserts, retention and the version stamp
+    share one transaction, so a failed ingest leaves the previous data and
+    readers never see a day half replaced.
     """
 
+    wiki_df, news_df = prepare_tables(joined_df, conf)
+
+    db_manager = WikiNewsManager(app=None, engine_string=engine_string)
+    session = db_manager.session
+    try:
+        if conf['history']['append']:
+            # re-running a day replaces it; other days are kept
+            delete_days(session, news_df['date'])
+
+        logger.debug('wiki dataframe to ingest has %i rows', len(wiki_df))
+        stage_rows(session, Wiki,
+                   to_mappings(wiki_df, ['date', 'news_id', 'title',
+                                         'wiki', 'wiki_url', 'wiki_image']),
+                   **conf['ingest'])
+
+        logger.debug('news dataframe to ingest has %i rows', len(news_df))
+        stage_rows(session, News,
+                   to_mappings(news_df, ['date', 'news_id', 'headline', 'news',
+                                         'news_image', 'news_url', 'news_dis']),
+                   **conf['ingest'])
+
+        compacted = []
+        if conf['history']['append']:
+            compacted = prune_history(session,
+                                      keep_days=conf['history']['keep_days'],
+                                      compact_days=conf['history']['compact_days'])
+
+        version = new_version(session)
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        db_manager.close()
+    logger.info("%i wiki and %i news rows ingested; version set to %s",
+                len(wiki_df), len(news_df), version)
+
+    update_search_index(engine_string, list(news_df['date']) + compacted)
+
+
+def prepare_tables(joined_df, conf):
+    """Split filtered data into the wiki and news rows to ingest
+
+    Args:
+        joined_df (obj `pandas.DataFrame`): output from filter_data()
+        conf (dict): yaml-style config; see ingest()
+
+    Returns:
+        tuple: wiki and news dataframes in the column order
+            ingest_wiki() and ingest_news() expect
+    """
+
+    news_columns = conf['news']['raw_columns'] + [conf['render']['new_column']]
+    if joined_df.empty:
+        return (pd.DataFrame(columns=conf['wiki']['raw_columns']),
+                pd.DataFrame(columns=news_columns))
+
+    # join_data() keeps text as categories; plain strings are needed for fillna
+    joined_df = joined_df.astype({column: object for column
+                                  in joined_df.select_dtypes('category').columns})
     joined_df = joined_df.fillna('')
 
     wiki_df = joined_df[conf['wiki']['raw_columns']]
     wiki_df = wiki_df.drop_duplicates(['date', 'news_id', 'title'])
-    logger.debug('wiki dataframe to ingest has %i rows', len(wiki_df))
-    ingest_wiki(wiki_df, engine_string)
 
     news_df = joined_df[conf['news']['raw_columns']].drop_duplicates()
     news_df = render_news_col(news_df, joined_df, conf['render'])
-    logger.debug('news dataframe to ingest has %i rows', len(news_df))
-    ingest_news(news_df, engine_string)
+    return wiki_df, news_df[news_columns]
+
+
+def ingest_incremental(joined_df, news_table, conf, engine_string,
+                       reused_wiki=None, reused_news=None) -> None:
+    """Orchestration function; upsert one run's rows instead of replacing the tables
+
+    Only news articles whose rows changed are rewritten, and every article
+    in news_table is marked as processed for later runs. The upsert, the
+    marks, retention and the version stamp share one transaction, as in
+    ingest().
+
+    Args:
+        joined_df (obj `pandas.DataFrame`): output from filter_data() for
+            the articles processed in this run
+        news_table (obj `pandas.DataFrame`): articles of this run to mark
+            as processed; output from load_news(), less any whose
+            wikipedia lookups failed
+        conf (dict): yaml-style config; see ingest()
+        engine_string (str): engine string for database
+        reused_wiki (obj `pandas.DataFrame`, optional): from reuse_matches()
+        reused_news (obj `pandas.DataFrame`, optional): from reuse_matches()
+    """
+
+    wiki_df, news_df = prepare_tables(joined_df, conf)
+    if reused_wiki is not None:
+        wiki_df = pd.concat([wiki_df, reused_wiki], ignore_index=True)
+    if reused_news is not None:
+        news_df = pd.concat([news_df, reused_news], ignore_index=True)
+
+    date = date_today()
+    db_manager = WikiNewsManager(app=None, engine_string=engine_string)
+    session = db_manager.session
+    try:
+        upsert_rows(session, wiki_df, news_df, date)
+        record_processed(session, news_table, date)
+        compacted = prune_history(session,
+                                  keep_days=conf['history']['keep_days'],
+                                  compact_days=conf['history']['compact_days'])
+        version = new_version(session)
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        db_manager.close()
+    logger.info("ingest version set to %s", version)
+
+    update_search_index(engine_string, [date] + compacted)
+
+
+def date_today():
+    """today's date in the string format stamped by join_data()"""
+
+    return datetime.today().strftime('%b-%d-%Y')
+
+
+def content_hash(text):
+    """SHA-1 hex digest of text"""
+
+    return hashlib.sha1(str(text).encode('utf-8')).hexdigest()
+
+
+def split_processed(news_table, engine_string):
+    """Split articles into those not yet processed and those already processed
+
+    An article counts as processed when its news_url was marked by
+    mark_processed() and its news text has not changed since.
+
+    Args:
+        news_table (obj `pandas.DataFrame`): output from load_news()
+        engine_string (str): engine string for database
+
+    Returns:
+        tuple: dataframes of new or changed articles and of processed articles
+    """
+
+    db_manager = WikiNewsManager(app=None, engine_string=engine_string)
+    processed = {(row.url_hash, row.news_hash)
+                 for row in db_manager.session.query(ProcessedNews)}
+    db_manager.close()
+
+    keys = zip(news_table['news_url'].map(content_hash),
+               news_table['news'].map(content_hash))
+    is_processed = [key in processed for key in keys]
+
+    seen = news_table.loc[is_processed]
+    new = news_table.loc[[not flag for flag in is_processed]]
+    logger.info("%i new or changed articles, %i already processed",
+                len(new), len(seen))
+    return new, seen
+
+
+def reuse_matches(seen, date, engine_string):
+    """Stored wiki and news rows for processed articles, re-keyed to this run
+
+    Args:
+        seen (obj `pandas.DataFrame`): processed articles from split_processed()
+        date (str): this run's date, '%b-%d-%Y'
+        engine_string (str): engine string for database
+
+    Returns:
+        tuple: wiki and news dataframes in the column order
+            ingest_wiki() and ingest_news() expect
+    """
+
+    db_manager = WikiNewsManager(app=None, engine_string=engine_string)
+    session = db_manager.session
+    news_ids = dict(zip(seen['news_url'], seen['news_id']))
+
+    # most recent stored row for each url
+    stored = {}
+    for n in session.query(News). \
+            filter(News.news_url.in_(list(news_ids))). \
+            order_by(News.date):
+        stored[n.news_url] = n
+
+    # wiki rows of every stored day of these urls in one query; only the
+    # most recent day's are kept
+    matches = {}
+    for w, url in session.query(Wiki, News.news_url). \
+            join(News, and_(News.date == Wiki.date, News.news_id == Wiki.news_id)). \
+            filter(News.news_url.in_(list(stored))). \
+            order_by(Wiki.id):
+        if (w.date, w.news_id) == (stored[url].date, stored[url].news_id):
+            matches.setdefault(url, []).append(w)
+    db_manager.close()
+
+    news_rows = []
+    wiki_rows = []
+    for url, n in stored.items():
+        news_rows.append([date, news_ids[url], n.headline, n.news,
+                          n.news_image, n.news_url, n.news_dis])
+        for w in matches.get(url, []):
+            wiki_rows.append([date, news_ids[url], w.title, w.wiki,
+                              w.wiki_url, w.wiki_image])
+
+    logger.info("reusing stored matches for %i articles", len(news_rows))
+    return (pd.DataFrame(wiki_rows, columns=['date', 'news_id', 'title', 'wiki',
+                                             'wiki_url', 'wiki_image']),
+            pd.DataFrame(news_rows, columns=['date', 'news_id', 'headline', 'news',
+                                             'news_image', 'news_url', 'news_dis']))
+
+
+def upsert_date(wiki_df, news_df, date, engine_string) -> None:
+    """Make the rows stored for one date match wiki_df and news_df
+
+    News articles whose news and wiki rows are unchanged are left alone;
+    changed ones are rewritten and ones no longer present are deleted,
+    all in one transaction.
+
+    Args:
+        wiki_df (obj `pandas.DataFrame`): see prepare_tables()
+        news_df (obj `pandas.DataFrame`): see prepare_tables()
+        date (str): '%b-%d-%Y'
+        engine_string (str): engine string for database
+    """
+
+    db_manager = WikiNewsManager(app=None, engine_string=engine_string)
+    session = db_manager.session
+    try:
+        upsert_rows(session, wiki_df, news_df, date)
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        db_manager.close()
+
+
+def upsert_rows(session, wiki_df, news_df, date) -> None:
+    """upsert_date() within an open transaction, without committing
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+        wiki_df (obj `pandas.DataFrame`): see prepare_tables()
+        news_df (obj `pandas.DataFrame`): see prepare_tables()
+        date (str): '%b-%d-%Y'
+    """
+
+    day = datetime.strptime(date, '%b-%d-%Y')
+    wiki_columns = ['date', 'news_id', 'title', 'wiki', 'wiki_url', 'wiki_image']
+    news_columns = ['date', 'news_id', 'headline', 'news',
+                    'news_image', 'news_url', 'news_dis']
+
+    new_wiki = {}
+    for mapping in to_mappings(wiki_df, wiki_columns):
+        new_wiki.setdefault(mapping['news_id'], []).append(mapping)
+    new_news = {mapping['news_id']: mapping
+                for mapping in to_mappings(news_df, news_columns)}
+
+    old_wiki = {}
+    for w in session.query(Wiki).filter(Wiki.date == day).order_by(Wiki.id):
+        old_wiki.setdefault(w.news_id, []).append(
+            {column: getattr(w, column) for column in wiki_columns})
+    old_news = {n.news_id: {column: getattr(n, column) for column in news_columns}
+                for n in session.query(News).filter(News.date == day)}
+
+    changed = [news_id for news_id, mapping in new_news.items()
+               if old_news.get(news_id) != mapping
+               or old_wiki.get(news_id, []) != new_wiki.get(news_id, [])]
+    removed = [news_id for news_id in old_news if news_id not in new_news]
+
+    stale = changed + removed
+    if stale:
+        session.query(Wiki). \
+            filter(Wiki.date == day, Wiki.news_id.in_(stale)). \
+            delete(synchronize_session=False)
+        session.query(News). \
+            filter(News.date == day, News.news_id.in_(stale)). \
+            delete(synchronize_session=False)
+    session.bulk_insert_mappings(News, [new_news[news_id] for news_id in changed])
+    session.bulk_insert_mappings(Wiki, [mapping for news_id in changed
+                                        for mapping in new_wiki.get(news_id, [])])
+
+    logger.info("upserted %i news articles for %s (%i unchanged, %i removed)",
+                len(changed), date, len(new_news) - len(changed), len(removed))
+
+
+def mark_processed(news_table, date, engine_string) -> None:
+    """Record each article's news_url and news text as processed
+
+    Args:
+        news_table (obj `pandas.DataFrame`): output from load_news()
+        date (str): '%b-%d-%Y'
+        engine_string (str): engine string for database
+    """
+
+    db_manager = WikiNewsManager(app=None, engine_string=engine_string)
+    session = db_manager.session
+    try:
+        record_processed(session, news_table, date)
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        db_manager.close()
+
+
+def record_processed(session, news_table, date) -> None:
+    """mark_processed() within an open transaction, without committing
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+        news_table (obj `pandas.DataFrame`): output from load_news()
+        date (str): '%b-%d-%Y'
+    """
+
+    day = datetime.strptime(date, '%b-%d-%Y')
+    # one mapping per url; a url listed twice keeps its last text
+    mappings = {}
+    for url, news in zip(news_table['news_url'], news_table['news']):
+        url_hash = content_hash(url)
+        mappings[url_hash] = {'url_hash': url_hash,
+                              'news_hash': content_hash(news),
+                              'date': day}
+
+    existing = {url_hash for url_hash, in session.query(ProcessedNews.url_hash).
+                filter(ProcessedNews.url_hash.in_(list(mappings)))}
+    session.bulk_update_mappings(ProcessedNews, [mapping for url_hash, mapping
+                                                 in mappings.items()
+                                                 if url_hash in existing])
+    session.bulk_insert_mappings(ProcessedNews, [mapping for url_hash, mapping
+                                                 in mappings.items()
+                                                 if url_hash not in existing])
+
+
+def stamp_version(engine_string) -> None:
+    """Record a new ingest version so cached pages are invalidated
+
+    Args:
+        engine_string (str): engine string for database
+    """
+
+    db_manager = WikiNewsManager(app=None, engine_string=engine_string)
+    version = new_version(db_manager.session)
+    db_manager.session.commit()
+    logger.info("ingest version set to %s", version)
+    db_manager.close()
+
+
+def new_version(session):
+    """Stamp a new ingest version within an open transaction, without committing
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+
+    Returns:
+        str: the new version
+    """
+
+    version = IngestVersion(id=1,
+                            version=uuid.uuid4().hex,
+                            updated=datetime.utcnow().replace(microsecond=0))
+    session.merge(version)
+    return version.version
+
+
+def current_version(session):
+    """Latest ingest version
+
+    Args:
+        session (obj `sqlalchemy.orm.Session`): session for database
+
+    Returns:
+        obj `IngestVersion`: None if nothing has been ingested since the
+            version table was added
+    """
+
+    # query.get() would return the row already in the session's identity map
+    # without reading it again, hiding ingests made since
+    return session.query(IngestVersion).filter_by(id=1).populate_existing().one_or_none()
 
 
 def render_text(text, entities):
     """Add html class "highlight" to substrings in the text
 
+    All entities are matched in a single pass with one alternation regex,
+    longest first, so an entity inside a longer one (or a repeated entity)
+    is highlighted once rather than producing nested spans.
+
     Args:
         text (str): text with substrings that need to be highlighted
         entities (array-like): list of substrings to highlight
@@ -259,11 +1107,14 @@ def render_text(text, entities):
     Returns:
         str: text formatted for html
     """
-    for ent in entities:
-        if ' (organization)' in ent:
-            ent = ent.replace(' (organization)', '')
-        text = text.replace(ent, f'<span class="highlight">{ent}</span>')
-    return text
+    entities = {ent.replace(' (organization)', '') for ent in entities}
+    entities = sorted(filter(None, entities), key=lambda ent: (-len(ent), ent))
+    if not entities:
+        return text
+
+    pattern = re.compile('|'.join(map(re.escape, entities)))
+    return pattern.sub(lambda match: f'<span class="highlight">{match.group(0)}</span>',
+                       text)
 
 
 def render_news_col(news_df, df, args):
@@ -281,10 +1132,9 @@ def render_news_col(news_df, df, args):
         obj `pandas.DataFrame`: with column 'news_dis' formatted for html
     """
 
-    news_df[args['new_column']] = ''
+    entities = df.groupby('news_id')[args['entity_column']].agg(list).to_dict()
 
-    for i, row in news_df.iterrows():
-        entities = df.loc[df['news_id'] == row['news_id'], args['entity_column']]. \
-            drop_duplicates().values
-        news_df.loc[i, args['new_column']] = render_text(row['news'], entities)
+    news_df[args['new_column']] = [
+        render_text(text, entities.get(news_id, []))
+        for news_id, text in zip(news_df['news_id'], news_df[args['raw_column']])]
     return news_df
@@ -1,24 +1,29 @@
 """Module load and process news API data
 
 Orchestration function:
-    load_news(news_top_conf, source_words)
+    load_news(news_top_conf, source_words, client)
 
 Helper functions for cleaning data:
     create_id_col(data, id_col)
-    remove_stopwords(text, stopwords)
+    source_pattern(source_words)
+    remove_stopwords(text, pattern)
 
-Helper function for making API calls:
-    news_top(conf, timeout)
+Helper functions for making API calls:
+    news_top(conf, client)
+    news_queries(conf)
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import logging.config
+import math
 import os
-import urllib3
+import re
 
-import requests
 import pandas as pd
 
+from src.client import HttpClient, RateLimiter
+
 logging.config.fileConfig("config/logging/local.conf",
                           disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
@@ -26,12 +31,15 @@ logging.getLogger("requests").setLevel(logging.ERROR)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 
-def load_news(news_top_conf, source_words=[]):
+def load_news(news_top_conf, source_words=(), client=None):
     """Orchestration function which loads daily headlines from News API
 
     Args:
         news_top_conf (dict): configuration for news_top()
-        source_words (list, optional): publication-related words to remove. Defaults to []
+        source_words (list, optional): publication-related words to remove,
+            on top of the source names in the response; not modified. Defaults to ()
+        client (obj `src.client.HttpClient`, optional): client for the
+            News API; a default one is made if None. Defaults to None
 
     Returns:
         (obj `pandas.DataFrame`)
@@ -39,7 +47,20 @@ def load_news(news_top_conf, source_words=[]):
 
     logger.info('loading news from API')
 
-    data = news_top(news_top_conf)
+    own_client = client is None
+    if own_client:
+        client = HttpClient()
+    try:
+        data = news_top(news_top_conf, client)
+    finally:
+        if own_client:
+            client.close()
+    if data is None:
+        raise Exception("No response from News API")
+
+    # remove words pertaining to publications with one pattern for all articles
+    pattern = source_pattern(list(source_words) +
+                             [article['source']['name'] for article in data['articles']])
 
     all_headlines = []
     all_news = []
@@ -56,10 +77,7 @@ def load_news(news_top_conf, source_words=[]):
         if article['description'] is not None:
             news += ' ' + article['description']
 
-        # remove words pertaining to publications
-        source_words.append(article['source']['name'])
-        news = remove_stopwords(news, source_words)
-        all_news.append(news)
+        all_news.append(remove_stopwords(news, pattern))
 
     news_table = pd.DataFrame({'headline': all_headlines,
                                'news': all_news,
@@ -81,28 +99,57 @@ def create_id_col(data, id_col):
     return data
 
 
-def remove_stopwords(text, stopwords):
-    """remove publication words"""
+def source_pattern(source_words):
+    """Compile publication words into one alternation, longest first
+
+    Args:
+        source_words (iterable): words to match literally; duplicates and
+            empty or None entries are dropped
+
+    Returns:
+        (obj `re.Pattern`): pattern for remove_stopwords(); None if no words
+    """
+
+    words = sorted({word for word in source_words if word},
+                   key=lambda word: (-len(word), word))
+    if not words:
+        return None
+    return re.compile('|'.join(map(re.escape, words)))
+
+
+def remove_stopwords(text, pattern):
+    """remove publication words matched by a source_pattern() in one pass"""
 
-    for word in stopwords:
-        text = text.replace(word, '')
-    return text
+    if pattern is None:
+        return text
+    return pattern.sub('', text)
 
 
-def news_top(conf, timeout=300):
-    """ Returns `JSON` data with daily news headlines for the US
+def news_top(conf, client):
+    """ Returns `JSON` data with top headlines across countries, categories and pages
+
+    The first page of every query is requested, then the pages left
+    before `totalResults` is reached, up to `max_pages` per query. Requests
+    run on `max_workers` threads under a shared rate limit. Articles
+    found by several queries are kept once, by url, in query order.
 
     Args:
         conf (dict): configuration containing:
             'url': url for `session.get()`
-            'params': params for `session.get()` containing:
-                country (str): country abbreviation (us)
-                pagesize (int): controls number of headlines to consider; 100 is max
+            'params': params for `session.get()` sent with every query:
+                pagesize (int): headlines per page; 100 is max
                 see https://newsapi.org/docs for more params
-        timeout (int): how long to wait for response before timing out; default 300 seconds
+            'countries' (list, optional): country codes, one query each
+            'categories' (list, optional): categories, one query per
+                country and category
+            'max_pages' (int, optional): most pages per query. Defaults to 1
+            'max_workers' (int, optional): concurrent requests. Defaults to 1
+            'rate_limit' (float, optional): most requests per second. Defaults to None
+        client (obj `src.client.HttpClient`): client to send the requests with
 
     Returns:
-        object: `JSON` formatted data
+        object: `JSON` formatted data with 'status', 'totalResults' and
+            'articles'; None if no query got a response
     """
 
     NEWS_API_KEY = os.environ.get('NEWS_API_KEY')
@@ -110,32 +157,70 @@ def news_top(conf, timeout=300):
         logger.error("'NEWS_API_KEY' must be sourced in environment")
         raise Exception('No API key')
 
-    session = requests.Session()
-    url = conf['url']
-    params = conf['params']
-    params['apiKey'] = NEWS_API_KEY
-
-    try:
-        resp = session.get(url=url, params=params, timeout=timeout)
-
-        if resp.json()['status'] == 'error':
-            logger.error("API error: %s", resp.json()['message'])
-            raise Exception("API error")
-        else:
-            return resp.json()
-
-    except requests.ConnectionError as exc:
-        logger.error("Make sure you are connected to Internet.")
-        return None
-
-    except urllib3.exceptions.ReadTimeoutError:
-        logger.warning("Timeout Error after %i seconds", timeout)
-        return None
-
-    except requests.exceptions.ReadTimeout:
-        logger.warning("Timeout Error after %i seconds", timeout)
-        return None
+    queries = news_queries(conf)
+    page_size = int(conf['params'].get('pagesize', 100))
+    max_pages = conf.get('max_pages', 1)
+    limiter = RateLimiter(conf.get('rate_limit'))
+
+    def page(request):
+        params, number = request
+        params = dict(params, apiKey=NEWS_API_KEY, page=number)
+        data = client.get_json(conf['url'], params, endpoint='news_top',
+                               limiter=limiter)
+        if data is not None and data.get('status') == 'error':
+            if number == 1:
+                logger.error("API error: %s", data.get('message'))
+                raise Exception("API error")
+            # e.g. 'maximumResultsReached' on plans with a results cap
+            logger.warning("API error on page %i: %s", number, data.get('message'))
+            return None
+        return data
 
-    except requests.RequestException as exc:
-        logger.error("General Error: %s", str(exc))
-        return None
\ No newline at end of file
+    def n_pages(data):
+        return min(math.ceil(data.get('totalResults', 0) / page_size), max_pages)
+
+    with ThreadPoolExecutor(max_workers=conf.get('max_workers', 1)) as executor:
+        first_pages = list(executor.map(page, [(params, 1) for params in queries]))
+        if all(data is None for data in first_pages):
+            return None
+
+        # the remaining pages of every query, once totalResults is known
+        more = [(i, number) for i, data in enumerate(first_pages) if data is not None
+                for number in range(2, n_pages(data) + 1)]
+        more_pages = executor.map(page, [(queries[i], number) for i, number in more])
+
+        query_pages = [[data] for data in first_pages]
+        for (i, number), data in zip(more, more_pages):
+            query_pages[i].append(data)
+
+    articles = {}
+    for pages in query_pages:
+        for data in pages:
+            if data is None:
+                continue
+            for article in data.get('articles', []):
+                articles.setdefault(article['url'], article)
+
+    logger.info("%i news queries: %i requests, %i unique articles",
+                len(queries), len(first_pages) + len(more), len(articles))
+    return {'status': 'ok',
+            'totalResults': len(articles),
+            'articles': list(articles.values())}
+
+
+def news_queries(conf):
+    """params of each (country, category) query; just conf['params'] if neither is set"""
+
+    countries = conf.get('countries') or [None]
+    categories = conf.get('categories') or [None]
+
+    queries = []
+    for country in countries:
+        for category in categories:
+            params = dict(conf['params'])
+            if country is not None:
+                params['country'] = country
+            if category is not None:
+                params['category'] = category
+            queries.append(params)
+    return queries
@@ -3,39 +3,69 @@
 Orchestration functions:
     load_wiki(news_table, query_conf, content_conf,
               stop_spacy, spacy_model,
-              stop_categories, stop_phrases, n_results)
+              stop_categories, stop_phrases, n_results,
+              spacy_disable, batch_size, n_process,
+              max_workers, rate_limit, titles_per_request, cache,
+              shard_chars, client, return_failed)
     news2entities(news, stop_spacy, spacy_model)
+    news2entities_batch(news, stop_spacy, spacy_model,
+                        spacy_disable, batch_size, n_process, shard_chars)
+    news2entities_parallel(news, stop_spacy, spacy_model,
+                           spacy_disable, batch_size, n_process, shard_chars)
     entities2wiki(entities, query_conf, content_conf,
-                  stop_categories, stop_phrases, n_results)
+                  stop_categories, stop_phrases, n_results,
+                  max_workers, rate_limit, client)
+    fetch_wiki(entities, query_conf, content_conf,
+               n_results, max_workers, rate_limit, titles_per_request, cache,
+               client)
+    match_wiki(entities, searches, pages,
+               stop_categories, stop_phrases, n_results)
+    lookup_failed(entities, searches, pages, n_results)
+    query_succeeded(data)
+
+Helper functions for running spacy:
+    load_spacy(spacy_model, spacy_disable)
+    doc2entities(doc, stop_spacy)
+    shard_texts(texts, shard_chars)
+    ner_shard(texts, stop_spacy, spacy_model, spacy_disable, batch_size)
 
 Helper functions for parsing JSON data:
+    search_titles(articledata, n_results)
+    pages_by_title(query, titles)
     wiki_special_truncate(text)
     wiki_image(data)
 
 Helper functions for making API calls:
-    wiki_query(conf, query, timeout)
-    wiki_page_content(conf, title, timeout)
+    wiki_query(conf, query, client, limiter)
+    wiki_content(conf, title, client, limiter)
+    wiki_contents(conf, titles, client, limiter)
 """
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import logging
 import logging.config
-import signal
-import urllib3
 
-import requests
 import pandas as pd
 import spacy
 
+from src.client import HttpClient, RateLimiter
+
 logging.config.fileConfig("config/logging/local.conf",
                           disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 logging.getLogger("requests").setLevel(logging.ERROR)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
+# spacy models already loaded in this process, keyed by (name, disabled)
+SPACY_MODELS = {}
+
 
 def load_wiki(news_table, query_conf, content_conf,
               stop_spacy=[], spacy_model='en_core_web_sm',
-              stop_categories=[], stop_phrases=[], n_results=1):
+              stop_categories=[], stop_phrases=[], n_results=1,
+              spacy_disable=[], batch_size=50, n_process=1,
+              max_workers=1, rate_limit=None, titles_per_request=20,
+              cache=None, shard_chars=20000, client=None, return_failed=False):
     """Orchestration function which matches news with wikipedia articles
 
     Args:
@@ -48,30 +78,70 @@ def load_wiki(news_table, query_conf, content_conf,
         stop_categories (list, optional): categories to filter out. Defaults to []
         stop_phrases (list, optional): phrases to filter out. Defaults to []
         n_results (int, optional): number of suggested articles to consider. Defaults to 1
+        spacy_disable (list, optional): pipeline components not needed for NER. Defaults to []
+        batch_size (int, optional): headlines per `nlp.pipe` batch. Defaults to 50
+        n_process (int, optional): worker processes for spacy; see
+            news2entities_parallel(). Defaults to 1
+        max_workers (int, optional): concurrent Wikipedia API requests. Defaults to 1
+        rate_limit (float, optional): most requests per second per host. Defaults to None
+        titles_per_request (int, optional): titles per page content request. Defaults to 20
+        cache (obj `src.cache.ResponseCache`, optional): persistent cache of
+            API responses; None to always use the network. Defaults to None
+        shard_chars (int, optional): characters of news per worker task
+            when n_process > 1. Defaults to 20000
+        client (obj `src.client.HttpClient`, optional): client for the
+            Wikipedia API; a default one is made if None. Defaults to None
+        return_failed (bool, optional): also return the news_ids whose
+            lookups did not finish; see lookup_failed(). Defaults to False
 
     Returns:
-        obj `pandas.DataFrame`
+        obj `pandas.DataFrame`, or a tuple of it and a list of news_ids
+            if return_failed
     """
 
     logger.info('matching news with wiki entries from Wikipedia API')
 
-    wiki_data = []
-    for _, row in news_table[['news_id', 'news']].iterrows():
-        news_id, news = row
-
-        logger.info("----Processing '%s...'", news[0:25])
+    all_entities = news2entities_batch(news_table['news'], stop_spacy,
+                                       spacy_model, spacy_disable,
+                                       batch_size, n_process, shard_chars)
 
-        entities = news2entities(news, stop_spacy, spacy_model)
-        wiki_obs = entities2wiki(entities,
+    searches, pages = fetch_wiki([ent for entities in all_entities
+                                  for ent in entities],
                                  query_conf,
                                  content_conf,
-                                 stop_categories,
-                                 stop_phrases,
-                                 n_results)
+                                 n_results,
+                                 max_workers,
+                                 rate_limit,
+                                 titles_per_request,
+                                 cache,
+                                 client)
+
+    wiki_data = []
+    failed = []
+    for news_id, news, entities in zip(news_table['news_id'],
+                                       news_table['news'],
+                                       all_entities):
+
+        logger.info("----Processing '%s...'", news[0:25])
+        if lookup_failed(entities, searches, pages, n_results):
+            failed.append(news_id)
+
+        wiki_obs = match_wiki(entities,
+                              searches,
+                              pages,
+                              stop_categories,
+                              stop_phrases,
+                              n_results)
         wiki_obs['news_id'] = news_id
         wiki_data.append(wiki_obs)
 
-    return pd.concat(wiki_data)
+    if failed:
+        logger.warning("wikipedia lookups failed for %i of %i articles",
+                       len(failed), len(news_table))
+    wiki_df = pd.concat(wiki_data)
+    if return_failed:
+        return wiki_df, failed
+    return wiki_df
 
 
 def news2entities(news, stop_spacy, spacy_model):
@@ -86,8 +156,131 @@ def news2entities(news, stop_spacy, spacy_model):
         (list): list of entities suggested by spacy model
     """
 
-    nlp = spacy.load(spacy_model)
-    doc = nlp(news)
+    nlp = load_spacy(spacy_model)
+    return doc2entities(nlp(news), stop_spacy)
+
+
+def news2entities_batch(news, stop_spacy, spacy_model, spacy_disable=[],
+                        batch_size=50, n_process=1, shard_chars=20000):
+    """Run spacy model over many news texts at once with `nlp.pipe`
+
+    Args:
+        news (array-like): news headlines
+        stop_spacy (array-like): types of entities to ignore
+        spacy_model (str): model name; see https://spacy.io/usage/models
+        spacy_disable (list, optional): pipeline components not needed for NER. Defaults to []
+        batch_size (int, optional): texts per batch. Defaults to 50
+        n_process (int, optional): number of processes; more than 1 runs
+            news2entities_parallel(). Defaults to 1
+        shard_chars (int, optional): see news2entities_parallel(). Defaults to 20000
+
+    Returns:
+        (list): one list of entities per news text, in input order
+    """
+
+    if n_process > 1:
+        return news2entities_parallel(news, stop_spacy, spacy_model, spacy_disable,
+                                      batch_size, n_process, shard_chars)
+
+    nlp = load_spacy(spacy_model, spacy_disable)
+    docs = nlp.pipe(news, batch_size=batch_size)
+    return [doc2entities(doc, stop_spacy) for doc in docs]
+
+
+def news2entities_parallel(news, stop_spacy, spacy_model, spacy_disable=[],
+                           batch_size=50, n_process=2, shard_chars=20000):
+    """Run spacy model over news texts in a pool of worker processes
+
+    The texts are cut into contiguous shards of about shard_chars
+    characters, so long articles make smaller shards and idle workers pick
+    up the next one. Each worker loads the model once, and only the
+    entity lists, not spacy docs, are sent back.
+
+    Args:
+        news (array-like): news headlines
+        stop_spacy (array-like): types of entities to ignore
+        spacy_model (str): model name; see https://spacy.io/usage/models
+        spacy_disable (list, optional): pipeline components not needed for NER. Defaults to []
+        batch_size (int, optional): texts per `nlp.pipe` batch in each worker. Defaults to 50
+        n_process (int, optional): worker processes. Defaults to 2
+        shard_chars (int, optional): characters of news per shard. Defaults to 20000
+
+    Returns:
+        (list): one list of entities per news text, in input order
+    """
+
+    texts = list(news)
+    shards = [texts[start:stop] for start, stop in shard_texts(texts, shard_chars)]
+    logger.info("running spacy over %i texts in %i shards with %i processes",
+                len(texts), len(shards), n_process)
+
+    with ProcessPoolExecutor(max_workers=n_process,
+                             initializer=load_spacy,
+                             initargs=(spacy_model, spacy_disable)) as executor:
+        # map() yields shard results in submission order
+        results = executor.map(ner_shard, shards,
+                               [stop_spacy] * len(shards),
+                               [spacy_model] * len(shards),
+                               [spacy_disable] * len(shards),
+                               [batch_size] * len(shards))
+        return [entities for shard in results for entities in shard]
+
+
+def shard_texts(texts, shard_chars):
+    """Contiguous (start, stop) ranges of texts with about shard_chars characters each
+
+    A text longer than shard_chars gets a shard of its own.
+    """
+
+    shards = []
+    start = 0
+    size = 0
+    for i, text in enumerate(texts):
+        if size and size + len(text) > shard_chars:
+            shards.append((start, i))
+            start, size = i, 0
+        size += len(text)
+    if start < len(texts):
+        shards.append((start, len(texts)))
+    return shards
+
+
+def ner_shard(texts, stop_spacy, spacy_model, spacy_disable, batch_size):
+    """Entities of each text in a shard; runs in a news2entities_parallel() worker"""
+
+    nlp = load_spacy(spacy_model, spacy_disable)
+    return [doc2entities(doc, stop_spacy)
+            for doc in nlp.pipe(texts, batch_size=batch_size)]
+
+
+def load_spacy(spacy_model, spacy_disable=[]):
+    """Load a spacy model once per process; later calls reuse it
+
+    Args:
+        spacy_model (str): model name; see https://spacy.io/usage/models
+        spacy_disable (list, optional): pipeline components to skip. Defaults to []
+
+    Returns:
+        obj `spacy.language.Language`
+    """
+
+    key = (spacy_model, tuple(spacy_disable))
+    if key not in SPACY_MODELS:
+        logger.debug("loading spacy model %s", spacy_model)
+        SPACY_MODELS[key] = spacy.load(spacy_model, disable=spacy_disable)
+    return SPACY_MODELS[key]
+
+
+def doc2entities(doc, stop_spacy):
+    """Entities in a spacy doc, with ' (organization)' added to ORG entities
+
+    Args:
+        doc (obj `spacy.tokens.Doc`): output from a spacy model
+        stop_spacy (array-like): types of entities to ignore
+
+    Returns:
+        (list): list of entities suggested by spacy model
+    """
 
     entities = []
     for ent in doc.ents:
@@ -101,7 +294,8 @@ def news2entities(news, stop_spacy, spacy_model):
 
 
 def entities2wiki(entities, query_conf, content_conf,
-                  stop_categories=[], stop_phrases=[], n_results=1):
+                  stop_categories=[], stop_phrases=[], n_results=1,
+                  max_workers=1, rate_limit=None, client=None):
     """Orchestration function to return clean wikipedia information for a series of entities
 
     Args:
@@ -111,25 +305,144 @@ def entities2wiki(entities, query_conf, content_conf,
         stop_categories (list, optional): categories to filter out. Defaults to []
         stop_phrases (list, optional): phrases to filter out. Defaults to []
         n_results (int, optional): number of suggested articles to consider. Defaults to 1
+        max_workers (int, optional): concurrent Wikipedia API requests. Defaults to 1
+        rate_limit (float, optional): most requests per second per host. Defaults to None
+        client (obj `src.client.HttpClient`, optional): see fetch_wiki()
+
+    Returns:
+        (obj `pandas.DataFrame`): one row per matched wikipedia article
+    """
+
+    searches, pages = fetch_wiki(entities, query_conf, content_conf,
+                                 n_results, max_workers, rate_limit,
+                                 client=client)
+    return match_wiki(entities, searches, pages,
+                      stop_categories, stop_phrases, n_results)
+
+
+def fetch_wiki(entities, query_conf, content_conf, n_results=1,
+               max_workers=1, rate_limit=None, titles_per_request=20,
+               cache=None, client=None):
+    """Fan out search queries for all entities, then content lookups for all suggested titles
+
+    Each unique entity and title is requested once, by a pool of
+    `max_workers` threads sharing a per-host RateLimiter. Page content is
+    requested `titles_per_request` titles at a time.
+
+    Args:
+        entities (array like): entities to search for; may repeat
+        query_conf (dict): configuration for wiki_query()
+        content_conf (dict): configuration for wiki_contents()
+        n_results (int, optional): number of suggested articles to consider. Defaults to 1
+        max_workers (int, optional): concurrent requests. Defaults to 1
+        rate_limit (float, optional): most requests per second per host. Defaults to None
+        titles_per_request (int, optional): titles per page content request;
+            TextExtracts returns at most 20 extracts per request. Defaults to 20
+        cache (obj `src.cache.ResponseCache`, optional): searches and pages
+            are read from it first and written back after fetching. Defaults to None
+        client (obj `src.client.HttpClient`, optional): client for the
+            Wikipedia API; a default one is made if None. Defaults to None
+
+    Returns:
+        (tuple): dict of entity to wiki_query() output (None if the
+                 request failed), dict of title to page info (None if not found)
+    """
+
+    limiter = RateLimiter(rate_limit)
+    own_client = client is None
+    if own_client:
+        client = HttpClient()
+
+    def query_params(ent):
+        return dict(query_conf['params'], srsearch=ent)
+
+    def content_params(title):
+        return dict(content_conf['params'], titles=title)
+
+    def query(ent):
+        if cache is not None:
+            articledata = cache.get('wiki_query', query_params(ent))
+            if articledata is not None:
+                return articledata
+
+        articledata = wiki_query(query_conf, ent, client, limiter)
+        # failed and error answers are not cached, so they are asked again
+        if cache is not None and query_succeeded(articledata):
+            cache.set('wiki_query', query_params(ent), articledata)
+        return articledata
+
+    def content(titles):
+        chunk_pages = wiki_contents(content_conf, titles, client, limiter)
+        if cache is not None:
+            for title, info in chunk_pages.items():
+                if info is not None:
+                    cache.set('wiki_content', content_params(title), info)
+        return chunk_pages
+
+    entities = list(dict.fromkeys(entities))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        searches = dict(zip(entities, executor.map(query, entities)))
+        logger.info("searched wikipedia for %i entities", len(searches))
+
+        titles = list(dict.fromkeys(
+            title for articledata in searches.values()
+            for title in search_titles(articledata, n_results)))
+
+        pages = {}
+        if cache is not None:
+            for title in titles:
+                info = cache.get('wiki_content', content_params(title))
+                if info is not None:
+                    pages[title] = info
+            titles = [title for title in titles if title not in pages]
+
+        chunks = [titles[i:i + titles_per_request]
+                  for i in range(0, len(titles), titles_per_request)]
+        for chunk_pages in executor.map(content, chunks):
+            pages.update(chunk_pages)
+        logger.info("gathered page content for %i titles in %i requests",
+                    len(pages), len(chunks))
+
+    if own_client:
+        client.close()
+    if cache is not None:
+        logger.info("response cache: %(hits)i hits, %(misses)i misses "
+                    "(hit ratio %(hit_ratio).2f)", cache.stats())
+
+    return searches, pages
+
+
+def match_wiki(entities, searches, pages,
+               stop_categories=[], stop_phrases=[], n_results=1):
+    """Match entities to already-fetched wikipedia pages, removing irrelevant pages
+
+    Args:
+        entities (array like): list of entities; output from news2entities
+        searches (dict): entity to wiki_query() output; from fetch_wiki()
+        pages (dict): title to wiki_content() output; from fetch_wiki()
+        stop_categories (list, optional): categories to filter out. Defaults to []
+        stop_phrases (list, optional): phrases to filter out. Defaults to []
+        n_results (int, optional): number of suggested articles to consider. Defaults to 1
 
     Returns:
-        [type]: [description]
+        (obj `pandas.DataFrame`): one row per matched wikipedia article
     """
     all_data = []
     all_titles = []
     for ent in entities:
-        articledata = wiki_query(query_conf, ent)
-        search_results = articledata['query']['search']
 
         # n_results is how many search results to consider matching
-        for result in search_results[0:n_results]:
+        for title in search_titles(searches.get(ent), n_results):
 
-            title = result['title']
             if title in all_titles:
                 logger.debug('%s has already been added', title)
                 continue        # bypass the rest of the for loop
 
-            info = wiki_content(content_conf, title)
+            info = pages.get(title)
+            if info is None:
+                logger.warning('no page content for %s', title)
+                continue        # bypass the rest of the for loop
+
             try:
                 categories = info['categories']
                 categories = [kv['title'].lower() for kv in categories]
@@ -157,6 +470,78 @@ def entities2wiki(entities, query_conf, content_conf,
     return pd.DataFrame(all_data)
 
 
+def lookup_failed(entities, searches, pages, n_results=1):
+    """True if a search or page content request for entities did not succeed
+
+    match_wiki() treats a failed request like a search with no results;
+    this tells the two apart, so articles can be looked up again later.
+
+    Args:
+        entities (array like): list of entities; output from news2entities
+        searches (dict): entity to wiki_query() output; from fetch_wiki()
+        pages (dict): title to wiki_content() output; from fetch_wiki()
+        n_results (int, optional): number of suggested articles to consider. Defaults to 1
+
+    Returns:
+        (bool)
+    """
+
+    for ent in entities:
+        articledata = searches.get(ent)
+        if not query_succeeded(articledata):
+            return True
+        # pages has None for missing pages, and no key if the request failed
+        if any(title not in pages for title in search_titles(articledata, n_results)):
+            return True
+    return False
+
+
+def query_succeeded(data):
+    """True for a MediaWiki response with a 'query' section and no 'error'"""
+
+    return isinstance(data, dict) and 'query' in data and 'error' not in data
+
+
+def search_titles(articledata, n_results=1):
+    """titles of the top n_results search suggestions; [] if the search failed"""
+
+    try:
+        return [result['title']
+                for result in articledata['query']['search'][0:n_results]]
+    except (KeyError, TypeError):
+        return []
+
+
+def pages_by_title(query, titles):
+    """Map requested titles to page info, following normalization and redirects
+
+    Args:
+        query (dict): 'query' section of a MediaWiki response with 'pages'
+            and optionally 'normalized' and 'redirects'
+        titles (array-like): titles as they were requested
+
+    Returns:
+        (dict): requested title to page info; None for missing pages
+    """
+
+    aliases = {}
+    for entry in query.get('normalized', []) + query.get('redirects', []):
+        aliases[entry['from']] = entry['to']
+
+    pages = {page['title']: page for page in query.get('pages', {}).values()
+             if 'missing' not in page and 'invalid' not in page}
+
+    result = {}
+    for title in titles:
+        resolved = title
+        seen = set()
+        while resolved in aliases and resolved not in seen:
+            seen.add(resolved)
+            resolved = aliases[resolved]
+        result[title] = pages.get(resolved)
+    return result
+
+
 def wiki_special_truncate(text):
     """'==' denotes a special section break. Truncate the Wikipedia content here"""
 
@@ -175,7 +560,7 @@ def wiki_image(data):
         return ''
 
 
-def wiki_query(conf, query, timeout=300):
+def wiki_query(conf, query, client, limiter=None):
     """Given a search query, returns suggestions from Wikipedia's search engine
 
     Args:
@@ -184,76 +569,106 @@ def wiki_query(conf, query, timeout=300):
             'params': params for `session.get()` containing:
                 see https://www.mediawiki.org/wiki/API:Query for more params
         query (text): an entity suggested from the news headlines
-        timeout (int): how long to wait for response before timing out. Default 300 seconds
+        client (obj `src.client.HttpClient`): client to send the request with
+        limiter (obj `src.client.RateLimiter`, optional): waited on before
+            every attempt. Defaults to None
 
     Returns:
-        object: `JSON` formatted data
+        object: `JSON` formatted data; None if the request failed
     """
 
-    session = requests.Session()
-    url = conf['url']
-    params = conf['params']
+    params = dict(conf['params'])
     params['srsearch'] = query  # add query to the parameters, required by API
+    return client.get_json(conf['url'], params, endpoint='wiki_query', limiter=limiter,
+                           ok_only=True)
 
-    try:
-        return session.get(url=url,
-                           params=params,
-                           timeout=timeout).json()
 
-    except requests.ConnectionError:
-        logger.error("Make sure you are connected to Internet.")
-        return None
+def wiki_content(conf, title, client, limiter=None):
+    """Given an article title, returns page info
 
-    except urllib3.exceptions.ReadTimeoutError:
-        logger.warning("Timeout Error after %i seconds", timeout)
-        return None
+    Args:
+        conf (dict): configuration containing:
+            'url': url for `session.get()`
+            'params': params for `session.get()` containing:
+                see https://www.mediawiki.org/wiki/API:Query for more params
+        title (text): title of a wikipedia article
+        client (obj `src.client.HttpClient`): client to send the request with
+        limiter (obj `src.client.RateLimiter`, optional): waited on before
+            every attempt. Defaults to None
 
-    except requests.exceptions.ReadTimeout:
-        logger.warning("Timeout Error after %i seconds", timeout)
-        return None
+    Returns:
+        object: `JSON` formatted data; None if the request failed
+    """
+
+    logger.debug("gathering pagecontent for page %s", title)
+
+    params = dict(conf['params'])
+    params['titles'] = title  # add title to the parameters, required by API
 
-    except requests.RequestException as exc:
-        logger.error("General Error: %s", exc)
+    data = client.get_json(conf['url'], params, endpoint='wiki_content', limiter=limiter,
+                           ok_only=True)
+    try:
+        return list(data['query']['pages'].values())[0]
+    except (KeyError, TypeError, IndexError):
+        logger.warning("no page content returned for %s", title)
         return None
 
 
-def wiki_content(conf, title, timeout=300):
-    """Given an article title, returns page info
+def wiki_contents(conf, titles, client, limiter=None):
+    """Given many article titles, returns page info for all of them in one request
+
+    Follows 'continue' responses until every page property is complete.
 
     Args:
         conf (dict): configuration containing:
             'url': url for `session.get()`
             'params': params for `session.get()` containing:
                 see https://www.mediawiki.org/wiki/API:Query for more params
-        query (text): an entity suggested from the news headlines
-        timeout (int): how long to wait for response before timing out. Default 300 seconds
+        titles (array-like): article titles; at most the API's per-request limit
+        client (obj `src.client.HttpClient`): client to send the requests with
+        limiter (obj `src.client.RateLimiter`, optional): waited on before
+            every attempt, continued requests included. Defaults to None
 
     Returns:
-        object: `JSON` formatted data
+        (dict): requested title to page info; None for missing pages,
+            and empty if the request failed
     """
 
-    logger.debug("gathering pagecontent for page %s", title)
-
-    session = requests.Session()
-    url = conf['url']
-    params = conf['params']
-    params['titles'] = title  # add title to the parameters, required by API
+    logger.debug("gathering pagecontent for %i pages", len(titles))
 
-    signal.signal(signal.SIGALRM,
-                  lambda signum, frame:
-                      logger.warning("Wiki API wait time over %i, ",
-                                     timeout))
-    signal.alarm(timeout)    # Enable the alarm
+    params = dict(conf['params'])
+    params['titles'] = '|'.join(titles)
 
+    query = {'normalized': [], 'redirects': [], 'pages': {}}
     try:
-        resp = session.get(url=url, params=params)
-        signal.alarm(0)      # Disable the alarm
-        return list(resp.json()['query']['pages'].values())[0]
-
-    except requests.ConnectionError as exc:
-        logger.error("Make sure you are connected to Internet.")
-        return None
-
-    except requests.RequestException as exc:
-        logger.error("General Error: %s", exc)
-        return None
+        while True:
+            data = client.get_json(conf['url'], params, endpoint='wiki_content',
+                                   limiter=limiter, ok_only=True)
+            if data is None:
+                return {}
+            if 'error' in data:
+                logger.error("Wiki API error: %s", data['error'])
+                return {}
+            for key in ['normalized', 'redirects']:
+                for entry in data['query'].get(key, []):
+                    if entry not in query[key]:
+                        query[key].append(entry)
+
+            # continued responses repeat each page with more of its properties
+            for pageid, page in data['query'].get('pages', {}).items():
+                merged = query['pages'].setdefault(pageid, {})
+                for prop, value in page.items():
+                    if isinstance(value, list):
+                        merged.setdefault(prop, []).extend(value)
+                    else:
+                        merged.setdefault(prop, value)
+
+            if 'continue' not in data:
+                break
+            params.update(data['continue'])
+
+    except (KeyError, ValueError) as exc:
+        logger.error("Unexpected response from Wiki API: %s", exc)
+        return {}
+
+    return pages_by_title(query, titles)
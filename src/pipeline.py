@@ -0,0 +1,335 @@
+"""Module containing functions to run the whole pipeline in a single process
+
+Orchestration function:
+    run_pipeline(confs, engine_string, news_df, wiki_df,
+                 checkpoint_dir, checkpoint_format, cache, trace_memory,
+                 incremental, client)
+
+Stage functions, shared with the per-step commands in run.py:
+    stage_load_news(conf, client)
+    stage_load_wiki(news_df, conf, cache, client, return_failed)
+    stage_ingest(data, conf, engine_string)
+    stage_predict_stream(input_path, output_path, conf, chunksize, predict, filter)
+    run_incremental(confs, engine_string, news_df, wiki_df,
+                    checkpoint_dir, checkpoint_format, cache, report, client)
+
+Helper class and functions:
+    StageReport()
+    max_rss_mb()
+    checkpoint(data, checkpoint_dir, name, fmt)
+"""
+
+from contextlib import contextmanager
+from datetime import date
+import logging
+import os
+import resource
+import time
+import tracemalloc
+
+import pandas as pd
+
+from src.algorithm import (TEXT_COLUMNS, filter_data, join_data, predict_chunks,
+                           predict_data)
+from src.client import HttpClient
+from src.db import (create_db, date_today, ingest, ingest_incremental,
+                    reuse_matches, split_processed)
+from src.load_news import load_news
+from src.load_wiki import load_wiki
+from src.tables import TableWriter, read_table_chunks, write_table
+
+logger = logging.getLogger(__name__)
+
+
+class StageReport:
+    """Records wall time and peak memory for each pipeline stage
+
+    The OS only reports the process's RSS high-water mark, so each stage gets
+    how far it raised that mark (0 if an earlier stage peaked higher) next to
+    the mark itself, which is cumulative. peak_heap_mb is the stage's own peak.
+    """
+
+    def __init__(self, trace_memory=False):
+        """
+        Args:
+            trace_memory (bool): measure each stage's peak Python heap with
+                tracemalloc; slows allocation-heavy stages. Defaults to False
+        """
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager timing the stage called name"""
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        logger.info("----Starting stage '%s'", name)
+        rss_before = max_rss_mb()
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+
+        rss_after = max_rss_mb()
+        record = {'stage': name,
+                  'seconds': elapsed,
+                  'rss_growth_mb': rss_after - rss_before,
+                  'max_rss_so_far_mb': rss_after}
+        if self.trace_memory:
+            record['peak_heap_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        self.stages.append(record)
+        logger.info("stage '%s' took %.2fs (peak RSS +%.0f MB, %.0f MB so far)",
+                    name, elapsed, record['rss_growth_mb'], record['max_rss_so_far_mb'])
+
+    def summary(self):
+        """Log and return one row per stage"""
+
+        report = pd.DataFrame(self.stages)
+        logger.info("pipeline stages:\n%s", report.to_string(index=False,
+                                                             float_format='%.2f'))
+        return report
+
+
+def max_rss_mb():
+    """the process's peak resident set size so far in MB"""
+
+    # ru_maxrss is reported in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def checkpoint(data, checkpoint_dir, name, fmt='csv'):
+    """Write an intermediate dataframe as the per-step commands would
+
+    Args:
+        data (obj `pandas.DataFrame`): stage output
+        checkpoint_dir (str): directory to write to; None to skip
+        name (str): file name suffix, e.g. 'news-entries'
+        fmt (str): file extension; 'csv', 'parquet' or 'feather'. Defaults to 'csv'
+    """
+
+    if checkpoint_dir is None:
+        return
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = os.path.join(checkpoint_dir, '%s-%s.%s' % (
+        date.today().strftime('%m-%d-%y'), name, fmt))
+    write_table(data, path)
+    logger.info("checkpoint saved to %s", path)
+
+
+def stage_load_news(conf, client=None):
+    """load_news() with arguments from load_news.yaml
+
+    A client is made from the 'http' section, and its metrics logged,
+    only if none is passed.
+    """
+
+    own_client = client is None
+    if own_client:
+        client = HttpClient(**conf['http'])
+    try:
+        return load_news(conf, source_words=conf['source_words'], client=client)
+    finally:
+        if own_client:
+            client.log_metrics()
+            client.close()
+
+
+def stage_load_wiki(news_df, conf, cache=None, client=None, return_failed=False):
+    """load_wiki() with arguments from load_wiki.yaml
+
+    A client is made from the 'http' section, and its metrics logged,
+    only if none is passed.
+    """
+
+    own_client = client is None
+    if own_client:
+        client = HttpClient(**conf['http'])
+    try:
+        return load_wiki(news_df,
+                         query_conf=conf['wiki_query'],
+                         content_conf=conf['wiki_content'],
+                         stop_spacy=conf['stop_spacy'],
+                         spacy_model=conf['spacy_model'],
+                         stop_categories=conf['stop_categories'],
+                         stop_phrases=conf['stop_phrases'],
+                         n_results=conf['n_results'],
+                         spacy_disable=conf['spacy_disable'],
+                         batch_size=conf['spacy_batch_size'],
+                         n_process=conf['spacy_n_process'],
+                         max_workers=conf['max_workers'],
+                         rate_limit=conf['rate_limit'],
+                         titles_per_request=conf['titles_per_request'],
+                         cache=cache,
+                         shard_chars=conf['spacy_shard_chars'],
+                         client=client,
+                         return_failed=return_failed)
+    finally:
+        if own_client:
+            client.log_metrics()
+            client.close()
+
+
+def stage_ingest(data, conf, engine_string):
+    """create_db() and ingest() with arguments from db.yaml"""
+
+    create_db(engine_string, truncate=not conf['history']['append'])
+    ingest(data, conf, engine_string)
+
+
+def stage_predict_stream(input_path, output_path, conf, chunksize,
+                         predict=True, filter=True):
+    """predict_data() and/or filter_data() from file to file in chunks
+
+    Each chunk is scored, filtered and appended to the output before the
+    next is read, so only one chunk of rows is held at a time. The one
+    thing kept across chunks is filter_data()'s set of ('news_id', 'title')
+    hashes, which grows with the number of unique pairs (about 70 bytes
+    each), not with the size of the rows.
+
+    Args:
+        input_path (str): output of the join step, or of the predict step
+            if predict is False
+        output_path (str): local path; .csv, .parquet or .feather
+        conf (dict): yaml-style config from algorithm.yaml; may be None
+            if predict is False
+        chunksize (int): most rows per chunk
+        predict (bool, optional): run predict_data(). Defaults to True
+        filter (bool, optional): run filter_data(). Defaults to True
+
+    Returns:
+        (int): rows written
+    """
+
+    # text read as str in every chunk, so dtypes and dedup keys agree across chunks
+    text_columns = TEXT_COLUMNS + (conf['processed_features'] if conf else [])
+    chunks = read_table_chunks(input_path, chunksize, text_columns=text_columns)
+    with TableWriter(output_path) as writer:
+        for i, chunk in enumerate(predict_chunks(chunks, conf, predict, filter)):
+            writer.write(chunk)
+            logger.debug("chunk %i: wrote %i rows", i, len(chunk))
+    logger.info("streamed %s to %s in chunks of %i rows; %i rows written",
+                input_path, output_path, chunksize, writer.rows)
+    return writer.rows
+
+
+def run_pipeline(confs, engine_string, news_df=None, wiki_df=None,
+                 checkpoint_dir=None, checkpoint_format='csv', cache=None,
+                 trace_memory=False, incremental=False, client=None):
+    """Orchestration function running load_news through ingest in one process
+
+    DataFrames are passed between stages in memory instead of through CSV.
+
+    Args:
+        confs (dict): yaml-style configs keyed by
+            'load_news', 'load_wiki', 'algorithm' and 'db'
+        engine_string (str): engine string for database
+        news_df (obj `pandas.DataFrame`, optional): news to use instead of
+            calling the News API. Defaults to None
+        wiki_df (obj `pandas.DataFrame`, optional): wiki matches to use
+            instead of calling the Wikipedia API. Defaults to None
+        checkpoint_dir (str, optional): directory to save intermediate
+            data to. Defaults to None
+        checkpoint_format (str, optional): 'csv', 'parquet' or 'feather'. Defaults to 'csv'
+        cache (obj `src.cache.ResponseCache`, optional): cache for load_wiki()
+        trace_memory (bool, optional): see `StageReport`. Defaults to False
+        incremental (bool, optional): only run entity recognition, wiki
+            lookup and scoring for articles not processed by an earlier
+            run, reusing stored matches for the rest, and upsert today's
+            rows instead of replacing the tables. Defaults to False
+        client (obj `src.client.HttpClient`, optional): one client shared
+            by both API stages, so they reuse its connections; each stage
+            makes its own from its config if None. Defaults to None
+
+    Returns:
+        (obj `pandas.DataFrame`): filtered data that was ingested
+    """
+
+    report = StageReport(trace_memory)
+
+    with report.stage('load_news'):
+        if news_df is None:
+            news_df = stage_load_news(confs['load_news'], client)
+    checkpoint(news_df, checkpoint_dir, 'news-entries', checkpoint_format)
+
+    if incremental:
+        return run_incremental(confs, engine_string, news_df, wiki_df,
+                               checkpoint_dir, checkpoint_format, cache, report,
+                               client)
+
+    with report.stage('load_wiki'):
+        if wiki_df is None:
+            wiki_df = stage_load_wiki(news_df, confs['load_wiki'], cache, client)
+    checkpoint(wiki_df, checkpoint_dir, 'wiki-entries', checkpoint_format)
+
+    with report.stage('join'):
+        data = join_data(news_df, wiki_df)
+    checkpoint(data, checkpoint_dir, 'joined', checkpoint_format)
+
+    with report.stage('predict'):
+        data = predict_data(data, confs['algorithm'])
+    checkpoint(data, checkpoint_dir, 'predict', checkpoint_format)
+
+    with report.stage('filter'):
+        data = filter_data(data)
+    checkpoint(data, checkpoint_dir, 'filtered', checkpoint_format)
+
+    with report.stage('ingest'):
+        stage_ingest(data, confs['db'], engine_string)
+
+    report.summary()
+    return data
+
+
+def run_incremental(confs, engine_string, news_df, wiki_df,
+                    checkpoint_dir, checkpoint_format, cache, report,
+                    client=None):
+    """The stages after load_news for run_pipeline(incremental=True)
+
+    Articles whose wikipedia lookups failed are not marked as processed,
+    so the next run looks them up again.
+    """
+
+    all_news_df = news_df
+    failed = []
+    with report.stage('split'):
+        create_db(engine_string, truncate=False)
+        news_df, seen_df = split_processed(news_df, engine_string)
+        reused_wiki, reused_news = reuse_matches(seen_df, date_today(), engine_string)
+
+    # load_wiki() and join_data() need at least one article
+    data = None
+    if len(news_df):
+        with report.stage('load_wiki'):
+            if wiki_df is None:
+                wiki_df, failed = stage_load_wiki(news_df, confs['load_wiki'], cache,
+                                                  client, return_failed=True)
+            else:
+                wiki_df = wiki_df[wiki_df['news_id'].isin(news_df['news_id'])]
+        checkpoint(wiki_df, checkpoint_dir, 'wiki-entries', checkpoint_format)
+
+        if len(wiki_df):
+            with report.stage('join'):
+                data = join_data(news_df, wiki_df)
+            checkpoint(data, checkpoint_dir, 'joined', checkpoint_format)
+
+            with report.stage('predict'):
+                data = predict_data(data, confs['algorithm'])
+            checkpoint(data, checkpoint_dir, 'predict', checkpoint_format)
+
+            with report.stage('filter'):
+                data = filter_data(data)
+            checkpoint(data, checkpoint_dir, 'filtered', checkpoint_format)
+
+    if data is None:
+        data = pd.DataFrame()
+
+    with report.stage('ingest'):
+        ingest_incremental(data, all_news_df[~all_news_df['news_id'].isin(failed)],
+                           confs['db'], engine_string, reused_wiki, reused_news)
+
+    report.summary()
+    return data
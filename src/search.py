@@ -0,0 +1,245 @@
+"""Module containing full-text search over ingested news and their wiki matches
+
+Each news article is one search document: its headline and text, and the
+titles and extracts of its wiki matches. The index is backend specific:
+
+Classes:
+SearchIndex()       interface shared by the backends
+FTS5Index()         SQLite; an FTS5 virtual table kept in sync by ingest
+FulltextIndex()     MySQL; FULLTEXT indexes maintained by MySQL itself
+
+Functions:
+get_index(engine)
+match_terms(text)
+highlight(snippet)
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+import logging
+import re
+
+from markupsafe import escape
+import sqlalchemy
+from sqlalchemy import bindparam, text, DateTime
+
+logger = logging.getLogger(__name__)
+
+# snippet markers; unlike html tags they cannot appear in ingested text
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+WORD = re.compile(r'\w+')
+
+
+def match_terms(query):
+    """Words of a user's query, lower-cased; punctuation and operators are dropped"""
+
+    return [word.lower() for word in WORD.findall(query)]
+
+
+def highlight(snippet):
+    """html-escape a snippet and wrap its marked terms in the "highlight" class"""
+
+    return str(escape(snippet)). \
+        replace(MARK_START, '<span class="highlight">'). \
+        replace(MARK_END, '</span>')
+
+
+def format_date(value):
+    """'%b-%d-%Y' string from a DateTime column read through raw SQL"""
+
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.strftime('%b-%d-%Y')
+
+
+def get_index(engine):
+    """Search index for the engine's database, or None if it has none
+
+    Args:
+        engine (obj `sqlalchemy.engine.Engine`): engine for database
+
+    Returns:
+        obj `SearchIndex` or None
+    """
+
+    index = SEARCH_INDEXES.get(engine.dialect.name)
+    if index is None:
+        logger.warning("no search index for %s databases", engine.dialect.name)
+        return None
+    return index()
+
+
+class SearchIndex(ABC):
+    """Interface of a full-text index over the news and wiki tables"""
+
+    @abstractmethod
+    def create(self, engine):
+        """Create the index if it does not exist yet"""
+
+    @abstractmethod
+    def update(self, engine, dates):
+        """Re-index the news of the given dates and drop days no longer stored
+
+        Args:
+            engine (obj `sqlalchemy.engine.Engine`): engine for database
+            dates (list of obj `datetime.datetime`): days that were ingested
+        """
+
+    @abstractmethod
+    def search(self, engine, query, page=1, page_size=10):
+        """Ranked news articles matching every word of query
+
+        Args:
+            engine (obj `sqlalchemy.engine.Engine`): engine for database
+            query (str): words to search for
+            page (int): 1-based page of results. Defaults to 1
+            page_size (int): results per page. Defaults to 10
+
+        Returns:
+            tuple: list of result dicts with keys 'date', 'news_id',
+                'headline', 'news_url', 'titles' and 'snippet' (html),
+                and whether there is a next page
+        """
+
+
+class FTS5Index(SearchIndex):
+    """SQLite FTS5 table with one row per news article, ranked by bm25"""
+
+    table = 'news_search'
+    # bm25 weights of the headline, news, titles and wiki columns
+    weights = (10.0, 2.0, 5.0, 1.0)
+    snippet_tokens = 16
+
+    def create(self, engine):
+        engine.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(
+                              headline, news, titles, wiki,
+                              date UNINDEXED, news_id UNINDEXED, news_url UNINDEXED,
+                              tokenize = 'unicode61 remove_diacritics 2')""" % self.table)
+
+    def update(self, engine, dates):
+        reindex = [text("DELETE FROM %s WHERE date IN :dates" % self.table),
+                   text("""INSERT INTO %s (headline, news, titles, wiki,
+                                           date, news_id, news_url)
+                           SELECT n.headline, n.news,
+                                  group_concat(w.title, ' | '), group_concat(w.wiki, ' '),
+                                  n.date, n.news_id, n.news_url
+                           FROM news n
+                           LEFT JOIN wiki w ON w.date = n.date AND w.news_id = n.news_id
+                           WHERE n.date IN :dates
+                           GROUP BY n.date, n.news_id""" % self.table)]
+
+        with engine.begin() as connection:
+            if dates:
+                for statement in reindex:
+                    connection.execute(statement.bindparams(
+                        bindparam('dates', expanding=True, type_=DateTime())),
+                        dates=list(dates))
+            connection.execute("""DELETE FROM %s WHERE date NOT IN
+                                      (SELECT DISTINCT date FROM news)""" % self.table)
+        logger.debug("search index updated for %i days", len(dates))
+
+    def search(self, engine, query, page=1, page_size=10):
+        terms = match_terms(query)
+        if not terms:
+            return [], False
+
+        statement = text("""SELECT date, news_id, headline, news_url, titles,
+                                   snippet(%s, -1, :start, :end, '…', %i) AS snippet
+                            FROM %s
+                            WHERE %s MATCH :match
+                            ORDER BY bm25(%s, %s)
+                            LIMIT :limit OFFSET :offset""" % (
+            self.table, self.snippet_tokens, self.table, self.table, self.table,
+            ', '.join(str(weight) for weight in self.weights)))
+
+        rows = engine.execute(statement,
+                              start=MARK_START, end=MARK_END,
+                              # quoted terms are matched literally, all required
+                              match=' '.join('"%s"' % term for term in terms),
+                              limit=page_size + 1,
+                              offset=(page - 1) * page_size).fetchall()
+
+        results = [{'date': format_date(row.date),
+                    'news_id': row.news_id,
+                    'headline': row.headline,
+                    'news_url': row.news_url,
+                    'titles': row.titles.split(' | ') if row.titles else [],
+                    'snippet': highlight(row.snippet)}
+                   for row in rows[:page_size]]
+        return results, len(rows) > page_size
+
+
+class FulltextIndex(SearchIndex):
+    """MySQL FULLTEXT indexes on news and wiki, ranked by natural-language relevance"""
+
+    indexes = {'news': ('ft_news', ['headline', 'news']),
+               'wiki': ('ft_wiki', ['title', 'wiki'])}
+    snippet_chars = 200
+
+    def create(self, engine):
+        inspector = sqlalchemy.inspect(engine)
+        for table, (name, columns) in self.indexes.items():
+            existing = {index['name'] for index in inspector.get_indexes(table)}
+            if name not in existing:
+                engine.execute("ALTER TABLE %s ADD FULLTEXT INDEX %s (%s)" % (
+                    table, name, ', '.join(columns)))
+
+    def update(self, engine, dates):
+        # MySQL updates FULLTEXT indexes as rows are written
+        pass
+
+    def search(self, engine, query, page=1, page_size=10):
+        terms = match_terms(query)
+        if not terms:
+            return [], False
+
+        statement = text("""SELECT n.date, n.news_id, n.headline, n.news_url, n.news,
+                                   GROUP_CONCAT(w.title ORDER BY w.id SEPARATOR ' | ') AS titles,
+                                   2 * MATCH (n.headline, n.news) AGAINST (:match IN BOOLEAN MODE)
+                                   + COALESCE(MAX(MATCH (w.title, w.wiki)
+                                                  AGAINST (:match IN BOOLEAN MODE)), 0)
+                                   AS score
+                            FROM news n
+                            LEFT JOIN wiki w ON w.date = n.date AND w.news_id = n.news_id
+                            WHERE (n.date, n.news_id) IN (
+                                      SELECT date, news_id FROM news
+                                      WHERE MATCH (headline, news)
+                                            AGAINST (:match IN BOOLEAN MODE))
+                               OR (n.date, n.news_id) IN (
+                                      SELECT date, news_id FROM wiki
+                                      WHERE MATCH (title, wiki)
+                                            AGAINST (:match IN BOOLEAN MODE))
+                            GROUP BY n.date, n.news_id
+                            ORDER BY score DESC
+                            LIMIT :limit OFFSET :offset""")
+
+        rows = engine.execute(statement,
+                              match=' '.join('+%s' % term for term in terms),
+                              limit=page_size + 1,
+                              offset=(page - 1) * page_size).fetchall()
+
+        results = [{'date': format_date(row.date),
+                    'news_id': row.news_id,
+                    'headline': row.headline,
+                    'news_url': row.news_url,
+                    'titles': row.titles.split(' | ') if row.titles else [],
+                    'snippet': highlight(self.snippet(row.news, terms))}
+                   for row in rows[:page_size]]
+        return results, len(rows) > page_size
+
+    def snippet(self, news, terms):
+        """about snippet_chars of news around the first term, with terms marked"""
+
+        pattern = re.compile(r'\b(%s)\b' % '|'.join(map(re.escape, terms)),
+                             re.IGNORECASE)
+        found = pattern.search(news)
+        start = max(found.start() - self.snippet_chars // 2, 0) if found else 0
+        window = news[start:start + self.snippet_chars]
+        return ('…' if start else '') + \
+            pattern.sub(MARK_START + r'\1' + MARK_END, window)
+
+
+SEARCH_INDEXES = {'sqlite': FTS5Index,
+                  'mysql': FulltextIndex}
@@ -0,0 +1,217 @@
+"""Module containing functions to read and write pipeline intermediates
+
+The file format is chosen by extension:
+    .csv                 comma separated text (default)
+    .parquet, .pq        Apache Parquet; keeps dtypes, compressed
+    .feather, .arrow     Arrow IPC; keeps dtypes, memory-mapped when local
+
+read_table(path, columns)
+write_table(data, path)
+read_table_chunks(path, chunksize, columns, text_columns)
+TableWriter(path)
+
+Helper function:
+table_format(path)
+"""
+
+import logging
+import os
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'.csv': 'csv',
+           '.parquet': 'parquet',
+           '.pq': 'parquet',
+           '.feather': 'feather',
+           '.arrow': 'feather'}
+
+
+def table_format(path):
+    """'csv', 'parquet' or 'feather' based on the file extension; defaults to 'csv'"""
+
+    return FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+
+def read_table(path, columns=None):
+    """Read a local or s3:// table written by write_table() or any CSV
+
+    Args:
+        path (str): local path or s3 url
+        columns (list, optional): only read these columns. Defaults to None
+
+    Returns:
+        (obj `pandas.DataFrame`)
+    """
+
+    fmt = table_format(path)
+    is_local = '://' not in path
+
+    if fmt == 'parquet':
+        if is_local:
+            return pd.read_parquet(path, columns=columns, memory_map=True)
+        return pd.read_parquet(path, columns=columns)
+
+    if fmt == 'feather':
+        if is_local:
+            from pyarrow import feather
+            return feather.read_table(path, columns=columns,
+                                      memory_map=True).to_pandas()
+        return pd.read_feather(path, columns=columns)
+
+    return pd.read_csv(path, usecols=columns)
+
+
+def write_table(data, path):
+    """Write a table in the format given by the file extension
+
+    Args:
+        data (obj `pandas.DataFrame`)
+        path (str): local path or s3 url
+    """
+
+    fmt = table_format(path)
+
+    if fmt == 'parquet':
+        data.to_parquet(path, index=False)
+    elif fmt == 'feather':
+        # feather requires a default index
+        data.reset_index(drop=True).to_feather(path)
+    else:
+        data.to_csv(path, index=False)
+
+
+def read_table_chunks(path, chunksize, columns=None, text_columns=()):
+    """Read a table written by write_table() or any CSV in chunks of rows
+
+    Only one chunk is held in memory at a time, so inputs larger than
+    memory can be processed. Feather files are read one record batch at a
+    time, so compressed files are decompressed batch by batch.
+
+    Args:
+        path (str): local path or s3 url
+        chunksize (int): most rows per chunk
+        columns (list, optional): only read these columns. Defaults to None
+        text_columns (list, optional): csv columns to read as str, so that
+            every chunk gets the same dtype even when a chunk holds only
+            empty values or only numbers in them; empty values stay NaN.
+            Columns missing from the file are ignored. Defaults to ()
+
+    Yields:
+        (obj `pandas.DataFrame`): consecutive chunks with a default index
+            continuing from the previous chunk
+    """
+
+    fmt = table_format(path)
+
+    if fmt == 'csv':
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize,
+                               dtype={column: str for column in text_columns})
+        return
+
+    start = 0
+    for batch in _record_batches(path, fmt, columns):
+        for offset in range(0, batch.num_rows, chunksize):
+            chunk = batch.slice(offset, chunksize).to_pandas()
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+
+
+def _record_batches(path, fmt, columns=None):
+    """Arrow record batches of a parquet or feather file, read one at a time"""
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt == 'parquet':
+        yield from pq.ParquetFile(path).iter_batches(columns=columns)
+        return
+
+    if '://' in path:
+        import fsspec
+        source = fsspec.open(path, 'rb').open()
+    else:
+        source = pa.memory_map(path)
+    try:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = pa.RecordBatch.from_arrays(
+                    [batch.column(batch.schema.get_field_index(name)) for name in columns],
+                    names=columns)
+            yield batch
+    finally:
+        source.close()
+
+
+class TableWriter:
+    """Appends dataframe chunks to one local table in the format given by the extension
+
+    Every chunk must have the columns of the first; parquet and feather
+    chunks are cast to the first chunk's schema, in which columns holding
+    only None are taken to be strings.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): local path
+        """
+        self.path = path
+        self.format = table_format(path)
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._empty = None
+
+    def write(self, data):
+        """Append the rows of data"""
+
+        # empty chunks carry no dtypes to build a schema from
+        if not len(data):
+            if self._empty is None:
+                self._empty = data
+            return
+
+        if self.format == 'csv':
+            data.to_csv(self.path, index=False, mode='a' if self.rows else 'w',
+                        header=not self.rows)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # chunks may have different categories; IPC files allow one dictionary
+            data = data.astype({column: object for column
+                                in data.select_dtypes('category').columns})
+            if self._writer is None:
+                schema = pa.Schema.from_pandas(data, preserve_index=False)
+                # an object column of only None in the first chunk, e.g. wiki_image
+                for i, field in enumerate(schema):
+                    if pa.types.is_null(field.type):
+                        schema = schema.set(i, field.with_type(pa.string()))
+                self._schema = schema
+                if self.format == 'parquet':
+                    self._writer = pq.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            table = pa.Table.from_pandas(data, schema=self._schema, preserve_index=False)
+            self._writer.write_table(table)
+        self.rows += len(data)
+
+    def close(self):
+        """Finish the file; an empty table is written if every chunk was empty"""
+
+        if self._writer is not None:
+            self._writer.close()
+        elif not self.rows and self._empty is not None:
+            write_table(self._empty, self.path)
+        logger.debug("wrote %i rows to %s", self.rows, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
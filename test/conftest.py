@@ -0,0 +1,30 @@
+import sys
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+# tests import src.<module>, as run.py and app.py do, so each module is loaded once
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + "/..")
+
+
+@pytest.fixture
+def stub_server(request):
+    """Local HTTP server answering with the handler class given as the param
+
+    Use with @pytest.mark.parametrize('stub_server', [Handler], indirect=True).
+    Handlers record requests in server.requests; server.failures is free for
+    them to read statuses to answer with.
+    """
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), request.param)
+    server.requests = []
+    server.failures = {}
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = 'http://127.0.0.1:%i' % server.server_port
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -1,11 +1,51 @@
-import os
-import sys
 import pandas as pd
+import pytest
+from datetime import date
 from numpy import array
 from collections import Counter
 
-sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
-from algorithm import join_data, predict_data, filter_data, text_to_vector, get_cosine, remove_stopwords
+from src.algorithm import (JOIN_COLUMNS, join_data, predict_data, filter_data,
+                           text_to_vector, get_cosine, get_cosine_sparse,
+                           remove_stopwords, strip_stopwords, english_stopwords)
+
+
+def test_join_data():
+    news_df = pd.DataFrame({'news_id': [0, 1],
+                            'headline': ['Sony earbuds - The Verge', 'Pelosi urges Democrats - POLITICO'],
+                            'news': ['Sony earbuds', 'Pelosi urges Democrats'],
+                            'news_image': ['sony.png', None],
+                            'news_url': ['verge.com/sony', 'politico.com/pelosi'],
+                            'source': ['The Verge', 'POLITICO']})
+    wiki_df = pd.DataFrame({'entity': ['Sony (organization)', 'Sony', 'Pelosi', 'Manchin', 'GMC'],
+                            'title': ['Sony', 'Sony', 'Nancy Pelosi', 'Joe Manchin', 'GMC'],
+                            'wiki': ['Sony Group Corporation', 'Sony Group Corporation',
+                                     'Nancy Pelosi is', 'Joe Manchin is', 'GMC is'],
+                            'wiki_url': ['w/Sony', 'w/Sony', 'w/Pelosi', 'w/Manchin', 'w/GMC'],
+                            'wiki_image': [None, None, 'pelosi.jpg', None, None],
+                            'news_id': [0, 0, 1, 1, 7]},
+                           index=[3, 4, 5, 6, 7])
+
+    test_out = join_data(news_df, wiki_df)
+
+    true_out = pd.DataFrame({'wiki_id': [3, 5, 6],
+                             'entity': ['Sony (organization)', 'Pelosi', 'Manchin'],
+                             'title': ['Sony', 'Nancy Pelosi', 'Joe Manchin'],
+                             'wiki': ['Sony Group Corporation', 'Nancy Pelosi is', 'Joe Manchin is'],
+                             'wiki_url': ['w/Sony', 'w/Pelosi', 'w/Manchin'],
+                             'wiki_image': [None, 'pelosi.jpg', None],
+                             'news_id': [0, 1, 1],
+                             'headline': ['Sony earbuds - The Verge', 'Pelosi urges Democrats - POLITICO',
+                                          'Pelosi urges Democrats - POLITICO'],
+                             'news': ['Sony earbuds', 'Pelosi urges Democrats', 'Pelosi urges Democrats'],
+                             'news_image': ['sony.png', None, None],
+                             'news_url': ['verge.com/sony', 'politico.com/pelosi', 'politico.com/pelosi'],
+                             'date': [date.today().strftime("%b-%d-%Y")] * 3})
+
+    assert list(test_out.columns) == JOIN_COLUMNS
+    assert test_out['news_id'].dtype == 'int32'
+    assert test_out['news'].dtype == 'category'
+    assert test_out['date'].cat.categories.tolist() == [date.today().strftime("%b-%d-%Y")]
+    pd.testing.assert_frame_equal(test_out.astype(object), true_out.astype(object))
 
 
 def test_predict_data():
@@ -205,6 +245,27 @@ def test_get_cosine():
     assert round(test_out, 5) == 0.40668
 
 
+def test_get_cosine_sparse():
+    left = pd.Series(['prince harry meghan markle announce birth new baby',
+                      'gmc unveiled hummer ev suv',
+                      'prince harry meghan markle announce birth new baby',
+                      ''])
+    right = pd.Series(['harry prince duke sussex, born 1984',
+                       'gmc hummer ev upcoming off-road luxury electric vehicle gmc',
+                       'lilibet baby',
+                       'hummer ev'])
+
+    test_out = get_cosine_sparse(left, right)
+    true_out = [get_cosine([x, y]) for x, y in zip(left, right)]
+
+    assert test_out == pytest.approx(true_out)
+    assert test_out[3] == 0.0
+
+    right[2] = None
+    with pytest.raises(ValueError):
+        get_cosine_sparse(left, right)
+
+
 def test_remove_stopwords():
     news_in_values = [[0,
             'Sony announces WF-1000XM4 noise-canceling earbuds with LDAC and IPX4 water resistance -  The new WF-1000XM4 earbuds improve on Sony’s last noise-canceling earbuds with longer battery life, IPX4 water resistance, and even better sound with support for LDAC.'],
@@ -240,4 +301,17 @@ def test_remove_stopwords():
 
     test_out = remove_stopwords(news_df_in, {'raw_features': ['news'], 'processed_features': ['news_processed']})
 
-    pd.testing.assert_frame_equal(test_out, true_out)
\ No newline at end of file
+    pd.testing.assert_frame_equal(test_out, true_out)
+
+def test_strip_stopwords():
+    texts = pd.Series(['The cat sat\ton the mat.', 'A DOG, and the cat', 'The cat sat\ton the mat.'],
+                      index=[3, 1, 2], name='news')
+    true_out = pd.Series(['cat sat mat.', 'dog, cat', 'cat sat mat.'],
+                         index=[3, 1, 2], name='news')
+
+    test_out = strip_stopwords(texts, english_stopwords())
+
+    pd.testing.assert_series_equal(test_out, true_out)
+    assert isinstance(english_stopwords(), frozenset)
+    with pytest.raises(ValueError):
+        strip_stopwords(pd.Series(['the cat', None]), english_stopwords())
@@ -0,0 +1,165 @@
+import sys
+from datetime import datetime
+import gzip
+import json
+import importlib
+import pandas as pd
+import pytest
+
+from src.db import create_db, ingest_news, ingest_wiki, stamp_version, News
+
+
+def ingest_day(engine_string, date, headline):
+    news_df = pd.DataFrame([[date, 0, headline, 'news', 'img', 'url', 'news_dis']],
+                           columns=['date', 'news_id', 'headline', 'news',
+                                    'news_image', 'news_url', 'news_dis'])
+    ingest_news(news_df, engine_string, bulk=True)
+    stamp_version(engine_string)
+
+
+@pytest.fixture
+def app_client(tmp_path, monkeypatch):
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+    monkeypatch.setenv('ENGINE_STRING', engine_string)
+    create_db(engine_string)
+    ingest_day(engine_string, 'Jun-07-2021', 'First headline')
+
+    # app reads ENGINE_STRING when it is imported
+    for module in ['app', 'config.db_config']:
+        sys.modules.pop(module, None)
+    app = importlib.import_module('app')
+    yield app.app.test_client(), engine_string
+    app.engine.dispose()
+
+
+def test_index_etag_changes_after_ingest(app_client):
+    client, engine_string = app_client
+
+    first = client.get('/')
+    assert first.status_code == 200
+    assert b'First headline' in first.data
+    assert client.get('/', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    ingest_day(engine_string, 'Jun-08-2021', 'Second headline')
+
+    second = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert b'Second headline' in second.data
+
+
+def ingest_api_rows(engine_string):
+    news_df = pd.DataFrame([[date, news_id, 'headline %i' % news_id, 'news ' * 100,
+                             'img', 'url', 'news_dis']
+                            for date in ['Jun-08-2021', 'Jun-09-2021']
+                            for news_id in [1, 0]],
+                           columns=['date', 'news_id', 'headline', 'news',
+                                    'news_image', 'news_url', 'news_dis'])
+    wiki_df = pd.DataFrame([['Jun-09-2021', 0, title, 'wiki', 'url', '']
+                            for title in ['Sony', 'Walkman', 'LDAC']],
+                           columns=['date', 'news_id', 'title', 'wiki', 'wiki_url', 'wiki_image'])
+    ingest_news(news_df, engine_string, bulk=True)
+    ingest_wiki(wiki_df, engine_string, bulk=True)
+
+
+def test_api_news_pages(app_client):
+    client, engine_string = app_client
+    ingest_api_rows(engine_string)
+
+    first = client.get('/api/news?fields=news_id,headline&limit=2').get_json()
+    assert first['news'] == [{'news_id': 0, 'headline': 'headline 0'},
+                             {'news_id': 1, 'headline': 'headline 1'}]
+    assert first['next'] == '2021-06-09.1'
+
+    # the cursor continues after the last row, newest date first
+    second = client.get('/api/news?fields=date,news_id&limit=2&after=%s'
+                        % first['next']).get_json()
+    assert second['news'] == [{'date': 'Jun-08-2021', 'news_id': 0},
+                              {'date': 'Jun-08-2021', 'news_id': 1}]
+    assert second['next'] == '2021-06-08.1'
+
+    last = client.get('/api/news?fields=news_id&after=%s' % second['next']).get_json()
+    assert last == {'news': [{'news_id': 0}], 'next': None}
+
+    dated = client.get('/api/news?fields=headline&date=Jun-07-2021').get_json()
+    assert dated == {'news': [{'headline': 'First headline'}], 'next': None}
+
+
+def test_api_wiki(app_client):
+    client, engine_string = app_client
+    ingest_api_rows(engine_string)
+
+    first = client.get('/api/news/Jun-09-2021/0/wiki?fields=title&limit=2').get_json()
+    assert first['wiki'] == [{'title': 'Sony'}, {'title': 'Walkman'}]
+    second = client.get('/api/news/Jun-09-2021/0/wiki?fields=title&after=%s'
+                        % first['next']).get_json()
+    assert second == {'wiki': [{'title': 'LDAC'}], 'next': None}
+
+    assert client.get('/api/news/Jun-09-2021/1/wiki').get_json() == {'wiki': [], 'next': None}
+
+
+@pytest.mark.parametrize('url, message', [
+    ('/api/news?fields=headline,secret', 'unknown fields: secret'),
+    ('/api/news?date=2021-06-08', "time data '2021-06-08' does not match format '%b-%d-%Y'"),
+    ('/api/news?after=2021-06-08', "after must be the 'next' value of a previous page, "
+                                   "e.g. 2021-06-08.3"),
+    ('/api/news?after=Jun-08-2021.x', "after must be the 'next' value of a previous page, "
+                                      "e.g. 2021-06-08.3"),
+    ('/api/news/2021-06-08/0/wiki', "time data '2021-06-08' does not match format '%b-%d-%Y'"),
+    ('/api/news/Jun-08-2021/0/wiki?after=Sony', "after must be the 'next' value of a "
+                                                "previous page, e.g. 42")])
+def test_api_errors(app_client, url, message):
+    client, _ = app_client
+
+    response = client.get(url)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': message}
+
+
+def test_api_compression(app_client):
+    client, engine_string = app_client
+    ingest_api_rows(engine_string)
+
+    plain = client.get('/api/news')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+
+    compressed = client.get('/api/news', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert len(compressed.data) < len(plain.data)
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+    # small responses are not worth compressing
+    small = client.get('/api/news?fields=news_id&limit=1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+
+def test_session_removed_after_failed_request(app_client):
+    client, _ = app_client
+    app = sys.modules['app']
+
+    @app.app.route('/test/fail')
+    def fail():
+        app.wn_session.add(News(date=datetime(2021, 6, 9), news_id=5,
+                                headline='uncommitted', news='news', news_dis='news_dis',
+                                news_image='img', news_url='url'))
+        app.wn_session.flush()
+        raise RuntimeError('request failed')
+
+    with pytest.raises(RuntimeError):
+        client.get('/test/fail')
+
+    # teardown removed the thread's session, rolling back its transaction
+    assert not app.wn_session.registry.has()
+    response = client.get('/api/news?fields=headline')
+    assert response.get_json()['news'] == [{'headline': 'First headline'}]
+    assert not app.wn_session.registry.has()
+
+
+def test_pool_size_matches_threads(app_client):
+    app = sys.modules['app']
+    import config.gunicorn_config as gunicorn_config
+
+    # one connection per request thread, and no overflow past it
+    assert app.app.config['DB_POOL_SIZE'] == gunicorn_config.threads
+    assert app.app.config['DB_MAX_OVERFLOW'] == 0
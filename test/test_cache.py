@@ -0,0 +1,30 @@
+
+from src.cache import ResponseCache
+
+
+def test_response_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache' / 'wiki.db'),
+                          ttl={'wiki_query': 60, 'wiki_content': -1},
+                          max_entries=2)
+
+    cache.set('wiki_query', {'list': 'search', 'srsearch': 'Biden'}, {'query': {'search': []}})
+    cache.set('wiki_content', {'titles': 'Joe Biden'}, {'title': 'Joe Biden'})
+
+    # params are normalized, so their order does not matter
+    assert cache.get('wiki_query', {'srsearch': 'Biden', 'list': 'search'}) == {'query': {'search': []}}
+    # expired
+    assert cache.get('wiki_content', {'titles': 'Joe Biden'}) is None
+    assert cache.get('wiki_query', {'srsearch': 'Apple'}) is None
+
+    # evicts the least recently used response
+    cache.set('wiki_query', {'srsearch': 'Apple'}, {'query': {'search': []}})
+    assert cache.get('wiki_query', {'list': 'search', 'srsearch': 'Biden'}) is not None
+    assert cache.get('wiki_content', {'titles': 'Joe Biden'}) is None
+
+    assert cache.stats() == {'hits': 2, 'misses': 3, 'hit_ratio': 0.4}
+    cache.close()
+
+    # persists between runs
+    cache = ResponseCache(str(tmp_path / 'cache' / 'wiki.db'))
+    assert cache.get('wiki_query', {'srsearch': 'Apple'}) == {'query': {'search': []}}
+    cache.close()
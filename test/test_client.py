@@ -0,0 +1,147 @@
+import gzip
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from src.client import HttpClient, RateLimiter, retry_after
+from src.load_wiki import entities2wiki
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers each path with the statuses queued for it, then 200
+
+    /slow sleeps past the client's read timeout; /gzip sends a long
+    gzip-encoded body when the client accepts it.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path.startswith('/slow'):
+            time.sleep(0.5)
+
+        status, headers = 200, {}
+        queued = self.server.failures.get(self.path.split('?')[0], [])
+        if queued:
+            status, headers = queued.pop(0)
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        body = json.dumps({'status': status}).encode('utf-8')
+        if self.path.startswith('/gzip') and \
+                'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(json.dumps({'status': status,
+                                             'text': 'news ' * 1000}).encode('utf-8'))
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+flaky_server = pytest.mark.parametrize('stub_server', [FlakyHandler], indirect=True)
+
+
+def test_retry_after():
+    class Response:
+        headers = {'Retry-After': '2'}
+    assert retry_after(Response()) == 2.0
+
+    Response.headers = {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+    assert retry_after(Response()) == 0.0
+
+    Response.headers = {}
+    assert retry_after(Response()) is None
+
+
+@flaky_server
+def test_http_client_retries(stub_server):
+    stub_server.failures['/retry'] = [(503, {}), (429, {'Retry-After': '0'})]
+    stub_server.failures['/later'] = [(429, {'Retry-After': '120'})]
+    stub_server.failures['/down'] = [(500, {})] * 5
+    client = HttpClient(retries=3, backoff=0.01, max_backoff=1)
+
+    assert client.get_json(stub_server.url + '/retry') == {'status': 200}
+    assert stub_server.requests.count('/retry') == 3
+
+    # a Retry-After past max_backoff gives up instead of stalling
+    assert client.get_json(stub_server.url + '/later') is None
+    assert stub_server.requests.count('/later') == 1
+
+    assert client.get_json(stub_server.url + '/down') is None
+    assert stub_server.requests.count('/down') == 4
+
+
+class CountingLimiter(RateLimiter):
+    """RateLimiter counting the waits for each url"""
+
+    def __init__(self, rate=None):
+        super().__init__(rate)
+        self.waits = []
+
+    def wait(self, url):
+        self.waits.append(url)
+        super().wait(url)
+
+
+@flaky_server
+def test_http_client_rate_limits_retries(stub_server):
+    stub_server.failures['/retry'] = [(503, {}), (503, {})]
+    limiter = CountingLimiter(rate=50)
+    client = HttpClient(retries=3, backoff=0, max_backoff=1)
+
+    start = time.monotonic()
+    assert client.get_json(stub_server.url + '/retry', limiter=limiter) == {'status': 200}
+    # every attempt waits its turn: three requests at 50 per second
+    assert limiter.waits == [stub_server.url + '/retry'] * 3
+    assert time.monotonic() - start >= 2 / 50
+
+
+@flaky_server
+def test_http_client_deadline(stub_server):
+    client = HttpClient(read_timeout=0.2, retries=1, backoff=0.01, deadline=0.3)
+
+    start = time.monotonic()
+    assert client.get(stub_server.url + '/slow') is None
+    assert client.get(stub_server.url + '/fast') is None
+    assert time.monotonic() - start < 1.0
+    assert '/fast' not in stub_server.requests
+
+
+@flaky_server
+def test_http_client_metrics(stub_server):
+    stub_server.failures['/api'] = [(503, {})]
+    client = HttpClient(retries=1, backoff=0.01)
+
+    for _ in range(3):
+        assert client.get_json(stub_server.url + '/api', endpoint='api') == {'status': 200}
+    assert client.get_json(stub_server.url + '/gzip')['text'].startswith('news')
+
+    # keep-alive: every request after the first reuses the connection
+    assert client.connections() == {'requests': 5, 'connections': 1, 'reused': 4}
+
+    metrics = client.metrics.summary()
+    assert metrics['api']['requests'] == 4
+    assert metrics['api']['errors'] == 1
+    assert sum(metrics['api']['histogram']) == 4
+    # the compressed body is counted both as received and as decoded
+    gzipped = metrics['127.0.0.1:%i/gzip' % stub_server.server_port]
+    assert gzipped['wire_bytes'] < gzipped['body_bytes']
+    client.close()
+
+
+@flaky_server
+def test_entities2wiki_unavailable(stub_server):
+    stub_server.failures['/w/api.php'] = [(503, {})] * 10
+    conf = {'url': stub_server.url + '/w/api.php', 'params': {'action': 'query'}}
+
+    test_out = entities2wiki(['Twitter (organization)'], conf, conf,
+                             client=HttpClient(retries=1, backoff=0.01))
+    assert test_out.empty
@@ -1,10 +1,16 @@
-import sys
-import os
+from datetime import datetime
+import yaml
+import pytest
 import pandas as pd
 from numpy import array
 
-sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
-from db import render_text, render_news_col
+from src import db
+from src.db import (render_text, render_news_col, create_db, ingest_news, ingest_wiki,
+                    latest_news, stamp_version, current_version, WikiNewsManager, News,
+                    Wiki, ProcessedNews, delete_dates, apply_retention, news_rows,
+                    wiki_rows, ingest, ingest_incremental, mark_processed,
+                    split_processed, reuse_matches)
+from src.algorithm import join_data, predict_data, filter_data
 
 
 def test_render_text():
@@ -19,8 +25,8 @@ def test_render_text():
                             'Universal Music', 'Universal Music'])
 
     true_out = """<span class="highlight">Bill Ackman</span>\'s <span class="highlight">Pershing Square</span> nears biggest-ever SPAC deal
-        with <span class="highlight"><span class="highlight">Universal Music</span></span>, source says - Billionaire investor <span class="highlight">Bill Ackman</span>
-        is nearing a $40 billion deal to take <span class="highlight"><span class="highlight">Universal Music</span></span> public,
+        with <span class="highlight">Universal Music</span>, source says - Billionaire investor <span class="highlight">Bill Ackman</span>
+        is nearing a $40 billion deal to take <span class="highlight">Universal Music</span> public,
         the largest SPAC deal ever, a source said.
         """
     assert test_out == true_out
@@ -38,13 +44,26 @@ def test_render_text():
                             'Universal Music', 'Universal Music'])
 
     true_out = """<span class="highlight">Bill Ackman</span>\'s <span class="highlight">Pershing Square</span> nears biggest-ever SPAC deal
-        with <span class="highlight"><span class="highlight">Universal Music</span></span>, source says - Billionaire investor <span class="highlight">Bill Ackman</span>
-        is nearing a $40 billion deal to take <span class="highlight"><span class="highlight">Universal Music</span></span> public,
+        with <span class="highlight">Universal Music</span>, source says - Billionaire investor <span class="highlight">Bill Ackman</span>
+        is nearing a $40 billion deal to take <span class="highlight">Universal Music</span> public,
         the largest SPAC deal ever, a source said.
         """
     assert test_out == true_out
 
 
+def test_render_text_overlapping():
+    sample_string = "Nigeria Suspends Twitter - Twitter deleted Buhari's post"
+
+    test_out = render_text(sample_string,
+                           ['Twitter (organization)', 'Suspends Twitter (organization)',
+                            "Buhari's", 'Twitter'])
+
+    true_out = ('Nigeria <span class="highlight">Suspends Twitter</span> - '
+                '<span class="highlight">Twitter</span> deleted '
+                '<span class="highlight">Buhari\'s</span> post')
+    assert test_out == true_out
+
+
 def test_render_news_col():
 
     args = {'raw_column': 'news',
@@ -92,3 +111,213 @@ def test_render_news_col():
     df_true['news_id'] = pd.to_numeric(df_true['news_id'])
 
     pd.testing.assert_frame_equal(df_test, df_true)
+
+
+def test_ingest_news_bulk(tmp_path):
+    values = [['Jun-05-2021', 2, 'Max Kellerman', 'Max Kellerman on Logan Paul',
+               'img2.png', 'https://espn.com/2', '<span class="highlight">Max Kellerman</span>'],
+              ['Jun-05-2021', 3, 'Nigeria Suspends Twitter', 'Nigeria Suspends Twitter after a post',
+               'img3.png', 'https://npr.org/3', 'Nigeria <span class="highlight">Suspends Twitter</span>']]
+    columns = ['date', 'news_id', 'headline', 'news', 'news_image', 'news_url', 'news_dis']
+    news_df = pd.DataFrame(values, columns=columns)
+
+    rows = {}
+    for bulk in [False, True]:
+        engine_string = 'sqlite:///%s/%s.db' % (tmp_path, bulk)
+        create_db(engine_string)
+        ingest_news(news_df, engine_string, bulk=bulk, chunk_size=1)
+
+        manager = WikiNewsManager(engine_string=engine_string)
+        rows[bulk] = [(n.date, n.news_id, n.headline, n.news, n.news_image, n.news_url, n.news_dis)
+                      for n in manager.session.query(News).order_by(News.news_id)]
+        manager.close()
+
+    assert len(rows[True]) == 2
+    assert rows[True] == rows[False]
+
+
+def test_latest_news(tmp_path):
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+    create_db(engine_string)
+
+    news_df = pd.DataFrame([[date, news_id, 'headline', 'news', 'img', 'url', 'news_dis']
+                            for date in ['Jun-07-2021', 'Jun-08-2021']
+                            for news_id in [2, 0, 1]],
+                           columns=['date', 'news_id', 'headline', 'news',
+                                    'news_image', 'news_url', 'news_dis'])
+    wiki_df = pd.DataFrame([['Jun-08-2021', 0, 'Sony', 'wiki', 'url', ''],
+                            ['Jun-08-2021', 2, 'Twitter', 'wiki', 'url', ''],
+                            ['Jun-08-2021', 0, 'Walkman', 'wiki', 'url', ''],
+                            ['Jun-07-2021', 0, 'Old match', 'wiki', 'url', '']],
+                           columns=['date', 'news_id', 'title', 'wiki', 'wiki_url', 'wiki_image'])
+    ingest_news(news_df, engine_string, bulk=True)
+    ingest_wiki(wiki_df, engine_string, bulk=True)
+
+    manager = WikiNewsManager(engine_string=engine_string)
+    date, news_entities = latest_news(manager.session, n_news=2)
+
+    assert date.strftime('%b-%d-%Y') == 'Jun-08-2021'
+    assert [(n.news_id, [w.title for w in wiki]) for n, wiki in news_entities] == \
+        [(0, ['Sony', 'Walkman']), (1, [])]
+    manager.close()
+
+
+def test_stamp_version(tmp_path):
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+    create_db(engine_string)
+    manager = WikiNewsManager(engine_string=engine_string)
+
+    assert current_version(manager.session) is None
+    stamp_version(engine_string)
+    first = current_version(manager.session).version
+    stamp_version(engine_string)
+
+    assert current_version(manager.session).version != first
+    manager.close()
+
+
+def test_apply_retention(tmp_path):
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+    create_db(engine_string)
+
+    dates = ['Jun-%02i-2021' % day for day in range(1, 9)]
+    news_df = pd.DataFrame([[date, 0, 'headline', 'news', 'img', 'url', 'news_dis']
+                            for date in dates],
+                           columns=['date', 'news_id', 'headline', 'news',
+                                    'news_image', 'news_url', 'news_dis'])
+    wiki_df = pd.DataFrame([[date, 0, 'Sony', 'wiki', 'url', 'img'] for date in dates],
+                           columns=['date', 'news_id', 'title', 'wiki', 'wiki_url', 'wiki_image'])
+    ingest_news(news_df, engine_string, bulk=True)
+    ingest_wiki(wiki_df, engine_string, bulk=True)
+    for date in dates:
+        mark_processed(pd.DataFrame({'news_url': ['url %s' % date], 'news': ['news']}),
+                       date, engine_string)
+
+    # re-ingesting a day only replaces that day
+    delete_dates(engine_string, ['Jun-08-2021'])
+    ingest_news(news_df.tail(1), engine_string, bulk=True)
+    ingest_wiki(wiki_df.tail(1), engine_string, bulk=True)
+
+    apply_retention(engine_string, keep_days=5, compact_days=2)
+
+    manager = WikiNewsManager(engine_string=engine_string)
+    assert [n.date.day for n in manager.session.query(News).order_by(News.date)] == \
+        [4, 5, 6, 7, 8]
+    assert [(w.date.day, w.wiki, w.wiki_image)
+            for w in manager.session.query(Wiki).order_by(Wiki.date)] == \
+        [(4, '', None), (5, '', None), (6, '', None), (7, 'wiki', 'img'), (8, 'wiki', 'img')]
+    # compacted days are no longer reused, so their articles are processed again
+    assert sorted(p.date.day for p in manager.session.query(ProcessedNews)) == [7, 8]
+    manager.close()
+
+
+def test_reuse_matches(tmp_path):
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+    create_db(engine_string)
+
+    news_df = pd.DataFrame([['Jun-07-2021', 0, 'old', 'news', 'img', 'url a', 'news_dis'],
+                            ['Jun-08-2021', 3, 'new', 'news', 'img', 'url a', 'news_dis'],
+                            ['Jun-08-2021', 4, 'other', 'news', 'img', 'url b', 'news_dis']],
+                           columns=['date', 'news_id', 'headline', 'news',
+                                    'news_image', 'news_url', 'news_dis'])
+    wiki_df = pd.DataFrame([['Jun-07-2021', 0, 'Sony', 'wiki', 'url', 'img'],
+                            ['Jun-08-2021', 3, 'Walkman', 'wiki', 'url', 'img'],
+                            ['Jun-08-2021', 3, 'LDAC', 'wiki', 'url', 'img'],
+                            ['Jun-08-2021', 4, 'Apple', 'wiki', 'url', 'img']],
+                           columns=['date', 'news_id', 'title', 'wiki', 'wiki_url', 'wiki_image'])
+    ingest_news(news_df, engine_string, bulk=True)
+    ingest_wiki(wiki_df, engine_string, bulk=True)
+
+    # the most recent stored day of each url is reused, under this run's ids
+    seen = pd.DataFrame({'news_url': ['url a'], 'news_id': [9]})
+    test_wiki, test_news = reuse_matches(seen, 'Jun-09-2021', engine_string)
+    assert test_news[['news_id', 'headline']].values.tolist() == [[9, 'new']]
+    assert test_wiki[['date', 'news_id', 'title']].values.tolist() == \
+        [['Jun-09-2021', 9, 'Walkman'], ['Jun-09-2021', 9, 'LDAC']]
+
+    # marking again updates the stored text hash instead of adding a row
+    news_table = pd.DataFrame({'news_url': ['url a', 'url b'], 'news': ['news', 'news']})
+    mark_processed(news_table, 'Jun-08-2021', engine_string)
+    news_table.loc[0, 'news'] = 'changed'
+    mark_processed(news_table, 'Jun-09-2021', engine_string)
+    new, seen = split_processed(news_table, engine_string)
+    assert list(seen['news_url']) == ['url a', 'url b']
+    assert new.empty
+
+    manager = WikiNewsManager(engine_string=engine_string)
+    assert sorted(p.date.day for p in manager.session.query(ProcessedNews)) == [9, 9]
+    manager.close()
+
+
+def test_ingest_rolls_back(tmp_path, monkeypatch):
+    with open('config/yaml/db.yaml', 'r') as conf_file:
+        conf = yaml.load(conf_file, Loader=yaml.FullLoader)
+    with open('config/yaml/algorithm.yaml', 'r') as conf_file:
+        algorithm_conf = yaml.load(conf_file, Loader=yaml.FullLoader)
+
+    news_df = pd.read_csv('data/sample/06-08-21-news-entries.csv')
+    wiki_df = pd.read_csv('data/sample/06-08-21-wiki-entries.csv')
+    joined_df = filter_data(predict_data(join_data(news_df, wiki_df), algorithm_conf))
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+    create_db(engine_string)
+
+    ingest(joined_df, conf, engine_string)
+    manager = WikiNewsManager(engine_string=engine_string)
+    stored = (manager.session.query(News).count(), manager.session.query(Wiki).count())
+    version = current_version(manager.session).version
+    manager.close()
+
+    # a failure after the day's rows were deleted and re-staged keeps the old rows
+    def fail(session):
+        raise RuntimeError('stamp failed')
+    monkeypatch.setattr(db, 'new_version', fail)
+    with pytest.raises(RuntimeError):
+        ingest(joined_df, conf, engine_string)
+
+    manager = WikiNewsManager(engine_string=engine_string)
+    assert (manager.session.query(News).count(), manager.session.query(Wiki).count()) == stored
+    assert current_version(manager.session).version == version
+    manager.close()
+
+    # the incremental upsert and its processed marks roll back together
+    with pytest.raises(RuntimeError):
+        ingest_incremental(joined_df, news_df, conf, engine_string)
+
+    manager = WikiNewsManager(engine_string=engine_string)
+    assert (manager.session.query(News).count(), manager.session.query(Wiki).count()) == stored
+    assert manager.session.query(ProcessedNews).count() == 0
+    assert current_version(manager.session).version == version
+    manager.close()
+
+
+def test_news_rows(tmp_path):
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+    create_db(engine_string)
+
+    news_df = pd.DataFrame([[date, news_id, 'headline', 'news', 'img', 'url', 'news_dis']
+                            for date in ['Jun-07-2021', 'Jun-08-2021']
+                            for news_id in [2, 0, 1]],
+                           columns=['date', 'news_id', 'headline', 'news',
+                                    'news_image', 'news_url', 'news_dis'])
+    wiki_df = pd.DataFrame([['Jun-08-2021', 0, title, 'wiki', 'url', '']
+                            for title in ['Sony', 'Walkman', 'LDAC']],
+                           columns=['date', 'news_id', 'title', 'wiki', 'wiki_url', 'wiki_image'])
+    ingest_news(news_df, engine_string, bulk=True)
+    ingest_wiki(wiki_df, engine_string, bulk=True)
+
+    manager = WikiNewsManager(engine_string=engine_string)
+    pages = []
+    after = None
+    while True:
+        rows, after = news_rows(manager.session, ['headline'], after, limit=4)
+        pages.append([(row.date.day, row.news_id) for row in rows])
+        if after is None:
+            break
+    assert pages == [[(8, 0), (8, 1), (8, 2), (7, 0)], [(7, 1), (7, 2)]]
+    assert rows[0]._fields == ('date', 'news_id', 'headline')
+
+    rows, after = wiki_rows(manager.session, datetime(2021, 6, 8), 0, ['title'], limit=2)
+    assert [row.title for row in rows] == ['Sony', 'Walkman']
+    rows, after = wiki_rows(manager.session, datetime(2021, 6, 8), 0, ['title'], after, limit=2)
+    assert [row.title for row in rows] == ['LDAC'] and after is None
+    manager.close()
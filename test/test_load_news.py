@@ -1,9 +1,14 @@
-import sys
-import os
+import json
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
 import pandas as pd
+import pytest
+import yaml
 
-sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
-from load_news import create_id_col, remove_stopwords
+from src.client import HttpClient
+from src.load_news import (create_id_col, load_news, news_top, news_queries,
+                           remove_stopwords, source_pattern)
 
 
 def test_create_id_col():
@@ -45,3 +50,123 @@ def test_create_id_col():
     
     pd.testing.assert_frame_equal(test_out, true_out)
 
+
+def test_remove_stopwords():
+    pattern = source_pattern(['Fox', 'Fox News', 'Reuters', 'Fox', '', None])
+
+    assert pattern.pattern == 'Fox\\ News|Reuters|Fox'
+    assert remove_stopwords('Senate passes bill - Fox News via Reuters', pattern) == \
+        'Senate passes bill -  via '
+    assert remove_stopwords('no sources', source_pattern([])) == 'no sources'
+
+
+def test_load_news(monkeypatch):
+    class Client:
+        def get_json(self, url, params=None, endpoint=None, limiter=None):
+            return {'status': 'ok',
+                    'articles': [{'title': 'Fed holds rates - CNBC',
+                                  'description': 'Reuters reports the Fed held rates.',
+                                  'source': {'name': 'CNBC'},
+                                  'urlToImage': 'img0', 'url': 'url0'},
+                                 {'title': 'Storm hits coast - ABC News',
+                                  'description': None,
+                                  'source': {'name': 'ABC News'},
+                                  'urlToImage': None, 'url': 'url1'}]}
+
+    monkeypatch.setenv('NEWS_API_KEY', 'test')
+    source_words = ['Reuters']
+    test_out = load_news({'url': 'http://news', 'params': {}}, source_words, Client())
+
+    true_out = pd.DataFrame({'news_id': [0, 1],
+                             'headline': ['Fed holds rates - CNBC', 'Storm hits coast - ABC News'],
+                             'news': ['Fed holds rates -   reports the Fed held rates.',
+                                      'Storm hits coast - '],
+                             'news_image': ['img0', None],
+                             'news_url': ['url0', 'url1']})
+    pd.testing.assert_frame_equal(test_out, true_out)
+    assert source_words == ['Reuters']
+
+
+def article(n, source='Reuters'):
+    return {'title': 'Headline %i' % n, 'description': 'Story %i' % n,
+            'source': {'name': source}, 'urlToImage': None,
+            'url': 'https://news.example/%i' % n}
+
+
+# recorded top-headlines responses with pagesize 2, keyed by (country, category, page)
+NEWS_PAGES = {('us', 'business', '1'): {'status': 'ok', 'totalResults': 5,
+                                        'articles': [article(0), article(1)]},
+              ('us', 'business', '2'): {'status': 'ok', 'totalResults': 5,
+                                        'articles': [article(2), article(3)]},
+              ('us', 'business', '3'): {'status': 'ok', 'totalResults': 5,
+                                        'articles': [article(4)]},
+              ('us', 'health', '1'): {'status': 'ok', 'totalResults': 2,
+                                      'articles': [article(5), article(1)]},
+              ('gb', 'business', '1'): {'status': 'ok', 'totalResults': 3,
+                                        'articles': [article(6, 'BBC News'), article(0)]},
+              ('gb', 'business', '2'): {'status': 'error', 'code': 'maximumResultsReached',
+                                        'message': 'You have requested too many results.'},
+              ('gb', 'health', '1'): {'status': 'ok', 'totalResults': 0, 'articles': []}}
+
+
+class StubNewsHandler(BaseHTTPRequestHandler):
+    """Answers top-headlines queries from NEWS_PAGES"""
+
+    def do_GET(self):
+        params = {key: values[0] for key, values
+                  in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(params)
+
+        body = NEWS_PAGES.get((params.get('country'), params.get('category'), params.get('page')),
+                              {'status': 'ok', 'totalResults': 0, 'articles': []})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+news_server = pytest.mark.parametrize('stub_server', [StubNewsHandler], indirect=True)
+
+
+@news_server
+def test_news_top(stub_server, monkeypatch):
+    monkeypatch.setenv('NEWS_API_KEY', 'test')
+    conf = {'url': stub_server.url + '/v2/top-headlines',
+            'params': {'pagesize': 2},
+            'countries': ['us', 'gb'],
+            'categories': ['business', 'health'],
+            'max_pages': 5,
+            'max_workers': 4,
+            'rate_limit': 1000}
+
+    test_out = news_top(conf, HttpClient(retries=0))
+
+    # us/business is paged to totalResults; gb/business stops at the API error
+    requested = sorted((r['country'], r['category'], r['page']) for r in stub_server.requests)
+    assert requested == sorted(NEWS_PAGES)
+    assert all(r['apiKey'] == 'test' for r in stub_server.requests)
+
+    # deduplicated by url, in query and page order
+    assert [a['url'] for a in test_out['articles']] == \
+        ['https://news.example/%i' % n for n in [0, 1, 2, 3, 4, 5, 6]]
+    assert test_out['totalResults'] == 7
+
+    conf['max_pages'] = 1
+    stub_server.requests.clear()
+    news_top(conf, HttpClient(retries=0))
+    assert len(stub_server.requests) == 4
+
+
+def test_news_queries():
+    with open('config/yaml/load_news.yaml', 'r') as conf_file:
+        conf = yaml.load(conf_file, Loader=yaml.FullLoader)
+
+    test_out = news_queries(conf)
+
+    # the uncategorized query keeps every category in the defaults
+    assert test_out[0] == {'pagesize': 100, 'country': 'us'}
+    assert [params.get('category') for params in test_out[1:]] == \
+        ['general', 'business', 'technology', 'science', 'health']
@@ -1,10 +1,17 @@
-import sys
-import os
+import json
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
 import pandas as pd
+import pytest
+import spacy
 from numpy import array
 
-sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
-from load_wiki import news2entities, wiki_special_truncate
+from src.client import HttpClient, RateLimiter
+from src.load_wiki import (news2entities, news2entities_batch, news2entities_parallel,
+                           shard_texts, entities2wiki, fetch_wiki, wiki_contents,
+                           wiki_special_truncate, lookup_failed)
+from src.cache import ResponseCache
 
 
 def test_news2entities():
@@ -22,6 +29,64 @@ def test_news2entities():
     assert test_out == true_out
 
 
+def test_news2entities_batch(tmp_path):
+    nlp = spacy.blank('en')
+    ruler = nlp.add_pipe('entity_ruler')
+    ruler.add_patterns([{'label': 'ORG', 'pattern': 'Twitter'},
+                        {'label': 'PERSON', 'pattern': 'Muhammadu Buhari'},
+                        {'label': 'GPE', 'pattern': 'Nigeria'}])
+    nlp.to_disk(tmp_path)
+
+    news = ['Nigeria Suspends Twitter - Twitter deleted a post by Muhammadu Buhari',
+            'No entities here',
+            'Muhammadu Buhari']
+    test_out = news2entities_batch(news, ['PERSON', 'ORG'], str(tmp_path),
+                                   spacy_disable=['parser'], batch_size=2)
+
+    true_out = [['Twitter (organization)', 'Twitter (organization)', 'Muhammadu Buhari'],
+                [],
+                ['Muhammadu Buhari']]
+    assert test_out == true_out
+    assert test_out == [news2entities(text, ['PERSON', 'ORG'], str(tmp_path))
+                        for text in news]
+
+
+def test_news2entities_parallel(tmp_path):
+    nlp = spacy.blank('en')
+    ruler = nlp.add_pipe('entity_ruler')
+    ruler.add_patterns([{'label': 'ORG', 'pattern': 'Twitter'},
+                        {'label': 'PERSON', 'pattern': 'Muhammadu Buhari'}])
+    nlp.to_disk(tmp_path)
+
+    news = ['Nigeria Suspends Twitter', 'No entities here', 'Muhammadu Buhari'] * 20
+    test_out = news2entities_parallel(news, ['PERSON', 'ORG'], str(tmp_path),
+                                      batch_size=4, n_process=2, shard_chars=60)
+
+    true_out = news2entities_batch(news, ['PERSON', 'ORG'], str(tmp_path), batch_size=4)
+    assert test_out == true_out
+
+
+def test_shard_texts():
+    test_out = shard_texts(['a' * 5, 'b' * 5, 'c' * 20, 'd' * 5], 10)
+    true_out = [(0, 2), (2, 3), (3, 4)]
+    assert test_out == true_out
+
+
+def test_lookup_failed():
+    searches = {'Sony': {'query': {'search': [{'title': 'Sony'}]}},
+                'Nobody': {'query': {'search': []}},
+                'Outage': None,
+                'Error': {'error': {'code': 'ratelimited'}}}
+    pages = {'Sony': None}
+
+    # a missing page or an empty search finished; a failed request did not
+    assert not lookup_failed(['Sony', 'Nobody'], searches, pages)
+    assert not lookup_failed([], searches, pages)
+    assert lookup_failed(['Sony', 'Outage'], searches, pages)
+    assert lookup_failed(['Error'], searches, pages)
+    assert lookup_failed(['Sony'], searches, {})
+
+
 def test_wiki_special_truncate():
     sample_string = """
     The fight ended in a majority draw. In the subsequent rematch, which was a professional bout, Paul lost to KSI by split decision.\nPaul has been involved in several controversies, most notably in relation to a trip to Japan in December 2017, during which he visited the Aokigahara "suicide forest", filmed a suicide victim and uploaded the footage to his YouTube channel.\n\n\n== Early life and education ==\nPaul grew up in Ohio with younger brother Jake, who is also a YouTuber and internet personality.',
@@ -31,4 +96,167 @@ def test_wiki_special_truncate():
     true_out = """
     The fight ended in a majority draw. In the subsequent rematch, which was a professional bout, Paul lost to KSI by split decision.\nPaul has been involved in several controversies, most notably in relation to a trip to Japan in December 2017, during which he visited the Aokigahara "suicide forest", filmed a suicide victim and uploaded the footage to his YouTube channel.\n\n\n"""
 
-    assert true_out == test_out
\ No newline at end of file
+    assert true_out == test_out
+
+WIKI_SEARCH = {'Twitter (organization)': ['Twitter', 'Tweet'],
+               'Muhammadu Buhari': ['Muhammadu Buhari'],
+               'Buhari': ['Muhammadu Buhari'],
+               'Mercury': ['Mercury (disambiguation)']}
+WIKI_PAGES = {'Twitter': {'title': 'Twitter',
+                          'extract': 'Twitter is a social networking service.\n== History ==',
+                          'fullurl': 'https://en.wikipedia.org/wiki/Twitter',
+                          'thumbnail': {'source': 'twitter.png'}},
+              'Tweet (social media)': {'title': 'Tweet (social media)',
+                                       'extract': 'A tweet is a post on Twitter.',
+                                       'fullurl': 'https://en.wikipedia.org/wiki/Tweet'},
+              'Muhammadu Buhari': {'title': 'Muhammadu Buhari',
+                                   'extract': 'Muhammadu Buhari is a Nigerian politician.',
+                                   'fullurl': 'https://en.wikipedia.org/wiki/Muhammadu_Buhari'},
+              'Mercury (disambiguation)': {'title': 'Mercury (disambiguation)',
+                                           'extract': 'Mercury may refer to:',
+                                           'fullurl': 'https://en.wikipedia.org/wiki/Mercury',
+                                           'categories': [{'title': 'disambiguation'}]}}
+WIKI_REDIRECTS = {'Tweet': 'Tweet (social media)'}
+
+
+class StubWikiHandler(BaseHTTPRequestHandler):
+    """Answers MediaWiki search and page content queries from WIKI_SEARCH and WIKI_PAGES
+
+    Categories are held back until a second, continued request. Searches
+    listed in server.failures are answered with that status and a MediaWiki
+    error body, as is a search for 'Error'.
+    """
+
+    def do_GET(self):
+        params = {key: values[0] for key, values
+                  in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(params)
+
+        status = self.server.failures.get(params.get('srsearch'), 200)
+        if status != 200 or params.get('srsearch') == 'Error':
+            body = {'error': {'code': 'internal_api_error', 'info': 'stub error'}}
+        elif 'srsearch' in params:
+            search = [{'title': title}
+                      for title in WIKI_SEARCH.get(params['srsearch'], [])]
+            body = {'query': {'search': search}}
+        else:
+            query = {'normalized': [], 'redirects': [], 'pages': {}}
+            for i, title in enumerate(params['titles'].split('|')):
+                if title[0].islower():
+                    query['normalized'].append({'from': title, 'to': title.capitalize()})
+                    title = title.capitalize()
+                if title in WIKI_REDIRECTS:
+                    query['redirects'].append({'from': title, 'to': WIKI_REDIRECTS[title]})
+                    title = WIKI_REDIRECTS[title]
+                if title not in WIKI_PAGES:
+                    query['pages'][str(-1 - i)] = {'title': title, 'missing': ''}
+                elif 'clcontinue' in params:
+                    query['pages'][str(i)] = {'title': title,
+                                              'categories': WIKI_PAGES[title].get('categories', [])}
+                else:
+                    query['pages'][str(i)] = {key: value for key, value in WIKI_PAGES[title].items()
+                                              if key != 'categories'}
+            body = {'query': query}
+            if 'clcontinue' not in params:
+                body['continue'] = {'clcontinue': '1|disambiguation', 'continue': '||'}
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+wiki_server = pytest.mark.parametrize('stub_server', [StubWikiHandler], indirect=True)
+
+
+@wiki_server
+def test_entities2wiki(stub_server):
+    url = stub_server.url + '/w/api.php'
+    query_conf = {'url': url, 'params': {'action': 'query', 'list': 'search'}}
+    content_conf = {'url': url, 'params': {'action': 'query'}}
+
+    entities = ['Twitter (organization)', 'Muhammadu Buhari', 'Buhari', 'Mercury']
+    test_out = entities2wiki(entities, query_conf, content_conf,
+                             stop_categories=['disambiguation'],
+                             stop_phrases=['may refer to'],
+                             n_results=2, max_workers=4, rate_limit=1000)
+
+    true_out = pd.DataFrame({'entity': ['Twitter (organization)', 'Twitter (organization)',
+                                        'Muhammadu Buhari'],
+                             'title': ['Twitter', 'Tweet (social media)', 'Muhammadu Buhari'],
+                             'wiki': ['Twitter is a social networking service.\n',
+                                      'A tweet is a post on Twitter.',
+                                      'Muhammadu Buhari is a Nigerian politician.'],
+                             'wiki_url': ['https://en.wikipedia.org/wiki/Twitter',
+                                          'https://en.wikipedia.org/wiki/Tweet',
+                                          'https://en.wikipedia.org/wiki/Muhammadu_Buhari'],
+                             'wiki_image': ['twitter.png', '', '']})
+    pd.testing.assert_frame_equal(test_out, true_out)
+
+    # each entity is searched once; all titles share one continued content request
+    assert len(stub_server.requests) == 4 + 2
+    assert 'titles' not in query_conf['params']
+
+
+@wiki_server
+def test_fetch_wiki_cache(stub_server, tmp_path):
+    url = stub_server.url + '/w/api.php'
+    query_conf = {'url': url, 'params': {'action': 'query', 'list': 'search'}}
+    content_conf = {'url': url, 'params': {'action': 'query'}}
+    cache = ResponseCache(str(tmp_path / 'wiki.db'))
+
+    entities = ['Twitter (organization)', 'Muhammadu Buhari']
+    first = fetch_wiki(entities, query_conf, content_conf, n_results=2, cache=cache)
+    n_requests = len(stub_server.requests)
+    second = fetch_wiki(entities, query_conf, content_conf, n_results=2, cache=cache)
+
+    assert second == first
+    assert len(stub_server.requests) == n_requests
+    assert cache.stats()['hits'] == 2 + 3
+    cache.close()
+
+
+@wiki_server
+def test_fetch_wiki_cache_skips_errors(stub_server, tmp_path):
+    url = stub_server.url + '/w/api.php'
+    query_conf = {'url': url, 'params': {'action': 'query', 'list': 'search'}}
+    content_conf = {'url': url, 'params': {'action': 'query'}}
+    cache = ResponseCache(str(tmp_path / 'wiki.db'))
+    stub_server.failures['Missing'] = 404
+
+    fetch_wiki(['Error', 'Missing'], query_conf, content_conf, cache=cache)
+    n_requests = len(stub_server.requests)
+
+    # neither answer was kept, so both are asked again
+    fetch_wiki(['Error', 'Missing'], query_conf, content_conf, cache=cache)
+    assert len(stub_server.requests) == 2 * n_requests
+    assert cache.stats()['hits'] == 0
+    cache.close()
+
+
+@wiki_server
+def test_wiki_contents(stub_server):
+    url = stub_server.url + '/w/api.php'
+    content_conf = {'url': url, 'params': {'action': 'query'}}
+
+    test_out = wiki_contents(content_conf, ['twitter', 'Tweet', 'Mercury (disambiguation)', 'Nothing'],
+                             HttpClient())
+
+    assert test_out['twitter']['fullurl'] == 'https://en.wikipedia.org/wiki/Twitter'
+    assert test_out['Tweet']['title'] == 'Tweet (social media)'
+    assert test_out['Mercury (disambiguation)']['categories'] == [{'title': 'disambiguation'}]
+    assert test_out['Nothing'] is None
+    assert stub_server.requests[0]['titles'] == 'twitter|Tweet|Mercury (disambiguation)|Nothing'
+
+    # continued requests are rate limited like the first
+    class Limiter(RateLimiter):
+        waits = []
+
+        def wait(self, url):
+            self.waits.append(url)
+
+    wiki_contents(content_conf, ['Mercury (disambiguation)'], HttpClient(), Limiter())
+    assert Limiter.waits == [url, url]
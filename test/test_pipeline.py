@@ -0,0 +1,163 @@
+import os
+import yaml
+import pandas as pd
+
+from src.pipeline import run_pipeline, stage_predict_stream, StageReport
+from src.algorithm import join_data, predict_data, filter_data
+from src import pipeline
+from src.db import WikiNewsManager, News, Wiki, ProcessedNews
+from src.tables import read_table
+
+
+def test_stage_report():
+    report = StageReport(trace_memory=True)
+    with report.stage('allocate'):
+        data = [0] * 100000
+
+    test_out = report.summary()
+    assert list(test_out.columns) == ['stage', 'seconds', 'rss_growth_mb',
+                                      'max_rss_so_far_mb', 'peak_heap_mb']
+    assert test_out.loc[0, 'stage'] == 'allocate'
+    assert test_out.loc[0, 'peak_heap_mb'] > 0.5
+
+    # a stage that allocates little does not inherit the earlier peak
+    with report.stage('idle'):
+        pass
+    test_out = report.summary()
+    assert test_out.loc[1, 'rss_growth_mb'] < test_out.loc[1, 'max_rss_so_far_mb']
+    assert test_out.loc[1, 'max_rss_so_far_mb'] >= test_out.loc[0, 'max_rss_so_far_mb']
+
+
+def test_run_pipeline(tmp_path):
+    confs = {}
+    for step in ['algorithm', 'db']:
+        with open('config/yaml/%s.yaml' % step, 'r') as conf_file:
+            confs[step] = yaml.load(conf_file, Loader=yaml.FullLoader)
+
+    news_df = pd.read_csv('data/sample/06-08-21-news-entries.csv')
+    wiki_df = pd.read_csv('data/sample/06-08-21-wiki-entries.csv')
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+
+    test_out = run_pipeline(confs, engine_string, news_df=news_df, wiki_df=wiki_df,
+                            checkpoint_dir=str(tmp_path / 'checkpoints'))
+
+    true_out = filter_data(predict_data(join_data(news_df, wiki_df), confs['algorithm']))
+    pd.testing.assert_frame_equal(test_out, true_out)
+    assert len(os.listdir(tmp_path / 'checkpoints')) == 5
+
+    manager = WikiNewsManager(engine_string=engine_string)
+    assert manager.session.query(News).count() == true_out['news_id'].nunique()
+    assert manager.session.query(Wiki).count() == len(true_out)
+    manager.close()
+
+
+def test_run_pipeline_incremental(tmp_path):
+    confs = {}
+    for step in ['algorithm', 'db']:
+        with open('config/yaml/%s.yaml' % step, 'r') as conf_file:
+            confs[step] = yaml.load(conf_file, Loader=yaml.FullLoader)
+
+    news_df = pd.read_csv('data/sample/06-08-21-news-entries.csv')
+    wiki_df = pd.read_csv('data/sample/06-08-21-wiki-entries.csv')
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+
+    def stored():
+        manager = WikiNewsManager(engine_string=engine_string)
+        news = sorted((n.news_id, n.news_url, n.news_dis)
+                      for n in manager.session.query(News))
+        wiki = sorted((w.news_id, w.title) for w in manager.session.query(Wiki))
+        manager.close()
+        return news, wiki
+
+    first_out = run_pipeline(confs, engine_string, news_df=news_df, wiki_df=wiki_df,
+                             incremental=True)
+    first_stored = stored()
+    assert len(first_stored[1]) == len(first_out)
+
+    # nothing new: no article is scored again and the tables are unchanged
+    second_out = run_pipeline(confs, engine_string, news_df=news_df, wiki_df=wiki_df,
+                              incremental=True)
+    assert second_out.empty
+    assert stored() == first_stored
+
+    # one changed article is the only one processed again; punctuation keeps its score
+    changed_id = first_out['news_id'].iloc[0]
+    changed = news_df['news_id'] == changed_id
+    news_df.loc[changed, 'news'] = news_df.loc[changed, 'news'] + '!'
+    third_out = run_pipeline(confs, engine_string, news_df=news_df, wiki_df=wiki_df,
+                             incremental=True)
+    assert set(third_out['news_id']) == {changed_id}
+    assert stored()[1] == first_stored[1]
+
+
+def test_run_pipeline_incremental_failed_lookups(tmp_path, monkeypatch):
+    confs = {'load_wiki': {}}
+    for step in ['algorithm', 'db']:
+        with open('config/yaml/%s.yaml' % step, 'r') as conf_file:
+            confs[step] = yaml.load(conf_file, Loader=yaml.FullLoader)
+
+    news_df = pd.read_csv('data/sample/06-08-21-news-entries.csv')
+    wiki_df = pd.read_csv('data/sample/06-08-21-wiki-entries.csv')
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+
+    def outage(news_df, conf, cache=None, client=None, return_failed=False):
+        return pd.DataFrame(columns=['news_id']), list(news_df['news_id'])
+
+    # an outage is not recorded as "no matches"
+    monkeypatch.setattr(pipeline, 'stage_load_wiki', outage)
+    assert run_pipeline(confs, engine_string, news_df=news_df, incremental=True).empty
+    manager = WikiNewsManager(engine_string=engine_string)
+    assert manager.session.query(ProcessedNews).count() == 0
+    manager.close()
+
+    # so the next run looks every article up again
+    test_out = run_pipeline(confs, engine_string, news_df=news_df, wiki_df=wiki_df,
+                            incremental=True)
+    assert set(test_out['news_id']) == set(filter_data(predict_data(
+        join_data(news_df, wiki_df), confs['algorithm']))['news_id'])
+
+
+def test_stage_predict_stream(tmp_path):
+    with open('config/yaml/algorithm.yaml', 'r') as conf_file:
+        conf = yaml.load(conf_file, Loader=yaml.FullLoader)
+
+    news_df = pd.read_csv('data/sample/06-08-21-news-entries.csv')
+    wiki_df = pd.read_csv('data/sample/06-08-21-wiki-entries.csv')
+    joined = join_data(news_df, wiki_df)
+    # repeat the matches so duplicates fall in later chunks
+    joined = pd.concat([joined, joined], ignore_index=True)
+    joined.to_csv(tmp_path / 'joined.csv', index=False)
+
+    true_out = filter_data(predict_data(pd.read_csv(tmp_path / 'joined.csv'), conf)). \
+        reset_index(drop=True)
+
+    n_rows = stage_predict_stream(str(tmp_path / 'joined.csv'), str(tmp_path / 'filtered.csv'),
+                                  conf, chunksize=25)
+    test_out = pd.read_csv(tmp_path / 'filtered.csv')
+    assert n_rows == len(true_out)
+    pd.testing.assert_frame_equal(test_out[true_out.columns], true_out, check_dtype=False)
+
+    # predict, then filter, through parquet
+    stage_predict_stream(str(tmp_path / 'joined.csv'), str(tmp_path / 'predict.parquet'),
+                         conf, chunksize=25, filter=False)
+    assert len(read_table(str(tmp_path / 'predict.parquet'))) == len(joined)
+    stage_predict_stream(str(tmp_path / 'predict.parquet'), str(tmp_path / 'filtered.feather'),
+                         conf, chunksize=40, predict=False)
+    pd.testing.assert_frame_equal(read_table(str(tmp_path / 'filtered.feather'))[true_out.columns],
+                                  true_out, check_dtype=False)
+
+
+def test_stage_predict_stream_dtypes(tmp_path):
+    # the first chunk has only empty images and numeric-looking titles
+    predicted = pd.DataFrame({'news_id': [0, 1, 0, 2],
+                              'title': ['1984', '1984', '1984', 'Dune'],
+                              'wiki_image': [None, None, 'z', 'z'],
+                              'predict': [True, True, True, True]})
+    predicted.to_csv(tmp_path / 'predict.csv', index=False)
+
+    stage_predict_stream(str(tmp_path / 'predict.csv'), str(tmp_path / 'filtered.parquet'),
+                         None, chunksize=2, predict=False)
+
+    test_out = read_table(str(tmp_path / 'filtered.parquet'))
+    true_out = predicted.iloc[[0, 1, 3]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(test_out, true_out)
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+import sqlalchemy
+
+from src.search import SearchIndex, FTS5Index, match_terms, highlight
+from src.db import (create_db, ingest_news, ingest_wiki, update_search_index,
+                    delete_dates, apply_retention)
+
+
+def test_match_terms():
+    test_out = match_terms('Sony "earbuds" OR NEAR(x*')
+    true_out = ['sony', 'earbuds', 'or', 'near', 'x']
+    assert test_out == true_out
+
+
+def test_highlight():
+    test_out = highlight('<b>Sony</b> \x02earbuds\x03')
+    true_out = '&lt;b&gt;Sony&lt;/b&gt; <span class="highlight">earbuds</span>'
+    assert test_out == true_out
+
+
+def test_search_index_is_abstract():
+    with pytest.raises(TypeError):
+        SearchIndex()
+
+    class PartialIndex(SearchIndex):
+        def create(self, engine):
+            pass
+
+    with pytest.raises(TypeError):
+        PartialIndex()
+
+
+def test_fts5_index(tmp_path):
+    engine_string = 'sqlite:///%s/entries.db' % tmp_path
+    create_db(engine_string)
+
+    news_df = pd.DataFrame([['Jun-07-2021', 0, 'Sony earbuds reviewed', 'Sony earbuds news',
+                             'img', 'url0', 'news_dis'],
+                            ['Jun-08-2021', 0, 'Walkman returns', 'A music player',
+                             'img', 'url1', 'news_dis'],
+                            ['Jun-08-2021', 1, 'Nigeria suspends Twitter', 'Twitter news',
+                             'img', 'url2', 'news_dis']],
+                           columns=['date', 'news_id', 'headline', 'news',
+                                    'news_image', 'news_url', 'news_dis'])
+    wiki_df = pd.DataFrame([['Jun-08-2021', 0, 'Walkman', 'Walkman is a Sony brand', 'url', ''],
+                            ['Jun-08-2021', 1, 'Twitter', 'Twitter is a social network', 'url', '']],
+                           columns=['date', 'news_id', 'title', 'wiki', 'wiki_url', 'wiki_image'])
+    ingest_news(news_df, engine_string, bulk=True)
+    ingest_wiki(wiki_df, engine_string, bulk=True)
+    update_search_index(engine_string, news_df['date'])
+
+    engine = sqlalchemy.create_engine(engine_string)
+    index = FTS5Index()
+
+    # headline matches rank above matches in wiki extracts
+    results, has_next = index.search(engine, 'sony', page_size=1)
+    assert [(r['date'], r['headline']) for r in results] == \
+        [('Jun-07-2021', 'Sony earbuds reviewed')]
+    assert results[0]['snippet'].startswith('<span class="highlight">Sony</span>')
+    assert has_next
+
+    results, has_next = index.search(engine, 'sony', page=2, page_size=1)
+    assert [(r['headline'], r['titles']) for r in results] == [('Walkman returns', ['Walkman'])]
+    assert not has_next
+
+    # deleted days leave the index on the next update
+    delete_dates(engine_string, ['Jun-07-2021'])
+    update_search_index(engine_string, [])
+    results, _ = index.search(engine, 'sony earbuds')
+    assert results == []
+
+    # compacted extracts leave the index too; titles stay searchable
+    assert [r['headline'] for r in index.search(engine, 'social network')[0]] == \
+        ['Nigeria suspends Twitter']
+    ingest_news(news_df.tail(1).assign(date='Jun-09-2021'), engine_string, bulk=True)
+    apply_retention(engine_string, compact_days=1)
+    assert index.search(engine, 'social network')[0] == []
+    assert [r['headline'] for r in index.search(engine, 'walkman')[0]] == ['Walkman returns']
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from src.tables import read_table, write_table, table_format, read_table_chunks, TableWriter
+
+
+def test_table_format():
+    assert table_format('data/daily/06-08-21-joined.parquet') == 'parquet'
+    assert table_format('s3://bucket/06-08-21-joined.FEATHER') == 'feather'
+    assert table_format('data/daily/06-08-21-joined.csv') == 'csv'
+    assert table_format('data/daily/06-08-21-joined') == 'csv'
+
+
+@pytest.mark.parametrize('ext', ['csv', 'parquet', 'feather'])
+def test_read_write_table(tmp_path, ext):
+    data = pd.DataFrame({'news_id': [3, 5, 8],
+                         'wiki': ['Sony Group Corporation', 'GMC', 'Twitter'],
+                         'sim': [0.31, 0.02, 0.5],
+                         'predict': [True, False, True]},
+                        index=[3, 5, 8])
+    path = str(tmp_path / ('predict.' + ext))
+
+    write_table(data, path)
+    test_out = read_table(path, columns=['news_id', 'predict'])
+
+    true_out = data[['news_id', 'predict']].reset_index(drop=True)
+    pd.testing.assert_frame_equal(test_out, true_out)
+
+
+@pytest.mark.parametrize('ext', ['csv', 'parquet', 'feather'])
+def test_table_chunks(tmp_path, ext):
+    data = pd.DataFrame({'news_id': range(7),
+                         'title': list('abcdefg'),
+                         'wiki_image': [None, None, None, 'img', 'img', None, 'img']})
+    path = str(tmp_path / ('filtered.' + ext))
+
+    with TableWriter(path) as writer:
+        for start in range(0, 7, 3):
+            writer.write(data.iloc[start:start + 3])
+        writer.write(data.iloc[:0])
+
+    chunks = list(read_table_chunks(path, chunksize=3))
+    assert writer.rows == 7
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    pd.testing.assert_frame_equal(pd.concat(chunks), data)
+
+    # as written by write_table(); feather is LZ4-compressed, read batch by batch
+    write_table(data, path)
+    chunks = list(read_table_chunks(path, chunksize=3, columns=['news_id', 'title']))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    pd.testing.assert_frame_equal(pd.concat(chunks), data[['news_id', 'title']])
+
+    empty_path = str(tmp_path / ('empty.' + ext))
+    with TableWriter(empty_path) as writer:
+        writer.write(data.iloc[:0])
+    assert list(read_table(empty_path).columns) == list(data.columns)